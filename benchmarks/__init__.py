@@ -0,0 +1,5 @@
+"""End-to-end benchmarks of cu2 against local stand-ins of the sites.
+
+Run with `python -m benchmarks run` from the root of the repository; see
+`python -m benchmarks run --help` for the options.
+"""
@@ -0,0 +1,167 @@
+"""Runs cu2 commands against the stand-in sites and measures them.
+
+Each command runs in a child process of its own, so that the peak memory of
+the command can be read from the resource usage of the process. The child
+process sends every request of the shared sessions to the stand-in server
+instead of the real hosts.
+"""
+from tests import standin
+import click
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+COMMANDS = ('follow', 'update', 'download')
+SIZES = (10, 1000, 10000)
+
+
+def git_revision():
+    """Returns the revision of the benchmarked tree, or None outside of a git
+    checkout.
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(__file__)
+                                       ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_command(address, cu2_directory, args):
+    """Runs a cu2 command in a child process and returns the wall time in
+    seconds and the peak resident memory in kilobytes.
+    """
+    with tempfile.NamedTemporaryFile('r', suffix='.json') as result:
+        command = [sys.executable, '-m', 'benchmarks', 'child',
+                   '--address', address, '--result', result.name,
+                   '--', '--cu2-directory', cu2_directory] + args
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL,
+                       cwd=os.path.dirname(os.path.dirname(__file__)))
+        return json.load(result)
+
+
+@click.group()
+def cli():
+    """Benchmarks cu2 against local stand-ins of the sites."""
+    pass
+
+
+@cli.command(context_settings={'ignore_unknown_options': True})
+@click.option('--address', required=True)
+@click.option('--result', required=True)
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def child(address, result, args):
+    """Runs a single cu2 command against the stand-in server."""
+    import resource
+
+    standin.reroute(address)
+    from cu2 import cu2
+    start = time.perf_counter()
+    cu2.cli.main(args=list(args), prog_name='cu2', standalone_mode=False)
+    seconds = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    max_rss = usage.ru_maxrss
+    if sys.platform == 'darwin':
+        max_rss //= 1024
+    with open(result, 'w') as f:
+        json.dump({'seconds': seconds, 'max_rss_kb': max_rss}, f)
+
+
+@cli.command()
+@click.argument('baseline', type=click.File())
+@click.argument('current', type=click.File())
+def compare(baseline, current):
+    """Compare two result files."""
+    baseline = {(x['command'], x['follows']): x
+                for x in json.load(baseline)['results']}
+    for result in json.load(current)['results']:
+        old = baseline.get((result['command'], result['follows']))
+        if not old:
+            continue
+        click.echo('{:<9} {:>6} follows  time {:+7.1%}  memory {:+7.1%}'
+                   .format(result['command'], result['follows'],
+                           result['seconds'] / old['seconds'] - 1,
+                           result['max_rss_kb'] / old['max_rss_kb'] - 1))
+
+
+@cli.command()
+@click.option('--bandwidth', type=float, default=None,
+              help='Bytes per second sent by the stand-ins per response.')
+@click.option('--chapters', type=int, default=3,
+              help='Chapters of each series.')
+@click.option('--commands', default=','.join(COMMANDS),
+              help='Comma-separated commands to measure.')
+@click.option('--error-rate', type=float, default=0,
+              help='Share of requests failing with a server error.')
+@click.option('--latency', type=float, default=0,
+              help='Seconds added to every response.')
+@click.option('--output', type=click.File('w'), default='-',
+              help='File which the JSON results are written into.')
+@click.option('--page-size', type=int, default=32 * 1024,
+              help='Size of each page in bytes.')
+@click.option('--pages', type=int, default=4,
+              help='Pages of each chapter.')
+@click.option('--sizes', default=','.join(str(x) for x in SIZES),
+              help='Comma-separated numbers of follows to measure.')
+@click.option('--throttle-rate', type=float, default=0,
+              help='Share of requests throttled with 429.')
+def run(bandwidth, chapters, commands, error_rate, latency, output,
+        page_size, pages, sizes, throttle_rate):
+    """Measure cu2 commands against the stand-in sites.
+
+    For each library size a new library is followed with `cu2 follow`, a
+    chapter is released for every series before `cu2 update` and all of the
+    new chapters are downloaded with `cu2 download`.
+    """
+    commands = [x for x in commands.split(',') if x]
+    results = []
+    for size in (int(x) for x in sizes.split(',') if x):
+        library = standin.Library(size, chapters=chapters, pages=pages,
+                                  page_size=page_size)
+        server = standin.StandInServer(library, latency=latency,
+                                       bandwidth=bandwidth,
+                                       error_rate=error_rate,
+                                       throttle_rate=throttle_rate)
+        server.start()
+        with tempfile.TemporaryDirectory() as directory:
+            cu2_directory = os.path.join(directory, 'cu2')
+            os.mkdir(cu2_directory)
+            with open(os.path.join(cu2_directory, 'config.json'), 'w') as f:
+                json.dump({'download_directory':
+                           os.path.join(directory, 'downloads'),
+                           'download_engine': 'threads'}, f)
+            scenarios = [('follow', ['follow'] + library.urls()),
+                         ('update', ['update']),
+                         ('download', ['download'])]
+            for command, args in scenarios:
+                if command == 'update':
+                    library.release()
+                if command not in commands:
+                    continue
+                click.echo('{} with {} follows'.format(command, size),
+                           err=True)
+                server.reset()
+                result = run_command(server.address, cu2_directory, args)
+                result.update({'bytes': server.bytes, 'command': command,
+                               'follows': size,
+                               'requests': server.requests})
+                result['series_per_second'] = size / result['seconds']
+                result['bytes_per_second'] = (server.bytes /
+                                              result['seconds'])
+                results.append(result)
+        server.stop()
+    json.dump({'revision': git_revision(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'options': {'bandwidth': bandwidth, 'chapters': chapters,
+                           'error_rate': error_rate, 'latency': latency,
+                           'page_size': page_size, 'pages': pages,
+                           'throttle_rate': throttle_rate},
+               'results': results}, output, indent=2)
+    output.write('\n')
@@ -0,0 +1,307 @@
+from cu2 import (archive, config, exceptions, output, pagecache, profiling,
+                 sessions)
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlparse
+import asyncio
+import atexit
+import threading
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+CHUNK_SIZE = 64 * 1024
+# Connection cuts in the middle of a page body that are resumed before the
+# chapter is given up, as in BaseChapter._page_save.
+RESUME_RETRIES = 20
+
+_engine = None
+_lock = threading.Lock()
+_warned = False
+
+
+class AsyncEngine(object):
+    """Downloads pages as coroutines on an event loop that runs in a
+    background thread. The engine is shared by every chapter being
+    downloaded, so up to `max_requests` page requests are in flight in the
+    process at the same time without tying up a thread for each of them.
+
+    Chapters hand their pages to the engine with `submit`, which returns
+    concurrent.futures.Future objects just like the page download pool does.
+    """
+
+    def __init__(self, max_requests):
+        self.max_requests = max_requests
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = None
+        self._sessions = {}
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    async def _acquire(self, host_limiter):
+        """Waits until the limiter allows a request to be sent."""
+        while True:
+            delay = host_limiter.try_acquire()
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    async def _fetch(self, chapter, page_num, page_url):
+        """Requests a page and writes it into a temporary file, retrying
+        `page_retries` times after connection errors and server errors.
+        Requests throttled by the host are sent again once the limiter of the
+        host allows it. Returns the extension and the file of the page, or
+        None if the site answers with `page_missing_status`.
+        """
+        headers = dict(sessions.get(page_url).headers)
+        headers.update(chapter.page_headers or {})
+        timeout = aiohttp.ClientTimeout(total=None,
+                                        sock_connect=chapter.page_timeout,
+                                        sock_read=chapter.page_timeout)
+        host = urlparse(page_url).netloc
+        host_limiter = sessions.limiter(host)
+        session = self._session(host)
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        throttled = 0
+        while attempt <= chapter.page_retries:
+            await self._acquire(host_limiter)
+            f = SpooledTemporaryFile(max_size=archive.PAGE_SPOOL_SIZE)
+            retry_after = None
+            start = time.time()
+            status = None
+            try:
+                async with session.get(page_url, headers=headers,
+                                       timeout=timeout) as r:
+                    status = r.status
+                    if (status in sessions.THROTTLE_STATUSES and
+                            throttled < sessions.LimitedAdapter
+                            .throttle_retries):
+                        retry_after = sessions.parse_retry_after(r)
+                        throttled += 1
+                        f.close()
+                        continue
+                    if status == chapter.page_missing_status:
+                        f.close()
+                        return None
+                    if status != 200:
+                        f.close()
+                        error = 'status {}'.format(status)
+                        if status < 500:
+                            break
+                        attempt += 1
+                        continue
+                    # The event loop thread interleaves the pages, so only
+                    # the wall time of each page can be recorded.
+                    profiling.record('http', time.time() - start, host=host,
+                                     series=chapter.alias)
+                    receive = time.time()
+                    try:
+                        response = await self._receive(
+                            chapter, page_num, page_url, session, headers,
+                            timeout, host_limiter, r, f
+                        )
+                    except exceptions.ScrapingError:
+                        f.close()
+                        raise
+                    profiling.record('page write', time.time() - receive,
+                                     host=host, series=chapter.alias)
+                    ext = chapter.page_extension(
+                        response.headers.get('content-type'), page_url
+                    )
+                    if response is not r:
+                        response.release()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                await loop.run_in_executor(None, chapter.page_report,
+                                           page_url, False, f.tell(),
+                                           time.time() - start, {})
+                f.close()
+                error = 'connection error'
+                attempt += 1
+                continue
+            finally:
+                host_limiter.release(status, retry_after)
+            await loop.run_in_executor(None, chapter.page_report, page_url,
+                                       True, f.tell(), time.time() - start,
+                                       r.headers)
+            return ext, f
+        output.error('{}: failed request for page {} due to {}'
+                     .format(chapter.alias, page_num, error))
+        raise exceptions.ScrapingError
+
+    async def _receive(self, chapter, page_num, page_url, session, headers,
+                       timeout, host_limiter, r, f):
+        """Writes the body of the response `r` into the file `f`, resuming
+        the download if the connection is killed, as
+        BaseChapter._page_save and page_resume_request do for the page
+        download pool. If the server supports byte ranges only the missing
+        tail of the page is requested again, otherwise `f` is emptied and the
+        whole page is requested. Returns the response which finished the
+        download.
+        """
+        response = r
+        retries = RESUME_RETRIES
+        while True:
+            try:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    f.write(chunk)
+                return response
+            except (aiohttp.ClientPayloadError, asyncio.TimeoutError):
+                retries -= 1
+                if retries <= 0:
+                    output.error('Connection killed on page {}, no retries '
+                                 'remaining - aborting chapter'
+                                 .format(page_num))
+                    raise exceptions.ScrapingError
+                output.warning('Connection killed on page {}, {} retries '
+                               'remaining'.format(page_num, retries))
+            # Offsets into content-encoded responses do not match the decoded
+            # bytes that have been written, so those are always restarted.
+            supports_ranges = (
+                response.headers.get('accept-ranges', '').lower() == 'bytes'
+                and response.headers.get('content-encoding',
+                                         'identity') == 'identity'
+            )
+            if response is not r:
+                response.release()
+            written = f.tell()
+            response = None
+            if written and supports_ranges:
+                resumed = await self._request(
+                    session, page_url, host_limiter, timeout,
+                    dict(headers, Range='bytes={}-'.format(written))
+                )
+                content_range = resumed.headers.get('content-range', '')
+                if (resumed.status == 206 and
+                        content_range.startswith('bytes {}-'
+                                                 .format(written))):
+                    response = resumed
+                    continue
+                if resumed.status == 200:
+                    # The range was ignored and the whole page is coming.
+                    response = resumed
+                else:
+                    resumed.release()
+            f.seek(0)
+            f.truncate()
+            if response is None:
+                response = await self._request(session, page_url,
+                                               host_limiter, timeout, headers)
+            if response.status != 200:
+                response.release()
+                output.error('Could not resume page {} (status {})'
+                             .format(page_num, response.status))
+                raise exceptions.ScrapingError
+
+    async def _request(self, session, page_url, host_limiter, timeout,
+                       headers):
+        """Sends a request for the page once the limiter of the host allows
+        it and returns the response, whose body is yet to be read.
+        """
+        await self._acquire(host_limiter)
+        status = None
+        try:
+            response = await session.get(page_url, headers=headers,
+                                         timeout=timeout)
+            status = response.status
+        finally:
+            host_limiter.release(status, None)
+        return response
+
+    def _session(self, host):
+        """Returns the client session for the host. Must be called from the
+        event loop.
+        """
+        try:
+            return self._sessions[host]
+        except KeyError:
+            connector = aiohttp.TCPConnector(limit=self.max_requests)
+            session = self._sessions[host] = aiohttp.ClientSession(
+                connector=connector
+            )
+            return session
+
+    def close(self):
+        """Closes the client sessions and stops the event loop."""
+        async def close_sessions():
+            for session in self._sessions.values():
+                await session.close()
+            self._sessions.clear()
+        asyncio.run_coroutine_threadsafe(close_sessions(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def download_page(self, chapter, chapter_archive, page_num,
+                            page_url):
+        """Downloads a page and returns the number of the page, the file
+        extension and the file handle, as page_download_task does. Pages that
+        do not exist are skipped in the chapter archive and None is returned.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_requests)
+        async with self._semaphore:
+            page = await self._fetch(chapter, page_num, page_url)
+        if page is None:
+            chapter_archive.skip(page_num)
+            return None
+        ext, f = page
+        loop = asyncio.get_running_loop()
+        if pagecache.enabled():
+            await loop.run_in_executor(None, pagecache.store,
+                                       chapter.page_cache_key(page_url), ext,
+                                       f)
+        return await loop.run_in_executor(None, chapter.page_postprocess,
+                                          page_num, ext, f)
+
+    def submit(self, chapter, chapter_archive, page_num, page_url):
+        """Schedules the download of a page on the event loop and returns a
+        concurrent.futures.Future for its result.
+        """
+        coroutine = self.download_page(chapter, chapter_archive, page_num,
+                                       page_url)
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+
+def close():
+    """Stops the shared engine if it has been started."""
+    global _engine
+    with _lock:
+        if _engine is not None:
+            _engine.close()
+            _engine = None
+
+
+def enabled():
+    """Returns a boolean indicating if pages should be downloaded with the
+    asyncio engine, which is chosen by setting `download_engine` to
+    'asyncio'. The engine requires aiohttp; without it the page download pool
+    is used after a warning.
+    """
+    global _warned
+    if config.get().download_engine != 'asyncio':
+        return False
+    if aiohttp is None:
+        if not _warned:
+            output.warning('The asyncio download engine requires aiohttp; '
+                           'using threads instead')
+            _warned = True
+        return False
+    return True
+
+
+def get():
+    """Returns the shared engine, starting it if needed."""
+    global _engine
+    with _lock:
+        if _engine is None:
+            _engine = AsyncEngine(config.get().async_requests)
+            atexit.register(close)
+        return _engine
+
+
+def submit(chapter, chapter_archive, page_num, page_url):
+    """Schedules the download of a page on the shared engine."""
+    return get().submit(chapter, chapter_archive, page_num, page_url)
@@ -0,0 +1,254 @@
+from cu2 import config, exceptions, output, profiling
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+# Pages up to this size are kept in memory while they wait for their turn to
+# be written into the archive; larger pages are spooled to disk.
+PAGE_SPOOL_SIZE = 1024 * 1024
+
+
+class ChapterArchive(object):
+    """Writes the pages of a chapter into the chapter archive as they finish
+    downloading. Pages may arrive in any order; pages that arrive ahead of
+    their turn are held in a reorder buffer, so that every page is written into
+    the archive exactly once and in page order. Files inside the archive are
+    named with rolling numbering padded to six digits and with the prefix
+    'img'.
+
+    The archive is written under a temporary name that is unique to the
+    archive and only moved to its final name once all of the pages have been
+    written. If another file has taken the final name in the meantime, e.g.
+    the same chapter downloaded by another process, the archive is numbered
+    as BaseChapter.filename numbers the names of existing files and the name
+    it was saved under is left in `filename`. Used as a context manager,
+    the archive is finished when the block exits normally and discarded if the
+    block raises.
+
+    If a `journal` path is given, the pages that did finish are kept in the
+    journal when the archive is discarded. The next archive opened with the
+    same journal and page count restores those pages, which are listed in
+    `resumed` so that they are not downloaded again.
+    """
+
+    def __init__(self, filename, length, journal=None):
+        self.filename = filename
+        self.journal = journal
+        self.length = length
+        fd, self.partial_filename = tempfile.mkstemp(
+            suffix='.part', prefix=os.path.basename(filename) + '.',
+            dir=os.path.dirname(os.path.abspath(filename))
+        )
+        os.close(fd)
+        self.resumed = frozenset()
+        self._buffer = {}
+        self._count = 0
+        self._journal_zip = None
+        self._lock = threading.Lock()
+        self._next = 0
+        self._written = {}
+        self._zip = zipfile.ZipFile(self.partial_filename, 'w')
+        if journal:
+            self._load_journal()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _flush(self):
+        """Writes all of the buffered pages that are next in order. Must be
+        called with the lock held.
+        """
+        while self._next in self._buffer:
+            page = self._buffer.pop(self._next)
+            self._next += 1
+            if page is None:
+                continue
+            ext, f = page
+            f.seek(0)
+            name = 'img{num:0>6}{ext}'.format(num=self._count, ext=ext)
+            with profiling.phase('archive'), \
+                    self._zip.open(name, 'w') as entry:
+                shutil.copyfileobj(f, entry)
+            f.close()
+            self._written[self._next - 1] = name
+            self._count += 1
+
+    def _load_journal(self):
+        """Restores the pages kept in the journal into the reorder buffer. The
+        journal is discarded if it is unreadable, has expired or was written
+        for a different number of pages.
+        """
+        try:
+            journal = zipfile.ZipFile(self.journal)
+        except FileNotFoundError:
+            return
+        except zipfile.BadZipFile:
+            os.remove(self.journal)
+            return
+        try:
+            pages = json.loads(journal.comment.decode('utf-8'))['pages']
+        except (KeyError, ValueError):
+            pages = None
+        if pages != self.length or journal_expired(self.journal):
+            journal.close()
+            os.remove(self.journal)
+            return
+        self._journal_zip = journal
+        for name in journal.namelist():
+            index, ext = os.path.splitext(name)
+            self._buffer[int(index)] = (ext, journal.open(name))
+        self.resumed = frozenset(self._buffer)
+        with self._lock:
+            self._flush()
+
+    def _save_journal(self, buffer):
+        """Writes the pages that have finished into the journal, both the ones
+        already written into the partial archive and the ones in `buffer`.
+        """
+        pages = [(i, page) for i, page in buffer.items() if page is not None]
+        if not (self._written or pages):
+            return
+        os.makedirs(os.path.dirname(self.journal), exist_ok=True)
+        new_journal = self.journal + '.new'
+        with zipfile.ZipFile(new_journal, 'w') as journal, \
+                zipfile.ZipFile(self.partial_filename) as partial:
+            journal.comment = json.dumps({'pages': self.length}).encode()
+            for index, name in self._written.items():
+                ext = os.path.splitext(name)[1]
+                with partial.open(name) as f, \
+                        journal.open(journal_name(index, ext), 'w') as entry:
+                    shutil.copyfileobj(f, entry)
+            for index, (ext, f) in pages:
+                f.seek(0)
+                with journal.open(journal_name(index, ext), 'w') as entry:
+                    shutil.copyfileobj(f, entry)
+        os.replace(new_journal, self.journal)
+
+    def abort(self):
+        """Discards the archive and any pages still waiting in the buffer,
+        keeping the finished pages in the journal if there is one.
+        """
+        with self._lock:
+            if self._zip is None:
+                return
+            self._zip.close()
+            self._zip = None
+            buffer, self._buffer = self._buffer, {}
+        try:
+            if self.journal:
+                self._save_journal(buffer)
+        finally:
+            for page in buffer.values():
+                if page is not None:
+                    page[1].close()
+            if self._journal_zip:
+                self._journal_zip.close()
+            os.remove(self.partial_filename)
+
+    def add(self, index, ext, f):
+        """Adds the page with the zero-based `index` from the file object `f`,
+        which is closed once the page has been written. Pages added after the
+        archive has been closed or aborted are ignored.
+        """
+        with self._lock:
+            if self._zip is None:
+                f.close()
+                return
+            self._buffer[index] = (ext, f)
+            self._flush()
+
+    def close(self):
+        """Finishes the archive and moves it to its final name. Raises
+        ScrapingError and discards the archive if any page is missing.
+        """
+        with self._lock:
+            complete = self._next >= self.length
+        if not complete:
+            output.error('Missing page {} of {}'
+                         .format(self._next + 1, self.length))
+            self.abort()
+            raise exceptions.ScrapingError
+        with self._lock, profiling.phase('archive'):
+            self._zip.close()
+            self._zip = None
+        self.filename = reserve(self.filename)
+        os.replace(self.partial_filename, self.filename)
+        if self._journal_zip:
+            self._journal_zip.close()
+            os.remove(self.journal)
+
+    def skip(self, index):
+        """Marks the page with the zero-based `index` as not existing, so that
+        the pages after it do not wait for it.
+        """
+        with self._lock:
+            if self._zip is None:
+                return
+            self._buffer[index] = None
+            self._flush()
+
+
+def expire_journals():
+    """Removes the page journals that have expired."""
+    directory = journal_directory()
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if journal_expired(path):
+            os.remove(path)
+
+
+def journal_directory():
+    """Returns the directory which holds the page journals."""
+    return os.path.join(config.cu2_dir, 'journal')
+
+
+def journal_expired(path):
+    """Returns a boolean indicating if the journal has not been touched for
+    longer than the `journal_expiry` setting (in days) allows.
+    """
+    age = time.time() - os.path.getmtime(path)
+    return age > config.get().journal_expiry * 24 * 60 * 60
+
+
+def journal_name(index, ext):
+    """Returns the name of a page inside a journal."""
+    return '{index:0>6}{ext}'.format(index=index, ext=ext)
+
+
+def journal_path(url):
+    """Returns the path of the page journal for the chapter URL."""
+    name = hashlib.sha1(url.encode('utf-8')).hexdigest() + '.zip'
+    return os.path.join(journal_directory(), name)
+
+
+def reserve(filename):
+    """Creates an empty file under the filename, or under the first free name
+    numbered like 'name-2.zip' if the filename is taken, and returns the name
+    of the file. The file is created atomically, so that concurrent downloads
+    never reserve the same name.
+    """
+    stem, ext = os.path.splitext(filename)
+    i = 1
+    target = filename
+    while True:
+        try:
+            fd = os.open(target, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            i += 1
+            target = '{}-{}{}'.format(stem, i, ext)
+        else:
+            os.close(fd)
+            return target
@@ -59,14 +59,35 @@ class BaseConfig(object):
             finally:
                 f.close()
 
+        self.async_requests = j.get('async_requests', 100)
         self.cbz = j.get('cbz', False)
+        self.chapter_threads = j.get('chapter_threads', 3)
         self.compact_new = j.get('compact_new', False)
+        self.connection_pool_size = j.get('connection_pool_size', 10)
+        self.convert_webp = j.get('convert_webp', False)
+        self.database_cache_size = j.get('database_cache_size', 16384)
+        self.database_journal_mode = j.get('database_journal_mode', 'wal')
+        self.database_synchronous = j.get('database_synchronous', 'normal')
+        self.database_timeout = j.get('database_timeout', 30)
         self.download_directory = j.get('download_directory',
                                         self.default_download_directory)
+        self.download_engine = j.get('download_engine', 'threads')
         self.download_threads = j.get('download_threads', 4)
-        self.html_parser = j.get('html_parser', 'html.parser')
+        self.fast_update_ttl = j.get('fast_update_ttl', 60)
+        self.html_parser = j.get('html_parser', None)
+        self.image_workers = j.get('image_workers', None)
+        self.journal_expiry = j.get('journal_expiry', 7)
         self.madokami = MadokamiConfig(self, j.get('madokami', {}))
+        self.page_cache = j.get('page_cache', False)
+        self.page_cache_directory = j.get('page_cache_directory', None)
+        self.page_cache_size = j.get('page_cache_size', 1024)
+        self.parse_processes = j.get('parse_processes', False)
+        self.parse_workers = j.get('parse_workers', None)
+        self.queue_attempts = j.get('queue_attempts', 5)
+        self.rate_limits = j.get('rate_limits', {})
+        self.recent_updates = j.get('recent_updates', True)
         self.relative_latest = j.get('relative_latest', False)
+        self.release_predictor = j.get('release_predictor', 'interval')
 
         self.persistent_config = j
 
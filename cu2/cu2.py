@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
-from cu2 import config, exceptions, output, version
+from cu2 import config, exceptions, output, predict, profiling, version
 from functools import wraps
 import click
 import concurrent.futures
+import datetime
 
 
 class Cu2Group(click.Group):
@@ -23,14 +24,28 @@ def edit_defaults():
     for param in latest_command.params:
         if param.human_readable_name == 'relative':
             param.default = config.get().relative_latest
+    update_command = cli.get_command(cli, 'update')
+    for param in update_command.params:
+        if param.human_readable_name == 'probe':
+            param.default = config.get().recent_updates
 
 
 @click.command(cls=Cu2Group)
 @click.option('--cu2-directory',
               help='Directory used by cu2 to store application files.')
+@click.option('--profile', is_flag=True, envvar='CU2_PROFILE',
+              help='Record the time spent in each phase per host and series '
+                   'and print a summary at exit.')
+@click.option('--profile-memory', is_flag=True, envvar='CU2_PROFILE_MEMORY',
+              help='Trace memory allocations while profiling.')
+@click.option('--profile-output', envvar='CU2_PROFILE_OUTPUT',
+              help='File which the profile data is written into.')
+@click.option('--profile-python', is_flag=True, envvar='CU2_PROFILE_PYTHON',
+              help='Also run cProfile on every thread while profiling.')
 @click.version_option(version=version.__version__,
                       message=version.version_string())
-def cli(cu2_directory=None):
+def cli(cu2_directory=None, profile=False, profile_memory=False,
+        profile_output=None, profile_python=False):
     global db, output, sanity, utility
     from cu2 import output
     try:
@@ -38,6 +53,9 @@ def cli(cu2_directory=None):
     except exceptions.ConfigError as e:
         output.configuration_error(e)
         exit(1)
+    if profile or profile_memory or profile_python:
+        profiling.enable(output=profile_output, python=profile_python,
+                         memory=profile_memory)
     from cu2 import db, sanity, utility
     db.initialize()
     edit_defaults()
@@ -143,20 +161,11 @@ def download(aliases):
     If an optional alias is specified, the command will only download new
     chapters for that alias.
     """
-    chapters = []
     if not aliases:
-        chapters = db.Chapter.find_new()
+        db.QueuedDownload.enqueue_new(retry_failed=True)
     for alias in aliases:
-        chapters += db.Chapter.find_new(alias=alias)
-    output.chapter('Downloading {} chapters'.format(len(chapters)))
-    for chapter in chapters:
-        try:
-            chapter.get()
-        except exceptions.LoginError as e:
-            output.warning('Could not download {c.alias} {c.chapter}: {e}'
-                           .format(c=chapter, e=e.message))
-        except exceptions.ScrapingError:
-            pass
+        db.QueuedDownload.enqueue_new(alias=alias, retry_failed=True)
+    utility.download_queue(aliases or None)
 
 
 @cli.command()
@@ -195,6 +204,53 @@ def edit(alias, setting, value):
         output.chapter('Changed {} for {} to {}'.format(setting, alias, value))
 
 
+@cli.command()
+@click.option('--cadence', type=int, default=60,
+              help='Minutes between the replayed updates.')
+@click.option('--predictor', 'predictors', multiple=True,
+              type=click.Choice(sorted(predict.PREDICTORS)),
+              help='Release predictor to evaluate (all by default).')
+def evaluate_predictors(cadence, predictors):
+    """Compare release predictors on the release history.
+
+    The chapters of every followed series after its third release are
+    replayed as if `cu2 update --fast` ran every CADENCE minutes, and the
+    number of series checks is reported together with the delay with which
+    the chapters would have been found.
+    """
+    cadence = datetime.timedelta(minutes=cadence)
+    history = {}
+    query = (db.session.query(db.Chapter.series_id, db.Chapter.added_on)
+             .join(db.Series)
+             .filter(db.Series.following, db.Chapter.added_on.isnot(None))
+             .order_by(db.Chapter.added_on))
+    for series_id, added_on in query:
+        history.setdefault(series_id, []).append(added_on)
+    baseline = sum(predict.evaluate(predict.AlwaysPredictor(), x, cadence)[0]
+                   for x in history.values())
+    if not baseline:
+        output.warning('Not enough release history to evaluate')
+        return
+    click.echo('{:<10} {:>8} {:>8} {:>8} {:>15} {:>15}'
+               .format('predictor', 'checks', 'saved', 'found',
+                       'mean delay (h)', '90% delay (h)'))
+    for name in sorted(predictors or predict.PREDICTORS):
+        predictor = predict.get(name)
+        checks = 0
+        delays = []
+        for release_dates in history.values():
+            series_checks, series_delays = predict.evaluate(predictor,
+                                                            release_dates,
+                                                            cadence)
+            checks += series_checks
+            delays += series_delays
+        hours = sorted(x.total_seconds() / 3600 for x in delays)
+        click.echo('{:<10} {:>8} {:>8.1%} {:>8} {:>15.1f} {:>15.1f}'
+                   .format(name, checks, 1 - checks / baseline, len(hours),
+                           sum(hours) / len(hours),
+                           hours[int(len(hours) * 0.9)]))
+
+
 @cli.command()
 @click.argument('urls', required=True, nargs=-1)
 @click.option('--directory',
@@ -205,7 +261,7 @@ def edit(alias, setting, value):
               help='Ignores the chapters for the added follows.')
 def follow(urls, directory, download, ignore):
     """Follow a series."""
-    chapters = []
+    aliases = []
     for url in urls:
         try:
             series = utility.series_by_url(url)
@@ -224,18 +280,13 @@ def follow(urls, directory, download, ignore):
             output.chapter('Ignoring {} chapters'.format(len(series.chapters)))
         else:
             series.follow()
-            chapters += db.Chapter.find_new(alias=series.alias)
+            if download:
+                db.QueuedDownload.enqueue_new(alias=series.alias)
+                aliases.append(series.alias)
         del series
 
-    if download:
-        output.chapter('Downloading {} chapters'.format(len(chapters)))
-        for chapter in chapters:
-            try:
-                chapter.get()
-            except exceptions.LoginError as e:
-                output.warning('Could not download {c.alias} {c.chapter}: {e}'
-                               .format(c=chapter, e=e.message))
-            del chapter
+    if aliases:
+        utility.download_queue(aliases)
 
 
 @cli.command()
@@ -301,17 +352,12 @@ def get(input, directory):
             if not chapters:
                 output.warning('Invalid selection "{}"'.format(item))
             for chapter in chapters:
-                chapter_list.append(chapter.to_object())
+                chapter_list.append(chapter.to_record())
         if series:
             del series
     for chapter in chapter_list:
         chapter.directory = directory
-        try:
-            chapter.get(use_db=False)
-        except exceptions.LoginError as e:
-            output.warning('Could not download {c.alias} {c.chapter}: {e}'
-                           .format(c=chapter, e=e.message))
-        del chapter
+    utility.download_chapters(chapter_list, use_db=False)
 
 
 @cli.command()
@@ -411,48 +457,84 @@ def unignore(alias, chapters):
 @cli.command()
 @click.option('--fast/--no-fast', default=False,
               help='Run updates based on average release interval.')
-def update(fast):
+@click.option('--probe/--no-probe', default=True,
+              help='Skip series that the site lists as unchanged.')
+def update(fast, probe):
     """Gather new chapters from followed series."""
     pool = concurrent.futures.ThreadPoolExecutor(config.get().download_threads)
     futures = []
     warnings = []
-    aliases = {}
-    query = db.session.query(db.Series).filter_by(following=True).all()
+    follows = {}
     if fast:
+        ttl = datetime.timedelta(minutes=config.get().fast_update_ttl)
+        query = db.Series.due(ttl).all()
+        skip_count = (db.session.query(db.Series).filter_by(following=True)
+                      .count() - len(query))
+    else:
+        query = db.session.query(db.Series).filter_by(following=True).all()
         skip_count = 0
+    if probe:
+        changed = set(utility.changed_series(query))
+        now = datetime.datetime.now()
         for series in query.copy():
-            if not series.needs_update:
+            if series not in changed:
+                series.last_updated = now
+                series.schedule()
                 skip_count += 1
                 query.remove(series)
+        db.session.commit()
+    if skip_count:
         output.series('Updating {} series ({} skipped)'
                       .format(len(query), skip_count))
     else:
         output.series('Updating {} series'.format(len(query)))
     for follow in query:
-        fut = pool.submit(utility.series_by_url, follow.url)
+        fut = pool.submit(profiling.call_in_series, follow.alias,
+                          utility.series_updates, follow.url,
+                          since=follow.watermark, etag=follow.etag,
+                          last_modified=follow.last_modified)
         futures.append(fut)
-        aliases[fut] = follow.alias
+        follows[fut] = follow
     with click.progressbar(length=len(futures), show_pos=True,
                            fill_char='>', empty_char=' ') as bar:
         for future in concurrent.futures.as_completed(futures):
+            alias = follows[future].alias
             try:
                 series = future.result()
             except exceptions.ConnectionError:
                 warnings.append('Unable to update {} (connection error)'
-                                .format(aliases[future]))
+                                .format(alias))
+            except exceptions.NotModified:
+                follows[future].schedule()
+                follows[future].mark_as_updated()
             except exceptions.ScrapingError:
                 warnings.append('Unable to update {} (scraping error)'
-                                .format(aliases[future]))
+                                .format(alias))
             except exceptions.LoginError as e:
                 warnings.append('Unable to update {} ({})'
-                                .format(aliases[future], e.message))
+                                .format(alias, e.message))
             else:
-                series.update()
+                with profiling.series(alias):
+                    series.update()
             bar.update(1)
     for w in warnings:
         output.warning(w)
+    db.QueuedDownload.enqueue_new()
     utility.list_new()
 
 
+@cli.command()
+@click.option('--poll', type=int, default=None,
+              help='Keep running and check the queue every POLL seconds.')
+def worker(poll):
+    """Download the chapters in the download queue.
+
+    New chapters are added to the queue by `cu2 update` and by
+    `cu2 follow --download`. Chapters that fail to download stay in the queue
+    and are tried again on the next run, up to `queue_attempts` times.
+    """
+    utility.download_queue(poll=poll)
+
+
 if __name__ == '__main__':
     cli()
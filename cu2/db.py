@@ -1,4 +1,5 @@
-from cu2 import config, output, sanity
+from collections import OrderedDict
+from cu2 import config, output, predict, sanity
 from math import sqrt
 from natsort import humansorted
 from shutil import copyfile
@@ -7,21 +8,56 @@ from sqlalchemy import (
     Column,
     create_engine,
     DateTime,
+    event,
     ForeignKey,
     Integer,
+    or_,
     String,
     Table
 )
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.orm import (
+    contains_eager,
+    declarative_base,
+    relationship,
+    scoped_session,
+    selectinload,
+    sessionmaker
+)
 from sqlalchemy.orm.exc import NoResultFound
 from urllib.parse import urlparse
 import click
 import datetime
+import importlib
 import os
 import sqlalchemy.engine.url
+import sqlalchemy.exc
 
 Base = declarative_base()
 
+# Number of values bound in a single IN clause, which keeps the queries under
+# the limit of bound variables of older SQLite versions.
+IN_CLAUSE_SIZE = 500
+
+# Registry of the sessions of each thread, created by initialize().
+Session = None
+
+# Maps the host of a chapter URL to the module under cu2.scrapers and the name
+# of the chapter class which handles chapters from that host.
+chapter_classes = {
+    'bato.to': ('batoto_v3x', 'BatotoV3XChapter'),
+    'dynasty-scans.com': ('dynastyscans', 'DynastyScansChapter'),
+    'kobato.hologfx.com': ('dokireader', 'DokiReaderChapter'),
+    'm.mangahere.cc': ('mangahere', 'MangahereChapter'),
+    'manga.madokami.al': ('madokami', 'MadokamiChapter'),
+    'mangadex.com': ('mangadex_v5', 'MangadexV5Chapter'),
+    'mangadex.org': ('mangadex_v5', 'MangadexV5Chapter'),
+    'mangakatana.com': ('mangakatana', 'MangakatanaChapter'),
+    'mangasee123.com': ('mangasee', 'MangaseeChapter'),
+    'www.mangahere.cc': ('mangahere', 'MangahereChapter'),
+    'www.yuri-ism.net': ('yuriism', 'YuriismChapter'),
+    'ww7.mangakakalot.tv': ('mangakakalot', 'MangakakalotChapter'),
+}
+
 group_table = Table(
     'group_association', Base.metadata,
     Column('chapter_id', Integer, ForeignKey('chapters.id')),
@@ -40,6 +76,16 @@ class Series(Base):
     following = Column(Boolean, default=True)
     directory = Column(String)
     last_updated = Column(DateTime)
+    # Validators of the series page from the last update, which are sent with
+    # the next update so that an unchanged page is not downloaded again.
+    etag = Column(String)
+    last_modified = Column(String)
+    # URL of the newest chapter seen by the last update, at which scrapers
+    # that list the chapters newest first stop listing them.
+    watermark = Column(String)
+    # Time from which `update --fast` checks the series again, recomputed
+    # from the release interval whenever chapters are saved.
+    next_check_at = Column(DateTime, index=True)
 
     chapters = relationship("Chapter", backref="series")
 
@@ -65,6 +111,22 @@ class Series(Base):
         else:
             return s
 
+    @staticmethod
+    def due(ttl=None):
+        """Returns a query for the followed series whose next check is due.
+        Series without a next check are always due. Accepts an optional
+        timedelta 'ttl', which leaves out series updated more recently.
+        """
+        now = datetime.datetime.now()
+        query = (session.query(Series)
+                 .filter(Series.following,
+                         or_(Series.next_check_at.is_(None),
+                             Series.next_check_at <= now)))
+        if ttl:
+            query = query.filter(or_(Series.last_updated.is_(None),
+                                     Series.last_updated <= now - ttl))
+        return query
+
     def check_alias_uniqueness(self):
         """Check if the series alias is unique before initalizing the series
         object. If the alias is not unique, "-X" is appended to the end of the
@@ -106,10 +168,9 @@ class Series(Base):
         """Returns a boolean indicating if the series is in need of an update
         based on the average release interval.
         """
-        if not self.last_added:
+        if not self.next_check_at:
             return True
-        next_update = self.last_added + self.release_interval
-        return datetime.datetime.now() >= next_update
+        return datetime.datetime.now() >= self.next_check_at
 
     @property
     def ordered_chapters(self):
@@ -129,24 +190,22 @@ class Series(Base):
         other when the series is first added, the interval between two chapter
         releases must be greater than 60 seconds to be counter.
         """
-        release_dates = [x.added_on for x in self.chapters if x.added_on]
-        release_dates.append(datetime.datetime.now())
-        release_dates = sorted(release_dates)
-        intervals = []
-        for i in range(len(release_dates) - 1):
-            interval = (release_dates[i+1] - release_dates[i]).total_seconds()
-            if interval > 60:
-                intervals.append(interval)
-        if len(intervals) == 0:
-            average_seconds = 0
-        elif len(intervals) == 1:
-            average_seconds = intervals[0]
-        else:
-            mean = float(sum(intervals)) / len(intervals)
-            devsum = sum((x - mean) ** 2 for x in intervals)
-            dev = sqrt(float(devsum) / len(intervals))
-            average_seconds = max((mean - dev/2), 0)
-        return datetime.timedelta(seconds=average_seconds)
+        return release_interval([x.added_on for x in self.chapters
+                                 if x.added_on])
+
+    def schedule(self):
+        """Sets the time of the next check as predicted by the predictor of
+        the `release_predictor` setting. Only the release dates are queried,
+        so the chapters of the series are not loaded.
+        """
+        release_dates = [added_on for added_on, in
+                         (session.query(Chapter.added_on)
+                          .filter(Chapter.series_id == self.id,
+                                  Chapter.added_on.isnot(None))
+                          .order_by(Chapter.added_on))]
+        predictor = predict.get(config.get().release_predictor)
+        self.next_check_at = predictor.predict(release_dates,
+                                               datetime.datetime.now())
 
 
 class Chapter(Base):
@@ -166,7 +225,12 @@ class Chapter(Base):
 
     groups = relationship('Group', secondary=group_table, backref='chapters')
 
-    def __init__(self, chapter, series):
+    def __init__(self, chapter, series, groups=None):
+        """Creates the database entry of a chapter. Accepts an optional
+        'groups' argument mapping group names to Group objects, as returned by
+        Group.resolve, for when the groups of several chapters are resolved
+        together.
+        """
         self.series = series
         self.chapter = chapter.chapter
         self.title = chapter.title
@@ -174,30 +238,63 @@ class Chapter(Base):
         self.added_on = datetime.datetime.now()
         self.api_id = getattr(chapter, 'api_id', None)
 
-        self.groups = []
-        for group in chapter.groups:
-            try:
-                g = session.query(Group).filter(Group.name == group).one()
-            except NoResultFound:
-                g = Group(group)
-                session.add(g)
-                session.commit()
-            self.groups.append(g)
+        if groups is None:
+            groups = Group.resolve(chapter.groups)
+        self.groups = [groups[group] for group in chapter.groups]
 
     @staticmethod
     def find_new(alias=None):
-        """Return a list of new chapters as Chapter objects and applies human
-        sorting to it. Accepts an optional 'alias' argument, which will filter
-        the query.
+        """Return a list of new chapters as ChapterRecord objects and applies
+        human sorting to it. Accepts an optional 'alias' argument, which will
+        filter the query.
         """
-        query = session.query(Chapter).join(Series).filter(Series.following)
+        query = (session.query(Chapter).join(Series)
+                 .options(contains_eager(Chapter.series),
+                          selectinload(Chapter.groups))
+                 .filter(Series.following))
         if alias:
             query = query.filter(Series.alias == alias)
         query = query.filter(Chapter.downloaded == 0).all()
+        records = (x.to_record() for x in query)
         # https://stackoverflow.com/a/1222717
-        return humansorted((x.to_object() for x in query if x.to_object() is not None),
+        return humansorted((x for x in records if x.supported),
                            key=lambda x: x.chapter)
 
+    @staticmethod
+    def save_all(series, chapters, ignore=False):
+        """Saves the chapters which are not in the database yet for the
+        series in a single transaction and returns the number of saved
+        chapters. The known chapter URLs are loaded with one query and the
+        groups of the new chapters are resolved together, so that a series
+        with few new chapters costs a few queries regardless of its length.
+        New chapters are marked ignored if `ignore` is set.
+        """
+        known = {url for url, in (session.query(Chapter.url)
+                                  .filter(Chapter.series_id == series.id))}
+        new = OrderedDict()
+        for chapter in chapters:
+            if chapter.url not in known:
+                new.setdefault(chapter.url, chapter)
+        # Chapter URLs are unique across all series, so URLs which belong to
+        # another series are skipped just like the series' own.
+        urls = list(new)
+        for i in range(0, len(urls), IN_CLAUSE_SIZE):
+            taken = (session.query(Chapter.url)
+                     .filter(Chapter.url.in_(urls[i:i + IN_CLAUSE_SIZE])))
+            for url, in taken:
+                del new[url]
+        if not new:
+            return 0
+        groups = Group.resolve({group for chapter in new.values()
+                                for group in chapter.groups})
+        for chapter in new.values():
+            c = Chapter(chapter, series, groups=groups)
+            if ignore:
+                c.downloaded = -1
+            session.add(c)
+        session.commit()
+        return len(new)
+
     @property
     def group_tag(self):
         """Return a joined string of chapter's groups enclosed in brackets."""
@@ -217,46 +314,97 @@ class Chapter(Base):
         """Turns a database entry into a chapter object for the respective
         site by parsing the URL.
         """
-        parse = urlparse(self.url)
-        kwargs = {
-            'name': self.series.name,
-            'alias': self.series.alias,
-            'chapter': self.chapter,
-            'url': self.url,
-            'groups': self.groups,
-            'directory': self.series.directory,
-            'api_id': self.api_id
-        }
-        if parse.netloc in ('mangadex.com', 'mangadex.org'):
-            from cu2.scrapers.mangadex_v5 import MangadexV5Chapter
-            return MangadexV5Chapter(**kwargs)
-        if parse.netloc == 'dynasty-scans.com':
-            from cu2.scrapers.dynastyscans import DynastyScansChapter
-            return DynastyScansChapter(**kwargs)
-        if parse.netloc == 'manga.madokami.al':
-            from cu2.scrapers.madokami import MadokamiChapter
-            return MadokamiChapter(**kwargs)
-        if parse.netloc == 'kobato.hologfx.com':
-            from cu2.scrapers.dokireader import DokiReaderChapter
-            return DokiReaderChapter(**kwargs)
-        if parse.netloc == 'www.yuri-ism.net':
-            from cu2.scrapers.yuriism import YuriismChapter
-            return YuriismChapter(**kwargs)
-        if parse.netloc == 'mangasee123.com':
-            from cu2.scrapers.mangasee import MangaseeChapter
-            return MangaseeChapter(**kwargs)
-        if parse.netloc in ('www.mangahere.cc', 'm.mangahere.cc'):
-            from cu2.scrapers.mangahere import MangahereChapter
-            return MangahereChapter(**kwargs)
-        if parse.netloc == 'ww7.mangakakalot.tv':
-            from cu2.scrapers.mangakakalot import MangakakalotChapter
-            return MangakakalotChapter(**kwargs)
-        if parse.netloc == 'mangakatana.com':
-            from cu2.scrapers.mangakatana import MangakatanaChapter
-            return MangakatanaChapter(**kwargs)
-        if parse.netloc == 'bato.to':
-            from cu2.scrapers.batoto_v3x import BatotoV3XChapter
-            return BatotoV3XChapter(**kwargs)
+        return self.to_record().to_object()
+
+    def to_record(self):
+        """Turns a database entry into a ChapterRecord."""
+        return ChapterRecord(alias=self.series.alias,
+                             api_id=self.api_id,
+                             chapter=self.chapter,
+                             directory=self.series.directory,
+                             groups=[x.name for x in self.groups],
+                             name=self.series.name,
+                             title=self.title,
+                             url=self.url)
+
+
+class ChapterRecord(object):
+    """Data-only copy of a database chapter, which is cheap to create for
+    every new chapter when listing or planning downloads. The chapter object
+    for the respective site, which may have to query the site when it is
+    created, is only created by `to_object` or `fetch` once the chapter is
+    actually downloaded.
+    """
+    __slots__ = ('alias', 'api_id', 'chapter', 'directory', 'groups', 'name',
+                 'quiet', 'title', 'url')
+
+    def __init__(self, alias, api_id, chapter, directory, groups, name, title,
+                 url):
+        self.alias = alias
+        self.api_id = api_id
+        self.chapter = chapter
+        self.directory = directory
+        self.groups = groups
+        self.name = name
+        self.quiet = False
+        self.title = title
+        self.url = url
+
+    def _set_downloaded(self, downloaded):
+        c = session.query(Chapter).filter_by(url=self.url).one()
+        c.downloaded = downloaded
+        session.commit()
+
+    def db_remove(self):
+        """Removes the chapter from the database."""
+        session.delete(session.query(Chapter).filter_by(url=self.url).one())
+        try:
+            session.commit()
+        except sqlalchemy.exc.SQLAlchemyError:
+            session.rollback()
+
+    def fetch(self):
+        """Creates the chapter object for the respective site and downloads
+        the chapter with it. Returns a boolean value indicating whether the
+        chapter was available or not.
+        """
+        chapter = self.to_object()
+        chapter.quiet = self.quiet
+        return chapter.fetch()
+
+    def ignore(self):
+        """Marks the chapter ignored in the database."""
+        self._set_downloaded(-1)
+
+    def mark_downloaded(self):
+        """Marks the chapter downloaded in the database."""
+        self._set_downloaded(1)
+
+    def mark_new(self):
+        """Marks the chapter new in the database."""
+        self._set_downloaded(0)
+
+    @property
+    def supported(self):
+        """Returns a boolean indicating if there is a chapter class for the
+        host of the chapter URL.
+        """
+        return urlparse(self.url).netloc in chapter_classes
+
+    def to_object(self):
+        """Returns a chapter object for the respective site by looking up the
+        host of the URL in `chapter_classes`, or None if no site matches.
+        """
+        try:
+            module, name = chapter_classes[urlparse(self.url).netloc]
+        except KeyError:
+            return None
+        module = importlib.import_module('cu2.scrapers.' + module)
+        Chapter = getattr(module, name)
+        return Chapter(name=self.name, alias=self.alias, chapter=self.chapter,
+                       url=self.url, groups=self.groups,
+                       directory=self.directory, api_id=self.api_id)
+
 
 class Group(Base):
     __tablename__ = 'groups'
@@ -270,23 +418,210 @@ class Group(Base):
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def _load(names):
+        groups = {}
+        for i in range(0, len(names), IN_CLAUSE_SIZE):
+            query = (session.query(Group)
+                     .filter(Group.name.in_(names[i:i + IN_CLAUSE_SIZE])))
+            groups.update((group.name, group) for group in query)
+        return groups
+
+    @staticmethod
+    def resolve(names):
+        """Returns a dictionary mapping the group names to Group objects.
+        Groups are remembered for the lifetime of the session, so each name
+        is looked up at most once; names that are not cached yet are loaded
+        with one query and the missing groups are inserted with one
+        statement. The session is not committed, which is left to the caller.
+        """
+        cache = session.info.setdefault('groups', {})
+        missing = [name for name in set(names) if name not in cache]
+        if missing:
+            cache.update(Group._load(missing))
+            new = [name for name in missing if name not in cache]
+            if new:
+                session.execute(Group.__table__.insert(),
+                                [{'name': name} for name in new])
+                cache.update(Group._load(new))
+        return {name: cache[name] for name in names}
+
+
+class QueuedDownload(Base):
+    """Chapter waiting in the download queue. Entries are 'queued' until a
+    download picks them up, 'running' while they are being downloaded and
+    'failed' once they have failed `queue_attempts` times. Entries are
+    removed when their chapter has been downloaded.
+    """
+    __tablename__ = 'download_queue'
+
+    id = Column(Integer, primary_key=True)
+    chapter_id = Column(Integer, ForeignKey('chapters.id'), unique=True)
+
+    priority = Column(Integer, default=0)
+    attempts = Column(Integer, default=0)
+    last_error = Column(String)
+    state = Column(String, default='queued')
+    added_on = Column(DateTime)
+
+    chapter = relationship('Chapter')
+
+    def __init__(self, chapter, priority=0):
+        self.chapter = chapter
+        self.priority = priority
+        self.attempts = 0
+        self.state = 'queued'
+        self.added_on = datetime.datetime.now()
+
+    @staticmethod
+    def claim(aliases=None):
+        """Marks the queued entries running and returns them, ordered by
+        priority and then by chapter. Accepts an optional list of aliases,
+        which will filter the entries; an empty list claims nothing. Entries for chapters that are no longer
+        new are dropped from the queue, while entries of series that are no
+        longer followed are left queued.
+        """
+        query = (session.query(QueuedDownload).join(Chapter).join(Series)
+                 .filter(QueuedDownload.state == 'queued', Series.following))
+        if aliases is not None:
+            query = query.filter(Series.alias.in_(aliases))
+        entries = []
+        for entry in query.all():
+            if entry.chapter.downloaded != 0:
+                session.delete(entry)
+            else:
+                entry.state = 'running'
+                entries.append(entry)
+        session.commit()
+        entries = humansorted(entries, key=lambda x: x.chapter.chapter)
+        return sorted(entries, key=lambda x: -x.priority)
+
+    @staticmethod
+    def enqueue_new(alias=None, priority=0, retry_failed=False):
+        """Adds the new chapters of followed series which are not queued yet
+        to the queue and returns the number of added chapters. Accepts an
+        optional 'alias' argument, which will filter the chapters. Failed
+        entries are queued again if `retry_failed` is set.
+        """
+        query = (session.query(Chapter).join(Series)
+                 .outerjoin(QueuedDownload)
+                 .filter(Series.following, Chapter.downloaded == 0,
+                         QueuedDownload.id.is_(None)))
+        if alias:
+            query = query.filter(Series.alias == alias)
+        chapters = query.all()
+        for chapter in chapters:
+            session.add(QueuedDownload(chapter, priority=priority))
+        if retry_failed:
+            failed = (session.query(QueuedDownload).join(Chapter).join(Series)
+                      .filter(QueuedDownload.state == 'failed'))
+            if alias:
+                failed = failed.filter(Series.alias == alias)
+            for entry in failed:
+                entry.attempts = 0
+                entry.state = 'queued'
+        session.commit()
+        return len(chapters)
+
+    def fail(self, error):
+        """Records a failed download of the entry, which is queued again
+        until it has failed `queue_attempts` times.
+        """
+        self.attempts += 1
+        self.last_error = error
+        if self.attempts >= config.get().queue_attempts:
+            self.state = 'failed'
+        else:
+            self.state = 'queued'
+
+    @staticmethod
+    def recover():
+        """Queues again the entries left running by a download that was
+        interrupted. Must not be called while another download is working
+        through the queue.
+        """
+        (session.query(QueuedDownload)
+         .filter(QueuedDownload.state == 'running')
+         .update({QueuedDownload.state: 'queued'}))
+        session.commit()
+
+
+def _set_pragmas(connection, record):
+    """Applies the `database_journal_mode`, `database_synchronous` and
+    `database_cache_size` settings to a new SQLite connection. In WAL mode
+    readers do not block the writer, and with synchronous set to normal a
+    commit no longer waits for the disk; the database stays consistent, but
+    the last commits can be lost on a power failure.
+    """
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA journal_mode = {}'
+                   .format(config.get().database_journal_mode))
+    cursor.execute('PRAGMA synchronous = {}'
+                   .format(config.get().database_synchronous))
+    # Negative sizes are in KiB rather than in pages.
+    cursor.execute('PRAGMA cache_size = -{:d}'
+                   .format(config.get().database_cache_size))
+    cursor.close()
+
 
 def backup_database():
-    """Backs up the database file to a file called cu2.db.bak."""
+    """Backs up the database file to a file called cu2.db.bak. The write-ahead
+    log is merged into the database file first, so that the backup holds
+    every commit.
+    """
     db_path = os.path.join(config.cu2_dir, 'cu2.db')
     backup_path = os.path.join(config.cu2_dir, 'cu2.db.bak')
+    with engine.connect() as connection:
+        connection.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
     copyfile(db_path, backup_path)
 
 
 def initialize():
-    global db_path, engine, session
+    """Opens the database, creating it if needed. `session` is a
+    scoped_session, which gives every thread its own session; threads other
+    than the main thread call `Session.remove()` once they are done with the
+    database. Writers that find the database locked wait for up to
+    `database_timeout` seconds.
+    """
+    global db_path, engine, session, Session
+    if Session is not None:
+        Session.remove()
     db_path = os.path.join(config.cu2_dir, 'cu2.db')
     db_url = sqlalchemy.engine.url.URL.create('sqlite', database=db_path)
-    engine = create_engine(db_url)
+    engine = create_engine(db_url, connect_args={
+        'timeout': config.get().database_timeout
+    })
+    event.listen(engine, 'connect', _set_pragmas)
     if not os.path.exists(db_path):
         Base.metadata.create_all(bind=engine)
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    factory = sessionmaker(bind=engine)
+    # Groups inserted in a transaction that is rolled back no longer exist.
+    event.listen(factory, 'after_soft_rollback',
+                 lambda session, previous: session.info.pop('groups', None))
+    session = Session = scoped_session(factory)
+
+
+def release_interval(release_dates, now=None):
+    """Returns the release interval of the series with the release dates,
+    as described in Series.release_interval. The current time can be given
+    as `now`.
+    """
+    release_dates = sorted(release_dates + [now or datetime.datetime.now()])
+    intervals = []
+    for i in range(len(release_dates) - 1):
+        interval = (release_dates[i+1] - release_dates[i]).total_seconds()
+        if interval > 60:
+            intervals.append(interval)
+    if len(intervals) == 0:
+        average_seconds = 0
+    elif len(intervals) == 1:
+        average_seconds = intervals[0]
+    else:
+        mean = float(sum(intervals)) / len(intervals)
+        devsum = sum((x - mean) ** 2 for x in intervals)
+        dev = sqrt(float(devsum) / len(intervals))
+        average_seconds = max((mean - dev/2), 0)
+    return datetime.timedelta(seconds=average_seconds)
 
 
 def test_database():
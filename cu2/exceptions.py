@@ -16,6 +16,13 @@ class LoginError(Cu2Exception):
     pass
 
 
+class NotModified(Cu2Exception):
+    """Exception that is thrown when a series page has not changed since the
+    last update, as told by the site answering a conditional request with 304.
+    """
+    pass
+
+
 class ScrapingError(Cu2Exception):
     pass
 
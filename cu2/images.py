@@ -0,0 +1,91 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from cu2 import archive, config, output, parsing
+from tempfile import SpooledTemporaryFile
+import atexit
+import io
+import threading
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+_lock = threading.Lock()
+_pool = None
+_warned = False
+
+
+def _webp_to_png(data):
+    """Decodes a WebP image and returns it encoded as PNG. Runs in the image
+    conversion processes, so it only takes and returns bytes.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        png = io.BytesIO()
+        image.save(png, 'PNG')
+    return png.getvalue()
+
+
+def close():
+    """Shuts down the image conversion processes if they have been started."""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def convert_webp(page_num, f):
+    """Converts the WebP page in the file object `f` into PNG in the image
+    conversion processes. Returns a concurrent.futures.Future for the number
+    of the page, the file extension and the file handle, as
+    page_postprocess does. Pages that cannot be decoded are kept as WebP.
+    """
+    f.seek(0)
+    conversion = pool().submit(_webp_to_png, f.read())
+    future = Future()
+
+    def done(conversion):
+        try:
+            png = conversion.result()
+        except Exception as e:
+            output.warning('Could not convert page {} to PNG: {}'
+                           .format(page_num, e))
+            future.set_result((page_num, '.webp', f))
+            return
+        f.close()
+        page = SpooledTemporaryFile(max_size=archive.PAGE_SPOOL_SIZE)
+        page.write(png)
+        future.set_result((page_num, '.png', page))
+    conversion.add_done_callback(done)
+    return future
+
+
+def enabled():
+    """Returns a boolean indicating if WebP pages should be converted into
+    PNG, which is turned on with the `convert_webp` setting. The conversion
+    requires Pillow; without it the pages are kept as WebP after a warning.
+    """
+    global _warned
+    if not config.get().convert_webp:
+        return False
+    if Image is None:
+        if not _warned:
+            output.warning('Converting WebP pages requires Pillow; '
+                           'keeping the pages as WebP')
+            _warned = True
+        return False
+    return True
+
+
+def pool():
+    """Returns the shared pool of image conversion processes, starting it if
+    needed. The number of processes is set by the `image_workers` setting and
+    defaults to the number of CPUs.
+    """
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(config.get().image_workers,
+                                        mp_context=parsing.mp_context())
+            atexit.register(close)
+        return _pool
@@ -0,0 +1,129 @@
+from cu2 import config
+import hashlib
+import json
+import os
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_atomic(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path),
+                                     delete=False) as temporary:
+        temporary.write(text)
+    os.replace(temporary.name, path)
+
+
+def blob_path(digest):
+    """Returns the path of the page with the SHA-256 `digest`."""
+    return os.path.join(directory(), 'blobs', digest[:2], digest)
+
+
+def directory():
+    """Returns the directory of the page cache, which can be set with the
+    `page_cache_directory` setting.
+    """
+    cache_directory = config.get().page_cache_directory
+    if cache_directory:
+        return os.path.expanduser(cache_directory)
+    return os.path.join(config.cu2_dir, 'pages')
+
+
+def enabled():
+    """Returns a boolean indicating if the page cache is turned on with the
+    `page_cache` setting.
+    """
+    return config.get().page_cache
+
+
+def evict():
+    """Removes the least recently used pages until the cache fits into the
+    `page_cache_size` setting (in megabytes). Keys of removed pages are left
+    behind and cleaned up the next time they are looked up.
+    """
+    blobs = os.path.join(directory(), 'blobs')
+    if not os.path.isdir(blobs):
+        return
+    pages = []
+    for root, dirs, files in os.walk(blobs):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            pages.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for mtime, size, path in pages)
+    limit = config.get().page_cache_size * 1024 * 1024
+    for mtime, size, path in sorted(pages):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def key_path(key):
+    """Returns the path of the file which points the key to a page."""
+    name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(directory(), 'keys', name[:2], name)
+
+
+def load(key):
+    """Returns the file extension and an open file of the page cached for
+    the key, or None if the page is not cached. Pages whose contents do not
+    match the hash recorded when they were cached are removed.
+    """
+    path = key_path(key)
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+        page = open(blob_path(entry['sha256']), 'rb')
+    except (FileNotFoundError, KeyError, ValueError):
+        _remove(path)
+        return None
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: page.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    if digest.hexdigest() != entry['sha256']:
+        page.close()
+        _remove(blob_path(entry['sha256']))
+        _remove(path)
+        return None
+    # Touching the page marks it as recently used for the eviction.
+    os.utime(page.name)
+    page.seek(0)
+    return entry['ext'], page
+
+
+def store(key, ext, f):
+    """Copies the page from the file object `f` into the cache under the key.
+    Identical pages stored under different keys are kept only once.
+    """
+    f.seek(0)
+    digest = hashlib.sha256()
+    # Pages are written under the temporary directory first, so that the
+    # eviction never sees a page which is still being written.
+    temporary_directory = os.path.join(directory(), 'tmp')
+    os.makedirs(temporary_directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=temporary_directory,
+                                     delete=False) as temporary:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            temporary.write(chunk)
+    f.seek(0)
+    path = blob_path(digest.hexdigest())
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temporary.name, path)
+    _write_atomic(key_path(key), json.dumps({'ext': ext,
+                                             'sha256': digest.hexdigest()}))
@@ -0,0 +1,63 @@
+from concurrent.futures import ProcessPoolExecutor
+from cu2 import config, profiling
+import atexit
+import multiprocessing
+import threading
+
+_lock = threading.Lock()
+_pool = None
+
+
+def close():
+    """Shuts down the parse processes if they have been started."""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def enabled():
+    """Returns a boolean indicating if series pages should be parsed in the
+    parse processes, which is turned on with the `parse_processes` setting.
+    """
+    return config.get().parse_processes
+
+
+def mp_context():
+    """Returns the multiprocessing context of the process pools. The pools
+    are started from a process that already runs threads, which a forked
+    child could inherit locks from in an acquired state, so the processes
+    are started by a fork server, or spawned where there is none. The
+    functions run in the pools must therefore be importable.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def pool():
+    """Returns the shared pool of parse processes, starting it if needed. The
+    number of processes is set by the `parse_workers` setting and defaults to
+    the number of CPUs.
+    """
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(config.get().parse_workers,
+                                        mp_context=mp_context())
+            atexit.register(close)
+        return _pool
+
+
+def run(function, *args):
+    """Calls the function with the arguments and returns its result. With
+    `parse_processes` set the call is made in the parse processes, so the
+    function must be defined at the top level of a module, its arguments and
+    its result must be picklable, and the calling thread waits for it without
+    holding the GIL.
+    """
+    if not enabled():
+        return function(*args)
+    with profiling.phase('parse'):
+        return pool().submit(function, *args).result()
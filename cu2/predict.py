@@ -0,0 +1,177 @@
+"""Predictors of the next release of a series, which decide when
+`cu2 update --fast` checks the series again. A predictor is given the sorted
+times at which chapters of the series have been added and returns the time
+of the next check. The predictor is chosen with the `release_predictor`
+setting:
+
+    always        every update
+    interval      the last release plus the mean interval between releases,
+                  less half of its standard deviation
+    pattern       the weighted median interval between batches of releases,
+                  with recent batches weighing more, snapped to the weekday
+                  on which the series usually releases
+
+The predictors can be compared on the history in the database with
+`cu2 evaluate-predictors`.
+"""
+from cu2 import output
+import datetime
+
+DAY = datetime.timedelta(days=1)
+HOUR = datetime.timedelta(hours=1)
+
+_warned = False
+
+
+class Predictor(object):
+    """Base class of the predictors."""
+    name = None
+
+    def predict(self, release_dates, now):
+        """Returns the time from which the series with the sorted release
+        dates should be checked again, or None if it should always be
+        checked.
+        """
+        raise NotImplementedError
+
+
+class AlwaysPredictor(Predictor):
+    """Checks the series on every update."""
+    name = 'always'
+
+    def predict(self, release_dates, now):
+        return None
+
+
+class IntervalPredictor(Predictor):
+    """Checks the series again once the release interval has passed since
+    the last release, as described in Series.release_interval.
+    """
+    name = 'interval'
+
+    def predict(self, release_dates, now):
+        from cu2.db import release_interval
+
+        if not release_dates:
+            return None
+        return release_dates[-1] + release_interval(list(release_dates), now)
+
+
+class PatternPredictor(Predictor):
+    """Predicts the next release from the batches of releases of the series.
+
+    Releases less than `batch_window` apart count as a single batch, so that
+    a series uploaded a dozen chapters at a time is not mistaken for a daily
+    series. The next batch is expected after the median of the intervals
+    between batches, where each interval weighs half as much for every
+    `half_life` that has passed since it. Series that release on the same
+    weekday for `weekday_share` of the weight are expected on that weekday.
+
+    Checks start `tolerance` of the interval before the expected release, up
+    to a day. Once the release is overdue, the series is checked again after
+    half of the time it has been overdue, which is at least an hour and at
+    most the interval.
+    """
+    name = 'pattern'
+    batch_window = datetime.timedelta(hours=12)
+    half_life = datetime.timedelta(days=180)
+    tolerance = 0.2
+    weekday_share = 0.6
+
+    def batches(self, release_dates):
+        """Returns the time of the first release of each batch."""
+        batches = []
+        last = None
+        for release_date in release_dates:
+            if last is None or release_date - last > self.batch_window:
+                batches.append(release_date)
+            last = release_date
+        return batches
+
+    def predict(self, release_dates, now):
+        batches = self.batches(release_dates)
+        if len(batches) < 2:
+            return None
+        intervals = []
+        for previous, batch in zip(batches, batches[1:]):
+            weight = 0.5 ** ((now - batch) / self.half_life)
+            intervals.append((batch - previous, weight))
+        interval = weighted_median(intervals)
+        expected = batches[-1] + interval
+        if interval >= 5 * DAY:
+            weekdays = {}
+            for batch, (_, weight) in zip(batches[1:], intervals):
+                weekdays[batch.weekday()] = (weekdays.get(batch.weekday(), 0)
+                                             + weight)
+            weekday = max(weekdays, key=weekdays.get)
+            if weekdays[weekday] >= (self.weekday_share *
+                                     sum(weekdays.values())):
+                # Move to the nearest day with the usual weekday.
+                shift = (weekday - expected.weekday() + 3) % 7 - 3
+                expected += shift * DAY
+        start = expected - min(interval * self.tolerance, DAY)
+        if start > now:
+            return start
+        return now + min(max((now - start) / 2, HOUR), interval)
+
+
+PREDICTORS = {x.name: x for x in (AlwaysPredictor, IntervalPredictor,
+                                   PatternPredictor)}
+
+
+def evaluate(predictor, release_dates, cadence, warmup=3):
+    """Replays the release history of a series with the predictor, checking
+    the series every `cadence` when the predictor lets it. Returns the
+    number of checks made and the delays with which the releases after the
+    first `warmup` releases, and the releases that the same update would
+    have found, are found. As cu2 records the time at which a chapter is
+    found rather than released, found chapters join the history at the time
+    of the check that found them.
+    """
+    index = warmup
+    while index < len(release_dates) and (release_dates[index] -
+                                          release_dates[index - 1] <= cadence):
+        index += 1
+    history = list(release_dates[:index])
+    now = history[-1] if history else None
+    checks = 0
+    delays = []
+    while index < len(release_dates):
+        next_check = predictor.predict(history, now)
+        ticks = 1
+        if next_check is not None and next_check > now:
+            ticks = max(-(-(next_check - now) // cadence), 1)
+        now += ticks * cadence
+        checks += 1
+        while index < len(release_dates) and release_dates[index] <= now:
+            delays.append(now - release_dates[index])
+            history.append(now)
+            index += 1
+    return checks, delays
+
+
+def get(name):
+    """Returns an instance of the predictor with the name. Unknown names fall
+    back to the interval predictor after a warning.
+    """
+    global _warned
+    try:
+        return PREDICTORS[name]()
+    except KeyError:
+        if not _warned:
+            output.warning('Unknown release predictor "{}"; using "interval"'
+                           .format(name))
+            _warned = True
+        return IntervalPredictor()
+
+
+def weighted_median(values):
+    """Returns the weighted median of a list of (value, weight) tuples."""
+    values = sorted(values, key=lambda x: x[0])
+    half = sum(weight for _, weight in values) / 2
+    total = 0
+    for value, weight in values:
+        total += weight
+        if total >= half:
+            return value
+    return values[-1][0]
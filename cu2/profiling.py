@@ -0,0 +1,293 @@
+"""Records where the time of a cu2 command goes. Profiling is turned on with
+the `--profile` option or the CU2_PROFILE environment variable, after which
+the wall and CPU time of each phase is recorded per host and per series. The
+phases are:
+
+    http          sending a request and receiving the response headers
+    parse         building a BeautifulSoup tree
+    db query      executing an SQL statement
+    db commit     committing a database session, including its flush
+    page write    receiving a page body into a temporary file
+    archive       writing pages into a chapter archive
+
+Phases may nest, e.g. the queries of a flush are also counted in their
+commit. A summary is printed when the process exits and the data is written
+as JSON, optionally together with cProfile statistics and tracemalloc
+allocations.
+"""
+from contextlib import contextmanager
+import atexit
+import click
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+KINDS = {'host': 'hosts', 'series': 'series'}
+
+_context = threading.local()
+_enabled = False
+_lock = threading.Lock()
+_options = {}
+_parse_init = None
+_profilers = []
+_started = None
+_stats = {}
+
+
+def _after_commit(session):
+    start = getattr(_context, 'commit', None)
+    if start:
+        _context.commit = None
+        record('db commit', time.perf_counter() - start[0],
+               time.thread_time() - start[1])
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start = getattr(_context, 'query', None)
+    if start:
+        _context.query = None
+        record('db query', time.perf_counter() - start[0],
+               time.thread_time() - start[1])
+
+
+def _before_commit(session):
+    _context.commit = (time.perf_counter(), time.thread_time())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    _context.query = (time.perf_counter(), time.thread_time())
+
+
+def _listeners():
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.orm import Session
+
+    return [(Engine, 'after_cursor_execute', _after_cursor_execute),
+            (Engine, 'before_cursor_execute', _before_cursor_execute),
+            (Session, 'after_commit', _after_commit),
+            (Session, 'before_commit', _before_commit)]
+
+
+def _patch_parser():
+    """Wraps the BeautifulSoup constructor, which does all of the HTML
+    parsing, in the 'parse' phase.
+    """
+    global _parse_init
+    from bs4 import BeautifulSoup
+
+    _parse_init = BeautifulSoup.__init__
+
+    def __init__(self, *args, **kwargs):
+        with phase('parse'):
+            _parse_init(self, *args, **kwargs)
+    BeautifulSoup.__init__ = __init__
+
+
+def _profile_thread(frame, event, arg):
+    """Starts a profiler for each thread on its first profiling event, since
+    a cProfile profiler only sees the thread it was enabled in.
+    """
+    profiler = cProfile.Profile()
+    with _lock:
+        _profilers.append(profiler)
+    profiler.enable()
+
+
+def _restore_parser():
+    global _parse_init
+    from bs4 import BeautifulSoup
+
+    BeautifulSoup.__init__ = _parse_init
+    _parse_init = None
+
+
+def _table(title, rows):
+    lines = ['{:<40} {:>8} {:>10} {:>10}'.format(title, 'count', 'wall (s)',
+                                                  'cpu (s)')]
+    for name, (count, wall, cpu) in rows:
+        lines.append('{:<40} {:>8} {:>10.3f} {:>10.3f}'
+                     .format(str(name)[:40], count, wall, cpu))
+    return lines
+
+
+def call_in_series(alias, function, *args, **kwargs):
+    """Calls the function with the time spent in it attributed to the series
+    with the alias. Used for work submitted to thread pools.
+    """
+    with series(alias):
+        return function(*args, **kwargs)
+
+
+def data():
+    """Returns the recorded data as a dictionary."""
+    with _lock:
+        stats = dict(_stats)
+    result = {'wall': time.perf_counter() - _started if _started else 0,
+              'phases': {}, 'hosts': {}, 'series': {}}
+    for (kind, key, name), (count, wall, cpu) in sorted(stats.items()):
+        entry = {'count': count, 'wall': wall, 'cpu': cpu}
+        if kind == 'phase':
+            result['phases'][name] = entry
+        else:
+            result[KINDS[kind]].setdefault(key, {})[name] = entry
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        result['memory'] = {
+            'current': current, 'peak': peak,
+            'top': [{'location': str(stat.traceback[0]), 'size': stat.size,
+                     'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:25]]
+        }
+    return result
+
+
+def disable():
+    """Turns profiling off and discards the recorded data."""
+    global _enabled, _started
+    if not _enabled:
+        return
+    from sqlalchemy import event
+
+    _enabled = False
+    for target, name, function in _listeners():
+        event.remove(target, name, function)
+    _restore_parser()
+    threading.setprofile(None)
+    with _lock:
+        for profiler in _profilers:
+            profiler.disable()
+        _profilers.clear()
+        _stats.clear()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _started = None
+
+
+def enable(output=None, python=False, memory=False):
+    """Turns profiling on. The data is written into `output` when the
+    process exits. With `python` every thread is also profiled with cProfile,
+    and with `memory` allocations are traced with tracemalloc.
+    """
+    global _enabled, _started
+    if _enabled:
+        return
+    from sqlalchemy import event
+
+    _enabled = True
+    _options.update(output=output, python=python, memory=memory)
+    _started = time.perf_counter()
+    for target, name, function in _listeners():
+        event.listen(target, name, function)
+    _patch_parser()
+    if memory:
+        tracemalloc.start()
+    if python:
+        threading.setprofile(_profile_thread)
+        _profile_thread(None, None, None)
+    atexit.register(report)
+
+
+def enabled():
+    """Returns a boolean indicating if profiling is turned on."""
+    return _enabled
+
+
+@contextmanager
+def phase(name, host=None, series=None):
+    """Records the time spent in the block under the phase. The series
+    defaults to the one set for the current thread with `series`.
+    """
+    if not _enabled:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - wall, time.thread_time() - cpu,
+               host=host, series=series)
+
+
+def record(name, wall, cpu=0, host=None, series=None):
+    """Records `wall` and `cpu` seconds spent in the phase."""
+    if not _enabled:
+        return
+    if series is None:
+        series = getattr(_context, 'series', None)
+    keys = [('phase', None)]
+    if host:
+        keys.append(('host', host))
+    if series:
+        keys.append(('series', series))
+    with _lock:
+        for kind, key in keys:
+            entry = _stats.setdefault((kind, key, name), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += wall
+            entry[2] += cpu
+
+
+def report():
+    """Prints a summary of the recorded data and writes the data into the
+    output file. The cProfile statistics are written next to it with the
+    extension '.pstats'.
+    """
+    if not _enabled:
+        return
+    from cu2 import config
+
+    output = _options['output'] or os.path.join(config.cu2_dir,
+                                                'profile.json')
+    result = data()
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    if _options['python']:
+        threading.setprofile(None)
+        with _lock:
+            profilers = list(_profilers)
+        for profiler in profilers:
+            profiler.disable()
+        stats = pstats.Stats(*profilers)
+        stats.dump_stats(os.path.splitext(output)[0] + '.pstats')
+
+    def totals(entries):
+        return [sum(x[field] for x in entries.values())
+                for field in ('count', 'wall', 'cpu')]
+
+    lines = ['Profile ({:.3f} s)'.format(result['wall']), '']
+    lines += _table('phase', [(name, (x['count'], x['wall'], x['cpu']))
+                              for name, x in result['phases'].items()])
+    for kind, key in sorted(KINDS.items()):
+        rows = sorted(((name, totals(entries))
+                       for name, entries in result[key].items()),
+                      key=lambda x: -x[1][1])
+        if rows:
+            lines += [''] + _table(kind, rows[:10])
+    if 'memory' in result:
+        lines += ['', 'peak traced memory {:.1f} MiB'
+                      .format(result['memory']['peak'] / 1024 / 1024)]
+        for stat in result['memory']['top'][:10]:
+            lines.append('{:>10.1f} KiB  {}'.format(stat['size'] / 1024,
+                                                   stat['location']))
+    lines += ['', 'Profile data written to {}'.format(output)]
+    click.echo('\n'.join(lines), err=True)
+
+
+@contextmanager
+def series(alias):
+    """Attributes the time recorded in the current thread inside the block to
+    the series with the alias.
+    """
+    previous = getattr(_context, 'series', None)
+    _context.series = alias
+    try:
+        yield
+    finally:
+        _context.series = previous
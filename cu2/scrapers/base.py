@@ -1,53 +1,156 @@
 from abc import ABCMeta, abstractmethod
-from concurrent.futures import ThreadPoolExecutor
-from cu2 import config, db, exceptions, output
+from bs4 import BeautifulSoup, SoupStrainer
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from cu2 import (aio, archive, config, db, exceptions, images, output,
+                 pagecache, parsing, profiling, sessions)
+from functools import lru_cache
 from mimetypes import guess_extension
-from re import match, sub
+from re import findall, match, MULTILINE, sub
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound
-from tempfile import NamedTemporaryFile
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlparse
 import click
+import json
 import os
-import requests, requests.adapters
+import requests
 import sys
-import zipfile
+import threading
+import time
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+
+class PagePool(object):
+    """Thread pool shared by every chapter download, acting as one global
+    budget for in-flight pages. Tasks are queued per host and the workers
+    serve the hosts in turn, so pages from a slow host cannot hold back the
+    pages of chapters that are downloading from other sites at the same time.
+
+    The interface mirrors `concurrent.futures.Executor.submit`, with an
+    additional optional `host` keyword argument naming the queue.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._condition = threading.Condition()
+        self._idle = 0
+        self._queues = OrderedDict()
+        self._threads = []
+
+    def _next_task(self):
+        """Blocks until a task is available and returns the task of the host
+        that has waited the longest. Hosts with remaining tasks are moved to
+        the back of the rotation.
+        """
+        with self._condition:
+            self._idle += 1
+            while not self._queues:
+                self._condition.wait()
+            self._idle -= 1
+            host, queue = self._queues.popitem(last=False)
+            task = queue.popleft()
+            if queue:
+                self._queues[host] = queue
+            return task
+
+    def _worker(self):
+        while True:
+            future, fn, args, kwargs = self._next_task()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def submit(self, fn, *args, **kwargs):
+        host = kwargs.pop('host', None)
+        future = Future()
+        with self._condition:
+            queue = self._queues.setdefault(host, deque())
+            queue.append((future, fn, args, kwargs))
+            if not self._idle and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._worker, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._condition.notify()
+        return future
 
 
-download_pool = ThreadPoolExecutor(config.get().download_threads)
+download_pool = PagePool(config.get().download_threads)
 
 
 class BaseSeries(metaclass=ABCMeta):
     """Class that is used to represent an individual series on a site."""
+    # Set by scrapers whose iter_chapters() yields the newest chapters first
+    # and stops at the watermark of the last update.
+    newest_first = False
 
     def __init__(self, url, **kwargs):
         self.url = url
         self.directory = kwargs.get('directory', None)
-        self.req_session = requests.Session()
-        self.req_session.mount('https://',
-            requests.adapters.HTTPAdapter(
-                max_retries = requests.adapters.Retry(
-                    total = 5, backoff_factor = 2, status_forcelist = [ 502, 503, 504 ]
-                )
-            )
-        )
-
-    def __del__(self):
-        if hasattr(self, "req_session"):
-            self.req_session.close()
+        self.etag = kwargs.get('etag', None)
+        self.last_modified = kwargs.get('last_modified', None)
+        self.req_session = sessions.get(url)
+        self.updates = None
 
     @property
     def alias(self):
         """Returns an alias version of the series name, which only allows a
-        certain command-line friendly set of characters.
+        certain command-line friendly set of characters. The alias is
+        remembered for as long as the series name does not change.
         """
-        allowed_re = r'[A-Za-z0-9\-\s]'
+        name = self.name
+        cached = getattr(self, '_alias', None)
+        if cached and cached[0] == name:
+            return cached[1]
 
         # Take the series name, lowercase it, replace all spaces with dashes
         # and then replaces all repeating dashes with a single dash.
-        name = sub('-+', '-', self.name.lower().replace(' ', '-'))
-
-        # Return the string where all characters are matched to allowed_re.
-        return ''.join(c for c in name if match(allowed_re, c))
+        alias = sub('-+', '-', name.lower().replace(' ', '-'))
+
+        # Remove all of the characters that are not allowed in an alias.
+        alias = sub(r'[^A-Za-z0-9\-\s]', '', alias)
+        self._alias = (name, alias)
+        return alias
+
+    def conditional_get(self, url, headers=None):
+        """Requests the series page, sending the `etag` and `last_modified`
+        validators of the last update. Raises NotModified if the site answers
+        that the page has not changed, otherwise remembers the validators of
+        the new page and returns the response.
+        """
+        headers = dict(headers or {})
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        r = self.req_session.get(url, headers=headers)
+        if r.status_code == 304:
+            raise exceptions.NotModified
+        if r.status_code == 200:
+            self.etag = r.headers.get('etag')
+            self.last_modified = r.headers.get('last-modified')
+        return r
+
+    def fetch_updates(self, since=None):
+        """Fetches the chapters which update() saves into `updates`: the
+        chapters newer than the chapter with the URL `since` for scrapers
+        that list the chapters newest first, or else all of the chapters.
+        Called from the worker threads of `cu2 update`, so that the requests
+        for the chapters are not made from the thread saving the updates.
+        """
+        if self.newest_first:
+            self.updates = list(self.iter_chapters(since=since))
+        else:
+            self.updates = self.chapters
 
     def follow(self, ignore=False):
         """Adds the series details to database and all current chapters."""
@@ -69,8 +172,9 @@ class BaseSeries(metaclass=ABCMeta):
                 s.following = True
                 db.session.commit()
 
-        for chapter in self.chapters:
-            chapter.save(s, ignore=ignore)
+        db.Chapter.save_all(s, self.chapters, ignore=ignore)
+        s.schedule()
+        db.session.commit()
 
     @abstractmethod
     def get_chapters(self):
@@ -79,24 +183,77 @@ class BaseSeries(metaclass=ABCMeta):
         """
         raise NotImplementedError
 
+    def iter_chapters(self, since=None):
+        """Yields the chapters of the series. Scrapers that can list the
+        chapters newest first override this to stop before the chapter with
+        the URL `since`, the newest chapter seen by the last update, and set
+        `newest_first`. By default all of the chapters are yielded.
+        """
+        return iter(self.chapters)
+
     @property
     @abstractmethod
     def name(self):
         """Returns a string containing the title of the series."""
         raise NotImplementedError
 
+    def parse(self, text):
+        """Parses the series page with parse_page, in the parse processes if
+        `parse_processes` is set, and returns its result.
+        """
+        return parsing.run(parse_page, type(self), text, html_parser())
+
+    @staticmethod
+    def parse_page(text, parser):
+        """Parses the text of the series page with the BeautifulSoup parser
+        and returns a dictionary with the 'name' of the series and the keyword
+        arguments of its 'chapters', without their names and aliases. Runs in
+        the parse processes, so it may only take and return plain data.
+        Implemented by the scrapers which parse HTML pages.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def recent_updates(cls, since, urls):
+        """Returns the set of the series URLs in `urls` which may have
+        changed on the site since `since`, a naive datetime in local time, or
+        None if the site cannot tell, in which case all of the series are
+        updated. Sites with a listing of recent updates override this to check
+        many series in a few requests.
+        """
+        return None
+
     def update(self):
-        """Iterates through the currently available chapters and saves them in
-        the database.
+        """Saves the chapters fetched by fetch_updates in the database,
+        fetching them first if that has not been done.
         """
         s = db.session.query(db.Series).filter_by(url=self.url).one()
-        for chapter in self.chapters:
-            chapter.save(s)
+        if self.updates is None:
+            self.fetch_updates(since=s.watermark)
+        chapters = self.updates
+        if self.newest_first and chapters:
+            s.watermark = chapters[0].url
+        db.Chapter.save_all(s, chapters)
+        s.schedule()
+        s.etag = self.etag
+        s.last_modified = self.last_modified
         s.mark_as_updated()
 
 
 class BaseChapter(metaclass=ABCMeta):
     """Class that is used to represent an individual download on a site."""
+    # Set by the chapter scheduler when several chapters are downloaded at the
+    # same time, in which case the progress bars would garble each other.
+    quiet = False
+    # Options of the page pipeline used by download_pages(): extra headers
+    # sent with the page requests, the status with which the site answers
+    # requests for pages that do not exist, the number of times a page request
+    # is retried after a connection error or a server error, and the timeout
+    # of the page requests in seconds.
+    page_headers = None
+    page_missing_status = None
+    page_retries = 0
+    page_timeout = None
 
     def __init__(self, *args, **kwargs):
         self.name = kwargs.get('name')
@@ -106,10 +263,7 @@ class BaseChapter(metaclass=ABCMeta):
         self.url = kwargs.get('url')
         self.groups = kwargs.get('groups', None)
         self.directory = self._strip_unwanted_characters(kwargs.get('directory', None))
-        self.req_session = requests.Session()
-
-    def __del__(self):
-        self.req_session.close()
+        self.req_session = sessions.get(self.url)
 
     def _strip_unwanted_characters(self, path):
         """Strips unwanted characters from paths or filenames."""
@@ -127,6 +281,44 @@ class BaseChapter(metaclass=ABCMeta):
             path = ''.join([path_start, path])
         return path
 
+    def _page_save(self, page_num, r, page_url, f):
+        """Writes the response body of a page request into the file `f`,
+        resuming the download if the connection is killed. Returns the
+        response which finished the download.
+        """
+        retries = 20
+        while retries > 0:
+            try:
+                for chunk in r.iter_content(chunk_size=4096):
+                    if chunk:
+                        f.write(chunk)
+                retries = 0
+            # basically ignores this exception that requests throws.  my
+            # understanding is that it is raised when you attempt to iter_content()
+            # over the same content twice.  don't understand how that situation
+            # arises with the current code but it did somehow.
+            # https://stackoverflow.com/questions/45379903/
+            except requests.exceptions.StreamConsumedError:
+                pass
+            # when under heavy load, Mangadex will often kill the connection in
+            # the middle of an image download.  in the original architecture,
+            # the requests are all opened in the scrapers in stream mode, then
+            # the actual image payloads are downloaded in the asynchronous
+            # callbacks.  when this occurs we have no choice but to re-request
+            # the image, but if the server supports range requests only the
+            # missing tail of the image is requested again.
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ReadTimeout):
+                if not page_url:
+                    output.error("Connection killed on page {} but scraper does not support retries".format(str(page_num)))
+                    raise exceptions.ScrapingError
+                output.warning("Connection killed on page {}, {} retries remaining".format(str(page_num), str(retries)))
+                retries = retries - 1
+                if retries <= 0:
+                    output.error("Connection killed on page {}, no retries remaining - aborting chapter".format(str(page_num)))
+                    raise exceptions.ScrapingError
+                r = self.page_resume_request(r, page_url, f)
+        return r
+
     def _windows_name_directory(self, directory):
         """Perform additional sanitization to ensure that the directory name
         complies with Windows naming conventions.
@@ -154,31 +346,19 @@ class BaseChapter(metaclass=ABCMeta):
         created.
         """
         if not os.path.exists(directory):
+            # Chapters of the same series may be downloaded at the same time,
+            # so the directory can appear between the check and the creation.
             try:
-                os.makedirs(directory)
+                os.makedirs(directory, exist_ok=True)
             except OSError as error:
                 if error.errno == 22:
                     # Path is invalid, most likely due to Windows naming rules.
                     directory = self._windows_name_directory(directory)
-                    if not os.path.exists(directory):
-                        os.makedirs(directory)
+                    os.makedirs(directory, exist_ok=True)
                 else:
                     raise error
         return directory
 
-    def create_zip(self, files):
-        """Takes a list of named temporary files, makes a ZIP out of them and
-        closes the temporary files, deleting them. Files inside the .zip are
-        organized based on the list order with rolling numbering padded to six
-        digits and with the prefix 'image'.
-        """
-        with zipfile.ZipFile(self.filename, 'w') as z:
-            for num, f in enumerate(files):
-                root, ext = os.path.splitext(f.name)
-                z.write(f.name, 'img{num:0>6}{ext}'.format(num=num, ext=ext))
-                f.close()
-                os.remove(f.name)
-
     def db_remove(self):
         """Removes the chapter from the database."""
         c = db.session.query(db.Chapter).filter_by(url=self.url).one()
@@ -195,6 +375,35 @@ class BaseChapter(metaclass=ABCMeta):
         """
         raise NotImplementedError
 
+    def download_pages(self, pages):
+        """Downloads the pages with the URLs in `pages` into the chapter
+        archive. The pages are downloaded by the engine chosen with the
+        `download_engine` setting: either the shared page download pool, or
+        the asyncio engine in cu2.aio.
+        """
+        with self.progress_bar(pages) as bar, \
+                self.open_archive(len(pages)) as chapter_archive:
+            futures = []
+            for i, page in enumerate(pages):
+                if i in chapter_archive.resumed:
+                    continue
+                future = self.page_submit(chapter_archive, i, page)
+                if future:
+                    futures.append(future)
+            self.page_download_finish(bar, chapter_archive, futures)
+
+    def fetch(self):
+        """Downloads the chapter if it is available. Returns a boolean value
+        indicating whether the chapter was available or not.
+
+        Does not touch the database, which allows the method to be run from
+        the worker threads of the chapter scheduler.
+        """
+        if not self.available():
+            return False
+        self.download()
+        return True
+
     @property
     def filename(self):
         name = self.name.replace('/', '')
@@ -276,8 +485,7 @@ class BaseChapter(metaclass=ABCMeta):
         Optionally does not attempt to remove the chapter from the database or
         mark the chapter as downloaded if `db_remove` is set to False.
         """
-        if self.available():
-            self.download()
+        if self.fetch():
             if use_db:
                 self.mark_downloaded()
         elif use_db:
@@ -311,64 +519,200 @@ class BaseChapter(metaclass=ABCMeta):
         c.downloaded = 0
         db.session.commit()
 
+    def open_archive(self, length):
+        """Returns a ChapterArchive for the chapter filename which expects
+        `length` pages. Pages kept from an earlier failed download of the
+        chapter are listed in the `resumed` attribute of the archive.
+        """
+        return archive.ChapterArchive(self.filename, length,
+                                      journal=archive.journal_path(self.url))
+
     @staticmethod
-    def page_download_finish(bar, files, fs):
-        """Callback functions for page_download_task futures, assigning the
-        resulting filehandles to the right index in the array and updating
-        the progress bar.
+    def page_download_finish(bar, chapter_archive, futures):
+        """Waits for the page_download_task futures, writing each page into
+        the chapter archive as soon as it finishes and updating the progress
+        bar. Futures may resolve to another future when the page is handed
+        on to a later stage, such as the image conversion, in which case the
+        page is written once that future finishes. If a page download fails,
+        the remaining pages are still collected so that they can be kept in
+        the page journal, after which the first exception is raised.
+        """
+        bar.update(len(chapter_archive.resumed))
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                    if isinstance(result, Future):
+                        pending.add(result)
+                        continue
+                    # Pages which do not exist have already been skipped.
+                    if result is not None:
+                        chapter_archive.add(*result)
+                except Exception as e:
+                    error = error or e
+                else:
+                    bar.update(1)
+        if error:
+            raise error
+
+    def page_download_task(self, page_num, r, page_url = None):
+        """Saves the response body of a single request, returning the passed
+        through number of the page, the file extension and the file handle to
+        allow for non-sequential downloads in parallel.
+        """
+        ext = BaseChapter.page_extension(r.headers.get('content-type'),
+                                         page_url)
+        f = SpooledTemporaryFile(max_size=archive.PAGE_SPOOL_SIZE)
+        start = time.time()
+        try:
+            with profiling.phase('page write',
+                                 host=urlparse(page_url or r.url).netloc,
+                                 series=self.alias):
+                r = self._page_save(page_num, r, page_url, f)
+        except Exception:
+            self.page_report(page_url, False, f.tell(), time.time() - start,
+                             r.headers)
+            f.close()
+            raise
+        r.close()
+        self.page_report(page_url, True, f.tell(), time.time() - start,
+                         r.headers)
+        if page_url and pagecache.enabled():
+            pagecache.store(self.page_cache_key(page_url), ext, f)
+        return self.page_postprocess(page_num, ext, f)
+
+    def page_cache_key(self, page_url):
+        """Returns the key of the page in the page cache. Sites which serve
+        the same page from changing URLs should return a key that stays the
+        same.
         """
-        index, f = fs.result()
-        files[index] = f
-        bar.update(1)
+        return page_url
 
     @staticmethod
-    def page_download_task(page_num, r, page_url = None):
-        """Saves the response body of a single request, returning the file
-        handle and the passed through number of the page to allow for non-
-        sequential downloads in parallel.
+    def page_extension(content_type, page_url):
+        """Returns the file extension of a page from the content type of the
+        response.
         """
-        ext = BaseChapter.guess_extension(r.headers.get('content-type'))
+        ext = BaseChapter.guess_extension(content_type)
         # For sites that return content-type application/octet-stream, fall
         # back to extension from URL
         if ext == ".bin":
             ext = "." + page_url.split(".")[-1]
-        f = NamedTemporaryFile(suffix=ext, delete=False)
-        retries = 20
-        while retries > 0:
+        return ext
+
+    def page_fetch_task(self, chapter_archive, page_num, page_url):
+        """Requests a page with page_request and saves it with
+        page_download_task. Pages that do not exist are skipped in the
+        chapter archive and None is returned.
+        """
+        r = self.page_request(page_num, page_url)
+        if r is None:
+            chapter_archive.skip(page_num)
+            return None
+        return self.page_download_task(page_num, r, page_url=page_url)
+
+    def page_postprocess(self, page_num, ext, f):
+        """Called with each downloaded page before it is written into the
+        chapter archive. Returns the number of the page, the file extension
+        and the file handle, which scrapers may replace to convert the page,
+        or a future for them.
+
+        WebP pages are converted into PNG in the image conversion processes
+        if the `convert_webp` setting is turned on.
+        """
+        if ext == '.webp' and images.enabled():
+            return images.convert_webp(page_num, f)
+        return (page_num, ext, f)
+
+    def page_report(self, page_url, success, size, duration, headers):
+        """Called after each page download with the number of bytes received,
+        the duration in seconds and the response headers. Does nothing unless
+        the site wants to hear about page downloads.
+        """
+        pass
+
+    def page_request(self, page_num, page_url):
+        """Opens a streaming request for a page, retrying it `page_retries`
+        times after connection errors and server errors. Returns None if the
+        site answers with `page_missing_status`.
+        """
+        session = sessions.get(page_url)
+        for attempt in range(self.page_retries + 1):
             try:
-                for chunk in r.iter_content(chunk_size=4096):
-                    if chunk:
-                        f.write(chunk)
-                retries = 0
-            # basically ignores this exception that requests throws.  my
-            # understanding is that it is raised when you attempt to iter_content()
-            # over the same content twice.  don't understand how that situation
-            # arises with the current code but it did somehow.
-            # https://stackoverflow.com/questions/45379903/
-            except requests.exceptions.StreamConsumedError:
-                pass
-            # when under heavy load, Mangadex will often kill the connection in
-            # the middle of an image download.  in the original architecture,
-            # the requests are all opened in the scrapers in stream mode, then
-            # the actual image payloads are downloaded in the asynchronous
-            # callbacks.  when this occurs we have not choice but to re-request
-            # the image from the beginning (easier than playing around with range
-            # headers).  this means each thread may issue multiple new requests.
-            # I have found the performance overhead to be mostly negligible.
-            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ReadTimeout):
-                if not page_url:
-                    output.error("Connection killed on page {} but scraper does not support retries".format(str(page_num)))
-                    raise exceptions.ScrapingError
-                output.warning("Connection killed on page {}, {} retries remaining".format(str(page_num), str(retries)))
-                retries = retries - 1
-                if retries <= 0:
-                    output.error("Connection killed on page {}, no retries remaining - aborting chapter".format(str(page_num)))
-                    raise exceptions.ScrapingError
-                r = self.req_session.get(page_url, stream = True)
-        f.flush()
-        f.close()
+                r = session.get(page_url, headers=self.page_headers,
+                                stream=True, timeout=self.page_timeout)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout):
+                error = 'connection error'
+                continue
+            if r.status_code == 200:
+                return r
+            r.close()
+            if r.status_code == self.page_missing_status:
+                return None
+            error = 'status {}'.format(r.status_code)
+            if r.status_code < 500:
+                break
+        output.error('{}: failed request for page {} due to {}'
+                     .format(self.alias, page_num, error))
+        raise exceptions.ScrapingError
+
+    def page_resume_request(self, r, page_url, f):
+        """Re-requests a page whose download through the response `r` was
+        interrupted, using the same request headers. If the server advertises
+        support for byte ranges, only the part of the page that is missing
+        from the file `f` is requested and the returned response continues
+        where `f` ends. Otherwise, or if the server does not honour the range,
+        `f` is emptied and the returned response contains the whole page.
+        """
         r.close()
-        return((page_num, f))
+        headers = dict(r.request.headers)
+        written = f.tell()
+        # Offsets into content-encoded responses do not match the decoded
+        # bytes that have been written, so those are always restarted.
+        supports_ranges = (
+            r.headers.get('accept-ranges', '').lower() == 'bytes' and
+            r.headers.get('content-encoding', 'identity') == 'identity'
+        )
+        if written and supports_ranges:
+            headers['Range'] = 'bytes={}-'.format(written)
+            resumed = sessions.get(page_url).get(page_url, headers=headers,
+                                                 stream=True)
+            content_range = resumed.headers.get('content-range', '')
+            if (resumed.status_code == 206 and
+                    content_range.startswith('bytes {}-'.format(written))):
+                return resumed
+            if resumed.status_code == 200:
+                # The range was ignored and the whole page is coming again.
+                f.seek(0)
+                f.truncate()
+                return resumed
+            resumed.close()
+            del headers['Range']
+        f.seek(0)
+        f.truncate()
+        return sessions.get(page_url).get(page_url, headers=headers,
+                                          stream=True)
+
+    def page_submit(self, chapter_archive, page_num, page_url):
+        """Starts the download of a page and returns a future for it. The
+        whole request, from opening the connection to saving the body, runs
+        in the page download pool or the asyncio engine, so that the pages of
+        a chapter wait for their first bytes concurrently.
+        """
+        if pagecache.enabled():
+            cached = pagecache.load(self.page_cache_key(page_url))
+            if cached:
+                return download_pool.submit(self.page_postprocess, page_num,
+                                            *cached)
+        if aio.enabled():
+            return aio.submit(self, chapter_archive, page_num, page_url)
+        return download_pool.submit(self.page_fetch_task, chapter_archive,
+                                    page_num, page_url,
+                                    host=urlparse(page_url).netloc)
 
     def progress_bar(self, arg):
         """Returns a pre-configured Click progress bar to use with downloads.
@@ -382,6 +726,8 @@ class BaseChapter(metaclass=ABCMeta):
             iterable = None
             length = arg
 
+        if self.quiet:
+            return SilentProgressBar()
         click.echo('{c.alias} {c.chapter}'.format(c=self))
         return click.progressbar(iterable=iterable, length=length,
                                  fill_char='>', empty_char=' ',
@@ -405,3 +751,65 @@ class BaseChapter(metaclass=ABCMeta):
                     db.session.commit()
                 except IntegrityError:
                     db.session.rollback()
+
+
+class SilentProgressBar(object):
+    """Stand-in for the Click progress bar that does not print anything."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def update(self, n_steps):
+        pass
+
+
+def html_parser():
+    """Returns the name of the BeautifulSoup parser set with `html_parser`.
+    Without the setting, lxml is used if it is installed and html.parser
+    otherwise.
+    """
+    if config.get().html_parser:
+        return config.get().html_parser
+    return 'lxml' if lxml else 'html.parser'
+
+
+def make_soup(text, parse_only=None, parser=None):
+    """Parses the text of a page with the parser, which defaults to the one
+    returned by html_parser. `parse_only` restricts the parse to the matching
+    tags and may be a SoupStrainer or the arguments of one, such as a tag
+    name or a list of them.
+    """
+    if parse_only is not None and not isinstance(parse_only, SoupStrainer):
+        parse_only = SoupStrainer(parse_only)
+    return BeautifulSoup(text, parser or html_parser(), parse_only=parse_only)
+
+
+def parse_page(series_class, text, parser):
+    """Calls parse_page of the series class in the parse processes, which are
+    only sent a reference to the class.
+    """
+    return series_class.parse_page(text, parser)
+
+
+@lru_cache(maxsize=16)
+def script_variables(script, prefix='vm.'):
+    """Returns a dictionary of the variables assigned in the text of a
+    script, one assignment per line, whose names start with the prefix. The
+    values are decoded as JSON where possible and kept as text otherwise.
+    The result is cached, so a page's script is only read once however many
+    of its variables are looked up, and must not be changed.
+    """
+    variables = {}
+    assignments = findall(r'^\s*([A-Za-z_$][\w$.]*)\s*=\s*(.*?);?\s*$',
+                          script, MULTILINE)
+    for name, value in assignments:
+        if not name.startswith(prefix):
+            continue
+        try:
+            variables[name] = json.loads(value)
+        except ValueError:
+            variables[name] = value
+    return variables
@@ -1,10 +1,13 @@
-from cu2.scrapers.base import BaseChapter, BaseSeries, download_pool
-from functools import partial
+from cu2 import sessions
+from cu2.scrapers.base import BaseChapter, BaseSeries
 from urllib.parse import urljoin
-import concurrent.futures
+import datetime
 import re
-import requests
 
+# Listing of the recently added chapters, which is read for at most
+# `added_pages` pages.
+added_pages = 10
+added_url = 'https://dynasty-scans.com/chapters/added.json'
 name_re = re.compile(r'(?P<type>Chapter|Special) (?P<num>[0-9\.]+)(?:$|\: )'
                      r'(?P<title>.*)')
 fallback_re = re.compile(r'(?P<num>.*?)(?:$|\: )(?P<title>.*)')
@@ -19,11 +22,12 @@ class DynastyScansSeries(BaseSeries):
         if url.endswith('/'):
             url = url[:-1]
         jurl = url + '.json'
-        self.json = self.req_session.get(jurl).json()
+        self.json = self.conditional_get(jurl).json()
         self.chapters = self.get_chapters()
 
     def get_chapters(self):
         chapters = []
+        name, alias = self.name, self.alias
         for t in self.json['taggings']:
             if 'permalink' in t and 'title' in t:
                 name_parts = re.search(name_re, t['title'])
@@ -37,7 +41,7 @@ class DynastyScansSeries(BaseSeries):
                 title = name_parts.group('title')
                 url = urljoin('https://dynasty-scans.com/chapters/',
                               t['permalink'])
-                c = DynastyScansChapter(name=self.name, alias=self.alias,
+                c = DynastyScansChapter(name=name, alias=alias,
                                         chapter=chapter, url=url, title=title)
                 chapters.append(c)
         return chapters
@@ -46,6 +50,32 @@ class DynastyScansSeries(BaseSeries):
     def name(self):
         return self.json['name']
 
+    @classmethod
+    def recent_updates(cls, since, urls):
+        """Reads the listing of recently added chapters until a page only has
+        chapters released well before `since`. The listing only has release
+        dates and chapters may be added some time after their release, so a
+        week of margin is kept.
+        """
+        permalinks = {url.rstrip('/').split('/')[-1]: url for url in urls}
+        oldest = (since - datetime.timedelta(days=7)).date().isoformat()
+        changed = set()
+        session = sessions.get(added_url)
+        for page in range(1, added_pages + 1):
+            data = session.get(added_url, params={'page': page}).json()
+            for chapter in data['chapters']:
+                if chapter['released_on'] < oldest:
+                    continue
+                for tag in chapter['tags']:
+                    if (tag['type'] == 'Series' and
+                            tag['permalink'] in permalinks):
+                        changed.add(permalinks[tag['permalink']])
+            if (page >= data['total_pages'] or
+                    all(chapter['released_on'] < oldest
+                        for chapter in data['chapters'])):
+                return changed
+        return None
+
 
 class DynastyScansChapter(BaseChapter):
     url_re = re.compile(r'https?://dynasty-scans\.com/chapters/')
@@ -60,23 +90,13 @@ class DynastyScansChapter(BaseChapter):
         data = self.req_session.get(self.url + '.json').json()
         pages = [urljoin('https://dynasty-scans.com',
                  u['url']) for u in data['pages']]
-        files = [None] * len(pages)
-        futures = []
-        with self.progress_bar(pages) as bar:
-            for i, page in enumerate(pages):
-                r = self.req_session.get(urljoin(self.url, page), stream=True)
-                fut = download_pool.submit(self.page_download_task, i, r)
-                fut.add_done_callback(partial(self.page_download_finish,
-                                              bar, files))
-                futures.append(fut)
-            concurrent.futures.wait(futures)
-            self.create_zip(files)
+        self.download_pages([urljoin(self.url, page) for page in pages])
 
     def from_url(url):
         url = url.replace('http://', 'https://')
         if url.endswith('/'):
             url = url[:-1]
-        j = requests.get(url + '.json').json()
+        j = sessions.get(url).get(url + '.json').json()
         author_link = None
         for t in j['tags']:
             if t['type'] == 'Series':
@@ -1,17 +1,17 @@
 from abc import ABCMeta
 from cu2 import config, exceptions
-from cu2.scrapers.base import BaseChapter, BaseSeries, download_pool
-from functools import partial
+from cu2.scrapers.base import BaseChapter, BaseSeries
 from tempfile import NamedTemporaryFile
 from urllib.parse import urljoin, urlparse
-import concurrent.futures
 import re
 import requests
 
 
 class FoOlSlideSeries(BaseSeries, metaclass=ABCMeta):
-    def __init__(self, url, directory=None, stub=None, use_https=False):
-        super().__init__(url, directory=directory, stub=stub, use_https=use_https)
+    def __init__(self, url, directory=None, stub=None, use_https=False,
+                 **kwargs):
+        super().__init__(url, directory=directory, stub=stub,
+                         use_https=use_https, **kwargs)
         self.url = url
         self.directory = directory
         self.stub = stub
@@ -61,6 +61,7 @@ class FoOlSlideSeries(BaseSeries, metaclass=ABCMeta):
         """
         response = self.req_session.get(self.api_hook_details).json()
         chapters = []
+        name, alias = self.name, self.alias
         for chapter in response['chapters']:
             if int(chapter['chapter']['subchapter']) > 0:
                 chapter_number = '.'.join([chapter['chapter']['chapter'],
@@ -68,8 +69,8 @@ class FoOlSlideSeries(BaseSeries, metaclass=ABCMeta):
             else:
                 chapter_number = chapter['chapter']['chapter']
             kwargs = {
-                'name': self.name,
-                'alias': self.alias,
+                'name': name,
+                'alias': alias,
                 'chapter': chapter_number,
                 'api_id': chapter['chapter']['id'],
                 'url': chapter['chapter']['href'],
@@ -111,17 +112,7 @@ class FoOlSlideChapter(BaseChapter, metaclass=ABCMeta):
     def download(self):
         response = self.req_session.get(self.api_hook_details).json()
         pages = response['pages']
-        files = [None] * len(pages)
-        futures = []
-        with self.progress_bar(pages) as bar:
-            for i, page in enumerate(pages):
-                r = self.req_session.get(page['url'], stream=True)
-                fut = download_pool.submit(self.page_download_task, i, r)
-                fut.add_done_callback(partial(self.page_download_finish,
-                                              bar, files))
-                futures.append(fut)
-            concurrent.futures.wait(futures)
-            self.create_zip(files)
+        self.download_pages([page['url'] for page in pages])
 
     def from_url(url, series_object):
         url = re.search(FoOlSlideChapter.no_pages_re, url).group(1)
@@ -1,7 +1,6 @@
-from bs4 import BeautifulSoup
 from contextlib import closing
 from cu2 import config, exceptions
-from cu2.scrapers.base import BaseChapter, BaseSeries
+from cu2.scrapers.base import BaseChapter, BaseSeries, make_soup
 from urllib.parse import urljoin
 import re
 import requests
@@ -20,7 +19,7 @@ class MadokamiSeries(BaseSeries):
         r = self.req_session.get(url)
         if r.status_code == 401:
             raise exceptions.LoginError('Madokami login error')
-        self.soup = BeautifulSoup(r.text, config.get().html_parser)
+        self.soup = make_soup(r.text)
         self.chapters = self.get_chapters()
 
     def get_chapters(self):
@@ -58,8 +57,7 @@ class MadokamiSeries(BaseSeries):
                 groups = []
 
             c = MadokamiChapter(name=self.name, alias=self.alias,
-                                chapter=chapter, url=url, groups=groups,
-                                session=self.req_session)
+                                chapter=chapter, url=url, groups=groups)
             chapters.append(c)
         return chapters
 
@@ -76,11 +74,6 @@ class MadokamiChapter(BaseChapter):
     url_re = re.compile(r'https://manga\.madokami\.al/Manga/.*/.*/.*\..*')
     uses_pages = False
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.req_session.close()
-        self.req_session = kwargs.get("session", requests.Session())
-
     def download(self):
         if not self.req_session.auth:
             self.req_session.auth = requests.auth.HTTPBasicAuth(*config
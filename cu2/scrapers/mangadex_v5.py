@@ -1,50 +1,53 @@
-from cu2 import config, exceptions, output
-from cu2.scrapers.base import BaseChapter, BaseSeries, download_pool
-import json, re, requests, time, concurrent.futures
-from functools import partial
-from tempfile import NamedTemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+from cu2 import config, exceptions, output, sessions
+from cu2.scrapers.base import BaseChapter, BaseSeries
+import datetime, json, re, requests
 from cu2.version import __version__, __upstream_link__
 
 debug = False
+api_url = 'https://api.mangadex.org/'
+# the feed endpoint returns up to 500 chapters per page
+feed_limit = 500
+page_workers = 4
+report_url = 'https://api.mangadex.network/report'
+# the chapter list accepts up to 100 manga IDs per request
+recent_updates_batch = 100
+# page size of the feed when it is walked newest first on update
+stream_limit = 100
+uuid_re = re.compile(r'[0-9a-fA-F]{8}(-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}')
 
-def _make_api_request(url, session = None, extra_headers = { }):
-    while True:
-        if debug:
-            output.warning("Mangadex API: requesting -> " + url)
-        try:
-            if session:
-                r = session.get('https://api.mangadex.org/' + url.strip('/'), headers = { **MangadexV5Series.headers, **extra_headers })
-            else:
-                r = requests.get('https://api.mangadex.org/' + url.strip('/'), headers = { **MangadexV5Series.headers, **extra_headers })
-        except requests.exceptions.ConnectionError:
-            output.error("Mangadex API: request to endpoint failed: {}".format(url))
-            raise exceptions.ScrapingError
-        if r.status_code == 200:
-            return r
-        elif r.status_code == 429:
-            retry_delay = int(r.headers["retry-after"])
-            output.warning("Mangadex API: wait {} seconds...".format(retry_delay))
-            time.sleep(retry_delay)
-        else:
-            output.error("Mangadex API: got bad status code {}".format(r.status_code))
-            return r
+# rate limiting, including waiting out 429 responses, is done for all requests
+# to the API by the host limiter in cu2.sessions
+def _make_api_request(url, extra_headers = { }):
+    if debug:
+        output.warning("Mangadex API: requesting -> " + url)
+    try:
+        r = sessions.get(api_url).get(api_url + url.strip('/'), headers = { **MangadexV5Series.headers, **extra_headers })
+    except requests.exceptions.ConnectionError:
+        output.error("Mangadex API: request to endpoint failed: {}".format(url))
+        raise exceptions.ScrapingError
+    if r.status_code != 200:
+        output.error("Mangadex API: got bad status code {}".format(r.status_code))
+    return r
 
 # unlike _make_api_request, this function directly returns the decoded JSON
-# rather than a requests.Response object
-def _make_paginated_api_request(url, session = None, extra_headers = { }):
-    results = [ ]
-    offset = 0
-    limit = 100
-    while True:
-        page = _make_api_request(url + "&offset=" + str(offset) + "&limit=" + str(limit),
-            session = session, extra_headers = extra_headers)
-        j = _decode_json(page.text)
-        if not page.json().get("total"):
-            return j
-        results += j
-        offset += 100
-        if offset >= page.json()["total"]:
-            break
+# rather than a requests.Response object.  the first page tells the total, after
+# which the remaining pages are requested concurrently; the host limiter keeps
+# them within the API rate limit
+def _make_paginated_api_request(url, extra_headers = { }, limit = 100):
+    def get_page(offset):
+        return _make_api_request(url + "&offset=" + str(offset) + "&limit=" + str(limit),
+            extra_headers = extra_headers)
+    page = get_page(0)
+    results = _decode_json(page.text)
+    total = page.json().get("total")
+    if not total:
+        return results
+    offsets = range(limit, total, limit)
+    if len(offsets) > 0:
+        with ThreadPoolExecutor(max_workers = min(len(offsets), page_workers)) as pool:
+            for page in pool.map(get_page, offsets):
+                results += _decode_json(page.text)
     return results
 
 def _decode_json(string):
@@ -63,14 +66,12 @@ def _decode_json(string):
 class MangadexV5Series(BaseSeries):
     url_re = re.compile(r'^https?://mangadex\.org/(title/[0-9a-fA-F]{8}(-[a-fA-F0-9]{4}){3}-[a-fA-F0-9]{12}(/.+)?|manga/[0-9]+|title/[0-9]+/.+(/chapters/?)?)$')
     headers = { "User-Agent": "cu2/{} {}".format(__version__, __upstream_link__) }
+    newest_first = True
 
     def __init__(self, url, **kwargs):
         super().__init__(url, **kwargs)
         self._get_page(self.url)
-        self.chapters = self.get_chapters()
-
-    def __del__(self):
-        self.req_session.close()
+        self._chapters = None
 
     @staticmethod
     def _translate_manga_id(manga_id):
@@ -78,7 +79,7 @@ class MangadexV5Series(BaseSeries):
             legacy_manga_id = int(manga_id)
             if debug:
                 output.warning("Mangadex API: querying legacy series {} -> /legacy/mapping".format(str(legacy_manga_id)))
-            r = requests.post("https://api.mangadex.org/legacy/mapping", json = { "type": "manga", "ids": [ legacy_manga_id ] })
+            r = sessions.get(api_url).post(api_url + "legacy/mapping", json = { "type": "manga", "ids": [ legacy_manga_id ] })
             try:
                 return r.json()["data"][0]["attributes"]["newId"]
             except KeyError:
@@ -95,7 +96,7 @@ class MangadexV5Series(BaseSeries):
             manga_id = MangadexV5Series._translate_manga_id(url.rstrip('/').split('/')[-1])
         else:
             manga_id = url.rstrip('/').split('/')[-1]
-        r = _make_api_request('/manga/' + manga_id, session = self.req_session)
+        r = _make_api_request('/manga/' + manga_id)
         # this bit is duplicated in _decode_json because at this point we don't have
         # enough data from the API to call self.alias
         try:
@@ -110,85 +111,122 @@ class MangadexV5Series(BaseSeries):
         ret_group_names = []
         for group in groups:
             if not group in self.group_names:
-                r = _make_api_request("/group/" + group, session = self.req_session)
+                r = _make_api_request("/group/" + group)
                 self.group_names[group] = _decode_json(r.text)["attributes"]["name"]
             ret_group_names.append(self.group_names[group])
         return ret_group_names
 
+    def _chapter_groups(self, chapter):
+        # the feed includes the scanlation groups with their attributes, so
+        # their names only need to be requested if the API left them out
+        groups = [ relationship for relationship in chapter["relationships"]
+            if relationship["type"] == "scanlation_group" ]
+        if all("attributes" in group for group in groups):
+            return [ group["attributes"]["name"] for group in groups ]
+        return self._get_group_names([ group["id"] for group in groups ])
+
+    def _make_chapter(self, chapter, name, alias):
+        return MangadexV5Chapter(
+            name = name,
+            alias = alias,
+            chapter = chapter["attributes"]["chapter"] if chapter["attributes"]["chapter"] is not None else "0",
+            url = "https://mangadex.org/chapter/" + chapter["id"],
+            groups = self._chapter_groups(chapter),
+            title = None if chapter["attributes"]["title"] == "" else chapter["attributes"]["title"],
+            upload_date = chapter["attributes"]["updatedAt"]
+        )
+
+    # the full chapter list is only requested when something asks for it, as
+    # updates walk the feed with iter_chapters instead
+    @property
+    def chapters(self):
+        if self._chapters is None:
+            self._chapters = self.get_chapters()
+        return self._chapters
+
     def get_chapters(self):
-        chapter_data = _make_paginated_api_request('/chapter?translatedLanguage[]=en&includeExternalUrl=0&manga=' + self.json["data"]["id"],
-            session = self.req_session)
-        chapters = []
-        for chapter in chapter_data:
-            chapters.append(
-                MangadexV5Chapter(
-                    name = self.name,
-                    alias = self.alias,
-                    chapter = chapter["attributes"]["chapter"] if chapter["attributes"]["chapter"] is not None else "0",
-                    url = "https://mangadex.org/chapter/" + chapter["id"],
-                    groups = self._get_group_names([ relationship["id"] for relationship in chapter["relationships"]
-                        if relationship["type"] == "scanlation_group" ]),
-                    title = None if chapter["attributes"]["title"] == "" else chapter["attributes"]["title"],
-                    upload_date = chapter["attributes"]["updatedAt"]
-                )
-            )
-        return chapters
+        chapter_data = _make_paginated_api_request('/manga/' + self.json["data"]["id"] +
+            '/feed?translatedLanguage[]=en&includeExternalUrl=0&includes[]=scanlation_group',
+            limit = feed_limit)
+        name, alias = self.name, self.alias
+        return [ self._make_chapter(chapter, name, alias) for chapter in chapter_data ]
+
+    def iter_chapters(self, since=None):
+        # walk the feed one page at a time from the chapter that became
+        # readable last, stopping at the newest chapter of the last update
+        name, alias = self.name, self.alias
+        offset = 0
+        while True:
+            r = _make_api_request('/manga/' + self.json["data"]["id"] +
+                '/feed?translatedLanguage[]=en&includeExternalUrl=0&includes[]=scanlation_group' +
+                '&order[readableAt]=desc&offset=' + str(offset) + '&limit=' + str(stream_limit))
+            chapter_data = _decode_json(r.text)
+            if chapter_data is None:
+                raise exceptions.ScrapingError
+            for chapter in chapter_data:
+                chapter = self._make_chapter(chapter, name, alias)
+                if chapter.url == since:
+                    return
+                yield chapter
+            offset += len(chapter_data)
+            if not chapter_data or offset >= r.json().get("total", 0):
+                return
 
     @property
     def name(self):
         return self.json["data"]["attributes"]["title"]["en"]
 
+    @classmethod
+    def recent_updates(cls, since, urls):
+        # ask for the chapters updated since the last update, for up to 100
+        # series at a time.  series followed with a legacy numeric ID are
+        # always updated
+        ids = {}
+        changed = set()
+        for url in urls:
+            match = uuid_re.search(url)
+            if match:
+                ids[match.group(0).lower()] = url
+            else:
+                changed.add(url)
+        since = since.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        manga_ids = list(ids)
+        for i in range(0, len(manga_ids), recent_updates_batch):
+            chapter_data = _make_paginated_api_request('/chapter?translatedLanguage[]=en&includeExternalUrl=0&updatedAtSince=' +
+                since + "".join("&manga[]=" + x for x in manga_ids[i:i + recent_updates_batch]))
+            for chapter in chapter_data:
+                for relationship in chapter["relationships"]:
+                    if relationship["type"] == "manga" and relationship["id"] in ids:
+                        changed.add(ids[relationship["id"]])
+        return changed
+
 class MangadexV5Chapter(BaseChapter):
     url_re = re.compile(r'^https://mangadex\.org/chapter/[0-9a-fA-F]{8}(-[a-fA-F0-9]{4}){3}-[a-fA-F0-9]{12}$')
+    page_timeout = 18
     uses_pages = True
 
-    def __del__(self):
-        self.req_session.close()
+    def page_cache_key(self, page_url):
+        # the at-home base URL changes between requests, but the chapter hash
+        # and the file name after it identify the page
+        return "mangadex:" + page_url.split("/data/", 1)[-1]
 
-    @staticmethod
-    def page_download_task(page_num, r, page_url = None):
-        ext = BaseChapter.guess_extension(r.headers.get("content-type"))
-        f = NamedTemporaryFile(suffix = ext, delete = False)
-        download_start_time = int(time.time())
-        try:
-            for chunk in r.iter_content(chunk_size = 4096):
-                if chunk:
-                    f.write(chunk)
-        except ConnectionError:
-            f.flush()
-            # page failed to download, send failure report
-            if debug:
-                output.warning("Mangadex API: send failure report")
-            requests.post("https://api.mangadex.network/report", data =
-                {
-                    "url": page_url,
-                    "success": False,
-                    "bytes": f.tell(),
-                    "duration": int(time.time()) - download_start_time,
-                    "cached": True if r.headers.get("X-Cache") else False
-                }
-            )
-            raise exceptions.ScrapingError
-        f.flush()
-        # page download successful, send success report
+    def page_report(self, page_url, success, size, duration, headers):
+        # send a success or failure report for the page to the MD@H network
         if debug:
-            output.warning("Mangadex API: send success report")
+            output.warning("Mangadex API: send {} report".format("success" if success else "failure"))
         try:
-            requests.post("https://api.mangadex.network/report", data =
+            sessions.get(report_url).post(report_url, data =
                 {
                     "url": page_url,
-                    "success": True,
-                    "bytes": f.tell(),
-                    "duration": int(time.time()) - download_start_time,
-                    "cached": True if r.headers.get("X-Cache") else False
+                    "success": success,
+                    "bytes": size,
+                    "duration": int(duration),
+                    "cached": True if headers.get("X-Cache") else False
                 },
                 timeout = 9
             )
-        except requests.exceptions.ReadTimeout:
-            output.warning("Mangadex API: failed to send success report for page {}".format(page_num))
-        f.close()
-        r.close()
-        return ((page_num, f))
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            output.warning("Mangadex API: failed to send report for page {}".format(page_url))
 
     @staticmethod
     def _translate_chapter_id(chapter_id):
@@ -196,7 +234,7 @@ class MangadexV5Chapter(BaseChapter):
             legacy_chapter_id = int(chapter_id)
             if debug:
                 output.warning("Mangadex API: querying legacy chapter {} -> /legacy/mapping".format(str(legacy_chapter_id)))
-            r = requests.post("https://api.mangadex.org/legacy/mapping", json = { "type": "chapter", "ids": [ legacy_chapter_id ] })
+            r = sessions.get(api_url).post(api_url + "legacy/mapping", json = { "type": "chapter", "ids": [ legacy_chapter_id ] })
             try:
                 return r.json()["data"][0]["attributes"]["newId"]
             except KeyError:
@@ -207,8 +245,7 @@ class MangadexV5Chapter(BaseChapter):
     def available(self):
         if not hasattr(self, "req"):
             try:
-                self.req = _make_api_request("/chapter/" + MangadexV5Chapter._translate_chapter_id(self.url.split('/')[-1]),
-                    session = self.req_session)
+                self.req = _make_api_request("/chapter/" + MangadexV5Chapter._translate_chapter_id(self.url.split('/')[-1]))
                 self.json = _decode_json(self.req.text)
             except exceptions.ScrapingError:
                 pass
@@ -223,26 +260,7 @@ class MangadexV5Chapter(BaseChapter):
         if len(pages) <= 0:
             output.error("{}: chapter is hosted externally".format(self.alias))
             raise exceptions.ScrapingError("external")
-        files = [None] * len(pages)
-        futures = []
-        with self.progress_bar(pages) as bar:
-            for i, page in enumerate(pages):
-                try:
-                    r = self.req_session.get(page, stream = True, timeout = 18)
-                except requests.exceptions.ConnectionError as e:
-                    output.error("{}: connection error for page {}".format(self.alias, i))
-                    raise exceptions.ScrapingError
-                except requests.exceptions.ReadTimeout as e:
-                    output.error("{}: connection timed out for page {}".format(self.alias, i))
-                    raise exceptions.ScrapingError
-                if not r or r.status_code == 404:
-                    output.error("{}: failed request for page {}".format(self.alias, i))
-                    raise exceptions.ScrapingError
-                fut = download_pool.submit(self.page_download_task, i, r, page_url = page)
-                fut.add_done_callback(partial(self.page_download_finish, bar, files))
-                futures.append(fut)
-            concurrent.futures.wait(futures)
-            self.create_zip(files)
+        self.download_pages(pages)
 
     def from_url(url):
         chapter_id = MangadexV5Chapter._translate_chapter_id(url.split('/')[-1])
@@ -1,12 +1,8 @@
-from bs4 import BeautifulSoup
-from cu2 import config, exceptions, output
-from cu2.scrapers.base import BaseChapter, BaseSeries, download_pool
-from functools import partial
+from cu2 import exceptions
+from cu2.scrapers.base import BaseChapter, BaseSeries, make_soup
 from jsbeautifier import beautify
 from json import loads
-import concurrent.futures
 import re
-import requests
 
 # as of 2020/04/04, the old mobile interface which allowed easy scraping
 # has been removed, and mobile now copies desktop which is protected
@@ -36,7 +32,7 @@ class MangahereSeries(BaseSeries):
         spage = self.req_session.get(url.replace("m.", "www."), cookies = { "isAdult": "1" })
         if spage.status_code == 404:
             raise exceptions.ScrapingError
-        self.soup = BeautifulSoup(spage.text, config.get().html_parser)
+        self.soup = make_soup(spage.text)
         self.chapters = self.get_chapters()
 
     def get_chapters(self):
@@ -49,6 +45,7 @@ class MangahereSeries(BaseSeries):
         except AttributeError:
             raise exceptions.ScrapingError()
         chapters = []
+        name, alias = self.name, self.alias
         for i, row in enumerate(rows):
             chap_num = re.match((r"/manga/[^/]+(?:(?:/v[0-9]+)?"
                                 r"/c([0-9\.]+))/[0-9]+\.html$"),
@@ -66,8 +63,8 @@ class MangahereSeries(BaseSeries):
             chap_url = "https://www.mangahere.cc" + row.get("href")\
                 .replace("/roll_manga/", "/manga/")
             chap_name = row.find("p").text
-            result = MangahereChapter(name=self.name,
-                                      alias=self.alias,
+            result = MangahereChapter(name=name,
+                                      alias=alias,
                                       chapter=chap_num,
                                       url=chap_url,
                                       title=chap_name,
@@ -97,6 +94,10 @@ class MangahereSeries(BaseSeries):
 class MangahereChapter(BaseChapter):
     url_re = re.compile((r'https?://((www|m)\.)?mangahere\.cc'
                         r'/(roll_)?manga/[^/]+(/v[0-9]+)?/c[0-9\.]+/[0-9]+\.html$'))
+    # end of chapter detection in the web ui is done by issuing requests for
+    # nonexistent pages which return 404s (who comes up with this)
+    page_missing_status = 404
+    page_retries = 9
     upload_date = None
     uses_pages = True
 
@@ -131,18 +132,18 @@ class MangahereChapter(BaseChapter):
                 raise exceptions.ScrapingError
 
         if not getattr(self, "soup", None):
-            self.soup = BeautifulSoup(self.cpage.text,
-                                      config.get().html_parser)
+            self.soup = make_soup(self.cpage.text, parse_only="script")
 
         pages = []
         (mid, cid) = (None, None)
         # index of script with ids may vary
         # it may also change as ads are added/removed from the site
-        for f in range(0, len(self.soup.find_all("script"))):
+        scripts = self.soup.find_all("script")
+        for script in scripts:
             try:
-                if len(self.soup.find_all("script")[f].contents):
-                    mid = re.search("var comicid = ([0-9]+)", self.soup.find_all("script")[f].contents[0]).groups()[0]
-                    cid = re.search("var chapterid =([0-9]+)", self.soup.find_all("script")[f].contents[0]).groups()[0]
+                if len(script.contents):
+                    mid = re.search("var comicid = ([0-9]+)", script.contents[0]).groups()[0]
+                    cid = re.search("var chapterid =([0-9]+)", script.contents[0]).groups()[0]
             except AttributeError:
                 pass
         if mid and cid:
@@ -154,9 +155,9 @@ class MangahereChapter(BaseChapter):
             # some titles (seems to be ones with low page counts like webtoons)
             # don't use progressively-loaded pages.  for these, the image list
             # can be extracted directly off the main page
-            for g in range(0, len(self.soup.find_all("script"))):
+            for script in scripts:
                 try:
-                    pages = loads(re.search("var newImgs = (.+);var newImginfos", beautify(self.soup.find_all("script")[g].text).replace("\\", "").replace("'", "\"")).groups()[0])
+                    pages = loads(re.search("var newImgs = (.+);var newImginfos", beautify(script.text).replace("\\", "").replace("'", "\"")).groups()[0])
                 except AttributeError:
                     pass
             if not len(pages):
@@ -164,35 +165,7 @@ class MangahereChapter(BaseChapter):
             for i, page in enumerate(pages):
                 pages[i] = "https:" + page
 
-        futures = []
-        files = [None] * len(pages)
-        with self.progress_bar(pages) as bar:
-            for i, page in enumerate(pages):
-                retries = 0
-                while retries < 10:
-                    try:
-                        r = self.req_session.get(page, stream=True)
-                        break
-                    except requests.exceptions.ConnectionError:
-                        retries += 1
-                # end of chapter detection in the web ui is done by issuing requests
-                # for nonexistent pages which return 404s (who comes up with this)
-                if r.status_code != 404:
-                    if r.status_code != 200:
-                        r.close()
-                        output.error("Page download got status code {}".format(str(r.status_code)))
-                        raise exceptions.ScrapingError
-                    fut = download_pool.submit(self.page_download_task, i, r)
-                    fut.add_done_callback(partial(self.page_download_finish,
-                                                bar, files))
-                    futures.append(fut)
-                else:
-                    try:
-                        del files[i]
-                    except IndexError:
-                        raise exceptions.ScrapingError
-            concurrent.futures.wait(futures)
-            self.create_zip(files)
+        self.download_pages(pages)
 
     def from_url(url):
         chap_num = re.match((r"https?://(?:(?:www|m)\.)?mangahere\.cc/(?:roll_)?"
@@ -1,33 +1,36 @@
-from cu2 import config, exceptions, output
-from cu2.scrapers.base import BaseChapter, BaseSeries, download_pool
+from cu2 import exceptions
+from cu2.scrapers.base import BaseChapter, BaseSeries, make_soup
 
-from bs4 import BeautifulSoup
-from functools import partial
-import concurrent.futures, re
+import re
 from requests import get
 from requests.adapters import HTTPAdapter, Retry
-from requests.exceptions import ConnectionError, ReadTimeout
 
 class MangakatanaSeries(BaseSeries):
     url_re = re.compile(r'^https?://mangakatana.com/manga/[0-9a-z-]+\.[0-9]+$')
 
     def __init__(self, url, **kwargs):
         super().__init__(url, **kwargs)
+        req = self.conditional_get(self.url)
+        req.raise_for_status()
+        self.page = self.parse(req.text)
         self.chapters = self.get_chapters()
 
-    def __del__(self):
-        self.req_session.close()
-
     def get_chapters(self):
+        name, alias = self.name, self.alias
+        return [ MangakatanaChapter(name = name, alias = alias, **chapter)
+            for chapter in self.page["chapters"] ]
+
+    @property
+    def name(self):
+        return self.page["name"]
+
+    @staticmethod
+    def parse_page(text, parser):
         chapters = []
-        req = self.req_session.get(self.url)
-        req.raise_for_status()
-        self.soup = BeautifulSoup(req.text, config.get().html_parser)
-        for chapter in self.soup.find("div", class_="chapters").find_all("a"):
+        soup = make_soup(text, parser=parser)
+        for chapter in soup.find("div", class_="chapters").find_all("a"):
             chapters.append(
-                MangakatanaChapter(
-                    name = self.name,
-                    alias = self.alias,
+                dict(
                     chapter = re.search(r"^[a-zA-Z]+ ?([0-9\.]+)", chapter.text).groups()[0],
                     groups = [],
                     url = chapter["href"],
@@ -35,19 +38,13 @@ class MangakatanaSeries(BaseSeries):
                     upload_date = chapter.parent.parent.parent.find("div", class_="update_time").text
                 )
             )
-        return chapters
-
-    @property
-    def name(self):
-        return self.soup.title.text
+        return { "name": soup.title.text, "chapters": chapters }
 
 class MangakatanaChapter(BaseChapter):
     url_re = re.compile(r'^https?://mangakatana.com/manga/[0-9a-z-]+\.[0-9]+/c[0-9\.]+$')
+    page_timeout = 18
     uses_pages = True
 
-    def __del__(self):
-        self.req_session.close()
-
     def page_list(self):
         if hasattr(self, "pages"):
             return self.pages
@@ -55,7 +52,7 @@ class MangakatanaChapter(BaseChapter):
             self.req = self.req_session.get(self.url)
             self.req.raise_for_status()
         if not hasattr(self, "soup"):
-            self.soup = BeautifulSoup(self.req.text, config.get().html_parser)
+            self.soup = make_soup(self.req.text, parse_only = "script")
         return next(x.text for x in self.soup.find_all("script") if re.search("var thzq=", x.text)).splitlines()[7].split(";")[0][11:-2].replace("'", "").split(",")
 
     def available(self):
@@ -63,7 +60,7 @@ class MangakatanaChapter(BaseChapter):
             self.req = self.req_session.get(self.url)
             self.req.raise_for_status()
         if not hasattr(self, "soup"):
-            self.soup = BeautifulSoup(self.req.text, config.get().html_parser)
+            self.soup = make_soup(self.req.text, parse_only = "script")
         if not hasattr(self, "pages"):
             self.pages = self.page_list()
         return len(self.pages) > 0 and "coming_soon" not in self.pages[0]
@@ -71,26 +68,7 @@ class MangakatanaChapter(BaseChapter):
     def download(self):
         if not self.available():
             raise exceptions.ScrapingError
-        files = [None] * len(self.pages)
-        futures = []
-        with self.progress_bar(self.pages) as bar:
-            for i, page in enumerate(self.pages):
-                try:
-                    r = self.req_session.get(page, stream = True, timeout = 18)
-                except ConnectionError as e:
-                    output.error("{}: connection error for page {}".format(self.alias, i))
-                    raise exceptions.ScrapingError
-                except ReadTimeout as e:
-                    output.error("{}: connection timed out for page {}".format(self.alias, i))
-                    raise exceptions.ScrapingError
-                if r.status_code != 200:
-                    output.error("{}: failed request for page {} due to status {}".format(self.alias, i, r.status_code))
-                    raise exceptions.ScrapingError
-                fut = download_pool.submit(self.page_download_task, i, r, page_url = page)
-                fut.add_done_callback(partial(self.page_download_finish, bar, files))
-                futures.append(fut)
-            concurrent.futures.wait(futures)
-            self.create_zip(files)
+        self.download_pages(self.pages)
 
     def from_url(url):
         series = MangakatanaSeries("/".join(url.split("/")[:-1]))
@@ -1,11 +1,8 @@
-from bs4 import BeautifulSoup
-from cu2 import config, exceptions, output, version
-from cu2.scrapers.base import BaseChapter, BaseSeries, download_pool
-from functools import partial
-import concurrent.futures
+from cu2 import exceptions, output, sessions, version
+from cu2.scrapers.base import (BaseChapter, BaseSeries, make_soup,
+                               script_variables)
 import json
 import re
-import requests
 
 PAGE_ONE = "-page-1"
 
@@ -41,36 +38,57 @@ def _mangasee_chapters_are_equal(one, two):
         return float(one_split[-1]) == float(two_split[-1])
     return int(one_split[-1]) == int(two_split[-1]) and float(one_split[-3]) == float(two_split[-3])
 
+# the data of a page is assigned to vm.* variables in its last script, which
+# is read once for all of them
+def _mangasee_variables(soup):
+    scripts = soup.find_all("script")
+    if not scripts:
+        return {}
+    return script_variables(scripts[-1].get_text())
+
 class MangaseeSeries(BaseSeries):
     url_re = re.compile(r'https?://mangasee123\.com/manga/.+')
 
     def __init__(self, url, **kwargs):
         super().__init__(url, **kwargs)
-        spage = self.req_session.get(url, headers = { "User-Agent": version.version_string() })
+        spage = self.conditional_get(url, headers = { "User-Agent": version.version_string() })
         if spage.status_code == 404:
             raise exceptions.ScrapingError
-        self.soup = BeautifulSoup(spage.text, config.get().html_parser)
+        self.page = self.parse(spage.text)
         self.chapters = self.get_chapters()
 
     def get_chapters(self):
+        name, alias = self.name, self.alias
+        return [MangaseeChapter(name=name, alias=alias, **chapter)
+                for chapter in self.page["chapters"]]
+
+    @property
+    def name(self):
+        return self.page["name"]
+
+    @staticmethod
+    def parse_page(text, parser):
         # the new React-based site uses "chapter codes" which encode both
         # the chapter number, the URL, and season (where applicable)
         # the original JS implementations can be found at notes/mangasee.js
+        soup = make_soup(text, parse_only=["title", "script"], parser=parser)
+        try:
+            name = re.match(r"(.+) \| MangaSee",
+                            soup.find("title").text).groups()[0]
+        except AttributeError:
+            raise exceptions.ScrapingError
 
         # attempt to extract the index name first, as it is guaranteed to fail
         # for bad series URLs
-        try:
-            index_name = re.search(r"vm\.IndexName = \"(.+?)\";",
-                                    str(self.soup.find_all("script")[-1].contents)).groups()[0]
-        except AttributeError:
-            output.error(self.alias + ': Unable to extract series index name')
+        variables = _mangasee_variables(soup)
+        index_name = variables.get("vm.IndexName")
+        chapter_data = variables.get("vm.Chapters")
+        if not isinstance(index_name, str) or not isinstance(chapter_data, list):
+            output.error(name + ': Unable to extract series index name')
             raise exceptions.ScrapingError
-        chap_codes = re.findall(r"\"Chapter\":\"([0-9]+?)\"",
-                                str(self.soup.find_all("script")[-1].contents))
-        chap_types = re.findall(r"\"Type\":\"(.+?)\"",
-                                str(self.soup.find_all("script")[-1].contents))
-        chap_dates = re.findall(r"\"Date\":\"(.+?)\"",
-                                str(self.soup.find_all("script")[-1].contents))
+        chap_codes = [x["Chapter"] for x in chapter_data]
+        chap_types = [x["Type"] for x in chapter_data]
+        chap_dates = [x["Date"] for x in chapter_data]
         chapters = []
         season_names = []
         for i, chap_code in enumerate(chap_codes):
@@ -90,14 +108,11 @@ class MangaseeSeries(BaseSeries):
             chap_num = _mangasee_decode_chap_num(chap_code)
             chap_name = chap_types[i] + " " + chap_num
             chap_date = chap_dates[i]
-            result = MangaseeChapter(name=self.name,
-                                     alias=self.alias,
-                                     chapter=chap_num,
-                                     url=chap_url,
-                                     title=chap_name,
-                                     groups=[],
-                                     upload_date=chap_date)
-            chapters.append(result)
+            chapters.append(dict(chapter=chap_num,
+                                 url=chap_url,
+                                 title=chap_name,
+                                 groups=[],
+                                 upload_date=chap_date))
 
         # the chapters in the first season of a multi-season title
         # are indistinguishable from a non-multi-season title.  thus
@@ -113,49 +128,38 @@ class MangaseeSeries(BaseSeries):
                 except IndexError:
                     # heuristic for season identification failed
                     # this is a TODO.  sample title: Kiba no Tabishounin: The Arms Peddler
-                    output.error('Unable to identify season delineation: {}'.format(self.alias))
+                    output.error('Unable to identify season delineation: {}'.format(name))
                     raise exceptions.ScrapingError
 
                 # working_season will be zero-indexed, but seasons should start from 1
-                chapter.chapter = str(len(season_names) - working_season).zfill(2) + "." + chapter.chapter.zfill(3)
+                chapter["chapter"] = str(len(season_names) - working_season).zfill(2) + "." + chapter["chapter"].zfill(3)
 
-        return chapters
-
-    @property
-    def name(self):
-        try:
-            return re.match(r"(.+) \| MangaSee",
-                            self.soup.find("title").text).groups()[0]
-        except AttributeError:
-            raise exceptions.ScrapingError
+        return {"name": name, "chapters": chapters}
 
 
 class MangaseeChapter(BaseChapter):
     url_re = re.compile((r'https?://mangasee123\.com/'
                         r'read-online/.+-chapter-[0-9\.]+-page-[0-9]+\.html'))
+    page_retries = 4
     upload_date = None
     uses_pages = True
 
-    def download(self):
+    def _page_soup(self):
         if not getattr(self, "cpage", None):
             self.cpage = self.req_session.get(self.url, headers = { "User-Agent": version.version_string() })
         if not getattr(self, "soup", None):
-            self.soup = BeautifulSoup(self.cpage.text,
-                                      config.get().html_parser)
-
-        current_chap_code = re.search(r"vm.CurChapter = {\"Chapter\":\"([0-9]+)\"", \
-                            str(self.soup.find_all("script")[-1].contents)).groups()[0]
-        chap_codes = re.findall(r"\"Chapter\":\"([0-9]+?)\"",
-                                str(self.soup.find_all("script")[-1].contents))
-        chap_pages = re.findall(r"\"Page\":\"([0-9]+?)\"",
-                                str(self.soup.find_all("script")[-1].contents))
-
-        # find number of pages in this chapter
-        num_pages = 0
-        for i, chap in enumerate(chap_codes):
-            if current_chap_code == chap:
-                num_pages = int(chap_pages[i])
-                break
+            self.soup = make_soup(self.cpage.text,
+                                  parse_only=["title", "script"])
+        return self.soup
+
+    def download(self):
+        variables = _mangasee_variables(self._page_soup())
+        try:
+            current_chap_code = variables["vm.CurChapter"]["Chapter"]
+            num_pages = int(variables["vm.CurChapter"]["Page"])
+        except (KeyError, TypeError, ValueError):
+            output.error('Failed to extract the current chapter: {}'.format(self.url))
+            raise exceptions.ScrapingError
 
         # we weren't able to identify the number of pages
         if num_pages <= 0:
@@ -172,58 +176,32 @@ class MangaseeChapter(BaseChapter):
         # three more pieces of data we need to extract.  first is the "directory" attribute
         # which seems to be used for multi-season works.  it is an empty string for
         # non-multi-season works.
-        directory = re.search(r"vm.CurChapter.+?\"Directory\":\"(.*?)\"", \
-                              str(self.soup.find_all("script")[-1].contents)).groups()[0]
+        # second is the domain name the images are hosted on.  they have been moved off of
+        # blogspot and now use cycle round-robin to servers behind cloudflare.
+        # third is the index name.
+        try:
+            directory = variables["vm.CurChapter"]["Directory"]
+            domain = variables["vm.CurPathName"]
+            index_name = variables["vm.IndexName"]
+        except KeyError:
+            output.error('Failed to extract pages for chapter code: {}'.format(current_chap_code))
+            raise exceptions.ScrapingError
         if directory == "":
             directory = "/"
         else:
             directory = "/" + directory + "/"
 
-        # second is the domain name the images are hosted on.  they have been moved off of
-        # blogspot and now use cycle round-robin to servers behind cloudflare.
-        domain = re.search(r"vm.CurPathName = \"(.+?)\";", \
-                           str(self.soup.find_all("script")[-1].contents)).groups()[0]
-
-        # third is the index name.
-        index_name = re.search(r"vm\.IndexName = \"(.+?)\";",
-                                str(self.soup.find_all("script")[-1].contents)).groups()[0]
-
         # now we're finally read to start assembling the image urls.
         pages = []
         for i in range(0, num_pages):
             pages.append("https://" + domain + "/manga/" + index_name + directory + \
                          current_chap_num + "-" + str(i + 1).zfill(3) + ".png")
 
-        futures = []
-        files = [None] * len(pages)
-        with self.progress_bar(pages) as bar:
-            for i, page in enumerate(pages):
-                retries = 0
-                while retries < 5:
-                    try:
-                        r = self.req_session.get(page, stream=True)
-                        if r.status_code != 200:
-                            output.warning('Failed to fetch page with status {}, retrying #{}'
-                                            .format(str(r.status_code), str(retries)))
-                            retries += 1
-                        else:
-                            break
-                    except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout):
-                        retries += 1
-                if r.status_code != 200:
-                    output.error('Failed to fetch page with status {}, giving up'
-                                    .format(str(r.status_code)))
-                    raise exceptions.ScrapingError
-                fut = download_pool.submit(self.page_download_task, i, r)
-                fut.add_done_callback(partial(self.page_download_finish,
-                                              bar, files))
-                futures.append(fut)
-            concurrent.futures.wait(futures)
-            self.create_zip(files)
+        self.download_pages(pages)
 
     def from_url(url):
-        cpage = requests.get(url, headers = { "User-Agent": version.version_string() })
-        soup = BeautifulSoup(cpage.text, config.get().html_parser)
+        cpage = sessions.get(url).get(url, headers = { "User-Agent": version.version_string() })
+        soup = make_soup(cpage.text, parse_only="a")
         iname = soup.find("a", class_="btn btn-sm btn-outline-secondary")["href"]
         series = MangaseeSeries("https://mangasee123.com" + iname)
         for chapter in series.chapters:
@@ -233,11 +211,6 @@ class MangaseeChapter(BaseChapter):
 
     # new site no longer returns 404 on bad chapter
     def available(self):
-        if not getattr(self, "cpage", None):
-            self.cpage = self.req_session.get(self.url, headers = { "User-Agent": version.version_string() })
-        if not getattr(self, "soup", None):
-            self.soup = BeautifulSoup(self.cpage.text,
-                                      config.get().html_parser)
-        if self.soup.find("title").text == "404 Page Not Found":
+        if self._page_soup().find("title").text == "404 Page Not Found":
             return False
         return True
@@ -0,0 +1,224 @@
+from cu2 import config, output, profiling
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter, Retry
+from urllib.parse import urlparse
+import datetime
+import requests
+import threading
+import time
+
+# Limits for hosts that are known to ban clients going over them, which can
+# be overridden with the `rate_limits` setting.
+DEFAULT_RATE_LIMITS = {
+    'api.mangadex.org': {'rate': 5, 'burst': 5},
+}
+# Statuses with which hosts tell that they are receiving too many requests.
+THROTTLE_STATUSES = (429, 503)
+
+_limiters = {}
+_lock = threading.Lock()
+_sessions = {}
+
+
+class HostLimiter(object):
+    """Limits the requests sent to a single host. Requests are paced by a
+    token bucket which allows `rate` requests per second on average with
+    bursts of up to `burst` requests, and the number of requests in flight is
+    limited by an AIMD (additive increase, multiplicative decrease) window of
+    up to `concurrency` requests. Without `rate` or `concurrency` the
+    respective limit only applies once the host has throttled a request.
+
+    When the host throttles a request, every request to the host is paused
+    for the time asked for by the Retry-After header, or for an exponential
+    backoff without one, and the window is halved. Each healthy response
+    widens the window again, by about one request per window's worth of
+    responses.
+    """
+
+    def __init__(self, rate=None, burst=None, concurrency=None):
+        self.rate = rate
+        self.burst = burst or max(rate or 1, 1)
+        self.concurrency = concurrency
+        self.failures = 0
+        self.in_flight = 0
+        self.paused_until = 0
+        self.tokens = self.burst
+        self.window = float(concurrency or 'inf')
+        self._condition = threading.Condition()
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.rate:
+            elapsed = now - self._updated
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Blocks until a request may be sent to the host."""
+        with self._condition:
+            while True:
+                delay = self.try_acquire()
+                if not delay:
+                    return
+                self._condition.wait(delay)
+
+    def release(self, status=None, retry_after=None):
+        """Releases a request that has finished with the HTTP `status`, or
+        with no status if the request failed, and adapts the limits to the
+        response.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if status in THROTTLE_STATUSES or retry_after is not None:
+                self.throttle(retry_after)
+            elif status is not None and status < 500:
+                self.failures = 0
+                self.window += 1 / self.window
+                if self.concurrency:
+                    self.window = min(self.window, self.concurrency)
+            self._condition.notify_all()
+
+    def throttle(self, retry_after=None):
+        """Pauses the requests to the host and halves the window."""
+        with self._condition:
+            self.failures += 1
+            if retry_after is None:
+                retry_after = min(2 ** self.failures, 60)
+            self.paused_until = max(self.paused_until,
+                                    time.monotonic() + retry_after)
+            # Halve the number of requests that were actually in flight when
+            # the window is wider than that.
+            self.window = max(1.0, min(self.window, self.in_flight + 1) / 2)
+
+    def try_acquire(self):
+        """Takes a request slot if one is available right away and returns 0,
+        otherwise returns the number of seconds to wait before trying again.
+        """
+        with self._condition:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight + 1 > self.window:
+                return 0.05
+            self._refill(now)
+            if self.rate and self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            if self.rate:
+                self.tokens -= 1
+            self.in_flight += 1
+            return 0
+
+
+class LimitedAdapter(HTTPAdapter):
+    """HTTPAdapter which sends requests through the limiter of their host.
+    Throttled requests are sent again once the host is no longer paused, up
+    to `throttle_retries` times.
+    """
+    throttle_retries = 5
+
+    def send(self, request, *args, **kwargs):
+        host = urlparse(request.url).netloc
+        host_limiter = limiter(host)
+        for attempt in range(self.throttle_retries + 1):
+            host_limiter.acquire()
+            try:
+                with profiling.phase('http', host=host):
+                    r = super().send(request, *args, **kwargs)
+            except Exception:
+                host_limiter.release()
+                raise
+            retry_after = parse_retry_after(r)
+            if r.status_code not in THROTTLE_STATUSES:
+                # Retry-After only asks for a pause with throttling statuses.
+                retry_after = None
+            host_limiter.release(r.status_code, retry_after)
+            if (r.status_code not in THROTTLE_STATUSES or
+                    attempt == self.throttle_retries):
+                return r
+            output.warning('{} is throttling requests, waiting'
+                           .format(host))
+            r.close()
+        return r
+
+
+def close():
+    """Closes all of the shared sessions."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _limiters.clear()
+
+
+def create_session():
+    """Returns a new session with connection pools sized by the
+    `connection_pool_size` setting. Requests failing with a connection error or
+    a gateway error are retried with a backoff, while throttled requests are
+    left to the host limiters.
+    """
+    pool_size = config.get().connection_pool_size
+    session = requests.Session()
+    for prefix in ('http://', 'https://'):
+        retry = Retry(total=5, backoff_factor=2,
+                      status_forcelist=[502, 504],
+                      raise_on_status=False,
+                      respect_retry_after_header=False)
+        adapter = LimitedAdapter(pool_connections=pool_size,
+                                 pool_maxsize=pool_size, max_retries=retry)
+        session.mount(prefix, adapter)
+    return session
+
+
+def get(url):
+    """Returns the session shared by everything that talks to the host of the
+    URL, creating the session if needed. Sharing the sessions keeps the
+    connections alive across series, chapters and commands for the lifetime
+    of the process.
+
+    Scrapers borrow the sessions rather than own them, so the sessions must
+    not be closed by the scrapers.
+    """
+    host = urlparse(url or '').netloc
+    with _lock:
+        try:
+            return _sessions[host]
+        except KeyError:
+            session = _sessions[host] = create_session()
+            return session
+
+
+def limiter(host):
+    """Returns the limiter of the host, creating it with the limits from
+    DEFAULT_RATE_LIMITS and the `rate_limits` setting if needed. The
+    `rate_limits` setting maps hosts to the keyword arguments of HostLimiter,
+    e.g. {"mangadex.org": {"rate": 2, "burst": 4, "concurrency": 8}}.
+    """
+    with _lock:
+        try:
+            return _limiters[host]
+        except KeyError:
+            limits = dict(DEFAULT_RATE_LIMITS.get(host, {}))
+            limits.update(config.get().rate_limits.get(host, {}))
+            host_limiter = _limiters[host] = HostLimiter(**limits)
+            return host_limiter
+
+
+def parse_retry_after(r):
+    """Returns the number of seconds asked for by the Retry-After header of
+    the response, or None if there is no valid header.
+    """
+    value = r.headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max((date - now).total_seconds(), 0)
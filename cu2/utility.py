@@ -1,9 +1,47 @@
-from cu2 import db, config, exceptions, output
+from cu2 import archive, db, config, exceptions, output, pagecache, profiling
 from cu2.scrapers import chapter_scrapers, series_scrapers
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import zip_longest
+from urllib.parse import urlparse
 import click
 import datetime
 import re
 import shutil
+import time
+
+# Allowance for differences between the local clock and the clocks of the
+# sites when asking them for the series that changed since the last update.
+RECENT_UPDATES_MARGIN = datetime.timedelta(hours=1)
+
+
+def changed_series(follows):
+    """Returns the follows which may have changed since their last update.
+    The follows are grouped by site, and sites that implement
+    `recent_updates` are asked which of their series have changed since the
+    oldest last update of the group. Follows that have never been updated
+    and follows on sites that cannot tell are always returned.
+    """
+    changed = set()
+    sites = OrderedDict()
+    for follow in follows:
+        Series = series_class(follow.url)
+        if Series is None or follow.last_updated is None:
+            changed.add(follow)
+        else:
+            sites.setdefault(Series, []).append(follow)
+    for Series, group in sites.items():
+        since = min(x.last_updated for x in group) - RECENT_UPDATES_MARGIN
+        try:
+            urls = Series.recent_updates(since, [x.url for x in group])
+        except (exceptions.ConnectionError, exceptions.ScrapingError,
+                KeyError, TypeError, ValueError):
+            output.warning('Unable to check recent updates of {} series'
+                           .format(len(group)))
+            urls = None
+        changed.update(x for x in group if urls is None or x.url in urls)
+    return [x for x in follows if x in changed]
+
 
 def chapter_by_url(url):
     """Helper function that iterates through the chapter scrapers defined in
@@ -15,6 +53,116 @@ def chapter_by_url(url):
             return Chapter.from_url(url)
 
 
+def download_chapters(chapters, use_db=True):
+    """Helper function used by the commands that download chapters. Runs up to
+    `chapter_threads` chapters at the same time, while the pages of all of
+    them share the global download pool. Chapters are interleaved by host so
+    that the chapters running at the same time are spread across sites.
+
+    Chapters are downloaded in worker threads, which mark them downloaded in
+    sessions of their own as soon as they finish, while missing chapters are
+    removed from the calling thread. Before the downloads start, the pending
+    changes of the calling thread are committed so that they do not keep the
+    workers waiting for the database, page journals of earlier failed
+    downloads that have expired are removed and the page cache is trimmed to
+    its size limit.
+
+    Returns a dictionary mapping the chapters that could not be downloaded to
+    the reason of the failure.
+    """
+    archive.expire_journals()
+    if pagecache.enabled():
+        pagecache.evict()
+    workers = max(config.get().chapter_threads, 1)
+    quiet = workers > 1 and len(chapters) > 1
+    failed = {}
+    if use_db:
+        db.session.commit()
+    with ThreadPoolExecutor(workers) as pool:
+        futures = {}
+        for chapter in interleave_by_host(chapters):
+            chapter.quiet = quiet
+            futures[pool.submit(profiling.call_in_series, chapter.alias,
+                                fetch_chapter, chapter, use_db)] = chapter
+        for future in as_completed(futures):
+            chapter = futures.pop(future)
+            try:
+                available = future.result()
+            except exceptions.LoginError as e:
+                output.warning('Could not download {c.alias} {c.chapter}: {e}'
+                               .format(c=chapter, e=e.message))
+                failed[chapter] = e.message
+                continue
+            except exceptions.ScrapingError:
+                output.warning('Could not download {c.alias} {c.chapter} '
+                               '(scraping error)'.format(c=chapter))
+                failed[chapter] = 'scraping error'
+                continue
+            if available:
+                if quiet:
+                    click.echo('{c.alias} {c.chapter}'.format(c=chapter))
+            elif use_db:
+                output.warning('Removing {} {}: missing from remote'
+                               .format(chapter.name, chapter.chapter))
+                chapter.db_remove()
+    if use_db:
+        # Reload the chapters that the workers have marked downloaded.
+        db.session.expire_all()
+    return failed
+
+
+def download_queue(aliases=None, poll=None):
+    """Downloads the chapters waiting in the download queue, optionally only
+    the ones of the series with the given aliases. Failed chapters stay in
+    the queue for the next run. If `poll` is given, keeps running and checks
+    the queue again every `poll` seconds.
+    """
+    db.QueuedDownload.recover()
+    while True:
+        entries = db.QueuedDownload.claim(aliases)
+        if entries:
+            output.chapter('Downloading {} chapters'.format(len(entries)))
+            chapters = [entry.chapter.to_record() for entry in entries]
+            failed = download_chapters(chapters)
+            for entry, chapter in zip(entries, chapters):
+                if chapter in failed:
+                    entry.fail(failed[chapter])
+                else:
+                    db.session.delete(entry)
+            db.session.commit()
+        if poll is None:
+            return
+        time.sleep(poll)
+
+
+def fetch_chapter(chapter, use_db=True):
+    """Downloads the chapter in a worker thread of download_chapters and, if
+    `use_db` is set and the chapter is available, marks it downloaded. The
+    session of the thread is closed afterwards. Returns a boolean indicating
+    if the chapter is available.
+    """
+    try:
+        available = chapter.fetch()
+        if available and use_db:
+            chapter.mark_downloaded()
+        return available
+    finally:
+        if use_db:
+            db.Session.remove()
+
+
+def interleave_by_host(chapters):
+    """Returns the chapters reordered so that consecutive chapters come from
+    different hosts where possible, keeping the original order of the
+    chapters within each host.
+    """
+    hosts = OrderedDict()
+    for chapter in chapters:
+        hosts.setdefault(urlparse(chapter.url).netloc, []).append(chapter)
+    return [chapter for row in zip_longest(*hosts.values())
+            for chapter in row if chapter is not None]
+
+
 def list_new():
     """Helper method used in multiple cu2 commands to print out the new chapter
     details for each series. Has two possible styles for displaying the
@@ -61,15 +209,36 @@ def print_new_normal(items):
         click.echo(click.wrap_text(series[1], width=width))
 
 
-def series_by_url(url):
+def series_by_url(url, **kwargs):
     """Helper function that iterates through the series scrapers defined in
     cu2.scrapers.__init__ and returns an initialized series object when it
-    matches the URL regex.
+    matches the URL regex. Keyword arguments, such as the validators of the
+    last update, are passed on to the series.
+    """
+    Series = series_class(url)
+    if Series is None:
+        raise exceptions.ScrapingError
+    return Series(url, **kwargs)
+
+
+def series_class(url):
+    """Returns the series scraper class whose URL regex matches the URL, or
+    None if no scraper matches.
     """
     for Series in series_scrapers:
         if re.match(Series.url_re, url):
-            return Series(url)
-    raise exceptions.ScrapingError
+            return Series
+
+def series_updates(url, since=None, **kwargs):
+    """Returns the series with the URL after fetching the chapters that
+    `cu2 update` saves, as BaseSeries.fetch_updates does. Runs in the worker
+    threads of the update, so that the requests for the chapters of the
+    series run concurrently. Keyword arguments are passed on to the series.
+    """
+    series = series_by_url(url, **kwargs)
+    series.fetch_updates(since=since)
+    return series
+
 
 def set_ignored(mark_ignored, alias, chapters):
     """Helper function for `cu2 ignore` and `cu2 unignore` commands, which will
@@ -97,7 +266,7 @@ def set_ignored(mark_ignored, alias, chapters):
     else:
         query = query.filter(db.Chapter.chapter.in_(chapters))
 
-    chapters = [x.to_object() for x in query.all()]
+    chapters = [x.to_record() for x in query.all()]
     for chapter in chapters:
         function = getattr(chapter, method)
         function()
@@ -111,7 +111,7 @@ setup(
         'Programming Language :: Python :: 3.5',
         'Topic :: Internet :: WWW/HTTP'
     ],
-    packages=find_packages(exclude = ['tests*']),
+    packages=find_packages(exclude = ['benchmarks*', 'tests*']),
     install_requires=[
         'alembic',
         'beautifulsoup4',
@@ -122,6 +122,8 @@ setup(
         'jsbeautifier'
     ],
     extras_require={
+        'asyncio': ['aiohttp'],
+        'webp': ['Pillow'],
         'testing': ['codecov', 'cov-core', 'nose2', 'pycodestyle']
     },
     entry_points={
@@ -42,6 +42,27 @@ class Cu2Test(unittest.TestCase):
         config.get().write()
         self.runner = CliRunner()
 
+    def start_standin(self, library, **kwargs):
+        """Starts a stand-in server for the library and sends every request
+        of the shared sessions to it until the test has finished. Returns
+        the server.
+        """
+        from cu2 import sessions
+        from tests import standin
+
+        server = standin.StandInServer(library, **kwargs)
+        server.start()
+        adapter = sessions.LimitedAdapter
+        sessions.close()
+        standin.reroute(server.address)
+
+        def stop():
+            sessions.close()
+            sessions.LimitedAdapter = adapter
+            server.stop()
+        self.addCleanup(stop)
+        return server
+
     def __del__(self):
         if hasattr(self, "directory"):
             self.directory.cleanup()
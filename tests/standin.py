@@ -0,0 +1,376 @@
+"""Local stand-ins for the sites that the scrapers talk to, used by the tests
+and the benchmarks. A single HTTP server answers for every host, dispatching
+on the Host header, so the process under test only needs to send its
+requests to the server instead of the real hosts.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse, urlunparse
+import datetime
+import hashlib
+import json
+import random
+import threading
+import time
+
+CHUNK_SIZE = 16 * 1024
+DYNASTY_HOST = 'dynasty-scans.com'
+MANGADEX_API_HOST = 'api.mangadex.org'
+MANGADEX_IMAGE_HOST = 'uploads.mangadex.test'
+MANGADEX_REPORT_HOST = 'api.mangadex.network'
+MANGASEE_HOST = 'mangasee123.com'
+MANGASEE_IMAGE_HOST = 'images.mangasee.test'
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+SITES = ('mangadex', 'mangasee', 'dynasty')
+
+
+class Library(object):
+    """The series served by the stand-ins. Series are spread over the sites
+    in turn and every series starts out with `chapters` chapters of `pages`
+    pages each. Calling `release` adds a chapter to every series, which gives
+    `cu2 update` something to find.
+    """
+
+    def __init__(self, size, chapters=3, pages=4, page_size=32 * 1024):
+        self.size = size
+        self.chapters = chapters
+        self.pages = pages
+        self.page_size = page_size
+        self.released = datetime.datetime(2020, 1, 1,
+                                          tzinfo=datetime.timezone.utc)
+        self._page = (PNG_SIGNATURE +
+                      bytes(random.Random(0).getrandbits(8)
+                            for i in range(max(page_size - 8, 0))))
+
+    def page(self):
+        """Returns the contents of a page."""
+        return self._page
+
+    def release(self):
+        """Adds a new chapter to every series."""
+        self.chapters += 1
+        self.released = datetime.datetime.now(datetime.timezone.utc)
+
+    def indexes(self, site):
+        """Returns the indexes of the series hosted by the site."""
+        return range(SITES.index(site), self.size, len(SITES))
+
+    def site(self, index):
+        """Returns the site which hosts the series with the index."""
+        return SITES[index % len(SITES)]
+
+    def urls(self):
+        """Returns the URLs of all of the series in the library."""
+        urls = []
+        for index in range(self.size):
+            site = self.site(index)
+            if site == 'mangadex':
+                urls.append('https://mangadex.org/title/' + uuid(index))
+            elif site == 'mangasee':
+                urls.append('https://{}/manga/Series-{}'
+                            .format(MANGASEE_HOST, index))
+            else:
+                urls.append('https://{}/series/series_{}'
+                            .format(DYNASTY_HOST, index))
+        return urls
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers the requests of a StandInServer."""
+    protocol_version = 'HTTP/1.1'
+
+    def _dynasty(self, path):
+        library = self.server.library
+        if path.startswith('/system/'):
+            return self._page()
+        if path == '/chapters/added.json':
+            released_on = library.released.date().isoformat()
+            chapters = [{'permalink': 'series_{}_ch{:02}'
+                                      .format(index, library.chapters),
+                         'released_on': released_on,
+                         'tags': [{'type': 'Series',
+                                   'permalink': 'series_{}'.format(index)}]}
+                        for index in library.indexes('dynasty')]
+            return self._json({'chapters': chapters, 'current_page': 1,
+                               'total_pages': 1})
+        if path.startswith('/series/series_') and path.endswith('.json'):
+            index = int(path[len('/series/series_'):-len('.json')])
+            taggings = [{'title': 'Chapter {}'.format(number),
+                         'permalink': 'series_{}_ch{:02}'
+                                      .format(index, number)}
+                        for number in range(1, library.chapters + 1)]
+            return self._json({'name': 'Dynasty Series {}'.format(index),
+                               'taggings': taggings})
+        if path.startswith('/chapters/') and path.endswith('.json'):
+            permalink = path[len('/chapters/'):-len('.json')]
+            pages = [{'url': '/system/releases/{}/{}.png'
+                             .format(permalink, page)}
+                     for page in range(1, library.pages + 1)]
+            return self._json({'title': permalink, 'pages': pages,
+                               'tags': [{'type': 'Scanlator',
+                                         'name': 'Stand-in Scans'}]})
+        return self._error(404)
+
+    def _error(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+
+    def _json(self, data):
+        return self._send(json.dumps(data).encode(), 'application/json')
+
+    def _mangadex(self, path, query):
+        library = self.server.library
+        parts = path.strip('/').split('/')
+        if parts[0] == 'manga' and len(parts) == 2:
+            index = uuid_index(parts[1])
+            return self._json({'result': 'ok', 'data': {
+                'id': parts[1],
+                'attributes': {'title': {'en': 'Mangadex Series {}'
+                                                .format(index)}}
+            }})
+        if parts == ['chapter'] and 'updatedAtSince' in query:
+            since = datetime.datetime.fromisoformat(
+                query['updatedAtSince'][0]
+            ).replace(tzinfo=datetime.timezone.utc)
+            ids = query.get('manga[]', []) if library.released >= since else []
+            data = []
+            for manga_id in ids:
+                chapter = mangadex_chapter(uuid_index(manga_id),
+                                           library.chapters)
+                chapter['relationships'].append({'type': 'manga',
+                                                 'id': manga_id})
+                data.append(chapter)
+            return self._json({'result': 'ok', 'total': len(data),
+                               'data': data})
+        if ((parts[0] == 'chapter' and len(parts) == 1) or
+                (parts[0] == 'manga' and parts[2:] == ['feed'])):
+            if parts[0] == 'manga':
+                index = uuid_index(parts[1])
+            else:
+                index = uuid_index(query['manga'][0])
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query.get('limit', ['100'])[0])
+            groups = 'scanlation_group' in query.get('includes[]', [])
+            numbers = range(1, library.chapters + 1)
+            if query.get('order[readableAt]') == ['desc']:
+                numbers = numbers[::-1]
+            numbers = numbers[offset:offset + limit]
+            return self._json({'result': 'ok', 'total': library.chapters,
+                               'data': [mangadex_chapter(index, number,
+                                                         groups)
+                                        for number in numbers]})
+        if parts[0] == 'chapter' and len(parts) == 2:
+            index, number = chapter_uuid_index(parts[1])
+            return self._json({'result': 'ok',
+                               'data': mangadex_chapter(index, number)})
+        if parts[:2] == ['at-home', 'server'] and len(parts) == 3:
+            return self._json({
+                'baseUrl': 'https://' + MANGADEX_IMAGE_HOST,
+                'chapter': {'hash': parts[2].replace('-', ''),
+                            'data': ['{}.png'.format(page) for page in
+                                     range(1, library.pages + 1)]}
+            })
+        if parts[0] == 'group' and len(parts) == 2:
+            return self._json({'result': 'ok', 'data': {
+                'id': parts[1],
+                'attributes': {'name': 'Group {}'.format(parts[1][-4:])}
+            }})
+        return self._error(404)
+
+    def _mangasee(self, path):
+        library = self.server.library
+        if path.startswith('/manga/Series-'):
+            index = int(path[len('/manga/Series-'):])
+            chapters = ','.join(
+                '{{"Chapter":"{}","Type":"Chapter",'
+                '"Date":"2020-01-01 00:00:00"}}'.format(mangasee_code(number))
+                for number in range(library.chapters, 0, -1)
+            )
+            script = ('vm.IndexName = "Series-{}";\n'
+                      'vm.Chapters = [{}];'.format(index, chapters))
+            return self._html('Mangasee Series {} | MangaSee'.format(index),
+                              script)
+        if path.startswith('/read-online/Series-'):
+            name = path[len('/read-online/'):]
+            index = int(name.split('-')[1])
+            number = int(name.split('-chapter-')[1].split('-')[0])
+            script = ('vm.CurChapter = {{"Chapter":"{}","Type":"Chapter",'
+                      '"Page":"{}","Directory":""}};\n'
+                      'vm.CurPathName = "{}";\n'
+                      'vm.IndexName = "Series-{}";'
+                      .format(mangasee_code(number), library.pages,
+                              MANGASEE_IMAGE_HOST, index))
+            return self._html('Chapter {} | MangaSee'.format(number), script)
+        return self._error(404)
+
+    def _html(self, title, script):
+        page = ('<html><head><title>{}</title></head><body>'
+                '<script>{}</script></body></html>'.format(title, script))
+        return self._send(page.encode(), 'text/html')
+
+    def _page(self):
+        return self._send(self.server.library.page(), 'image/png')
+
+    def _send(self, body, content_type):
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        # Responses are counted before they are sent, so that a client which
+        # has received a response always finds it counted.
+        if self.headers.get('If-None-Match') == etag:
+            self.server.count(0)
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.server.count(len(body))
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        bandwidth = self.server.bandwidth
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start:start + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            if bandwidth:
+                time.sleep(len(chunk) / bandwidth)
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        roll = self.server.random()
+        if roll < self.server.error_rate:
+            self.server.count(0)
+            return self._error(500)
+        if roll < self.server.error_rate + self.server.throttle_rate:
+            self.server.count(0)
+            return self._error(429)
+        host = self.headers.get('Host', '').split(':')[0]
+        url = urlparse(self.path)
+        if host == MANGADEX_API_HOST:
+            return self._mangadex(url.path, parse_qs(url.query))
+        if host == MANGASEE_HOST:
+            return self._mangasee(url.path)
+        if host == DYNASTY_HOST:
+            return self._dynasty(url.path)
+        if host in (MANGADEX_IMAGE_HOST, MANGASEE_IMAGE_HOST):
+            return self._page()
+        return self._error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if self.headers.get('Host', '').split(':')[0] == MANGADEX_REPORT_HOST:
+            return self._json({'result': 'ok'})
+        return self._error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Serves the library on a local port in a background thread. Every
+    response is delayed by `latency` seconds and bodies are sent at
+    `bandwidth` bytes per second. A share of `error_rate` requests fail with
+    a server error and a share of `throttle_rate` requests are throttled.
+    """
+    daemon_threads = True
+
+    def __init__(self, library, latency=0, bandwidth=None, error_rate=0,
+                 throttle_rate=0, seed=0):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.latency = latency
+        self.library = library
+        self.throttle_rate = throttle_rate
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self.reset()
+
+    @property
+    def address(self):
+        return '{}:{}'.format(*self.server_address)
+
+    def count(self, size):
+        """Records a response with a body of `size` bytes."""
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def reset(self):
+        """Resets the request and byte counters."""
+        with self._lock:
+            self.bytes = 0
+            self.requests = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def chapter_uuid_index(chapter_id):
+    """Returns the series index and the chapter number of a chapter UUID."""
+    return int(chapter_id[:8]), int(chapter_id[-12:])
+
+
+def mangadex_chapter(index, number, groups=False):
+    """Returns the API data of a Mangadex chapter, with the attributes of
+    the scanlation group included if `groups` is set.
+    """
+    group = {'type': 'scanlation_group',
+             'id': uuid(index % 7, prefix='ffffffff')}
+    if groups:
+        group['attributes'] = {'name': 'Group {}'.format(group['id'][-4:])}
+    return {
+        'id': '{:08}-0000-0000-0000-{:012}'.format(index, number),
+        'attributes': {'chapter': str(number), 'title': '',
+                       'updatedAt': '2020-01-01T00:00:00+00:00'},
+        'relationships': [group]
+    }
+
+
+def mangasee_code(number):
+    """Returns the Mangasee chapter code of a chapter number."""
+    return '1{:04}0'.format(number)
+
+
+def reroute(address):
+    """Makes the sessions of cu2.sessions send their requests to the stand-in
+    server at `address`. The requests keep their original Host header, and
+    the host limiters still see the original hosts.
+    """
+    from cu2 import sessions
+    from requests.adapters import HTTPAdapter
+
+    class ReroutedAdapter(HTTPAdapter):
+        def send(self, request, *args, **kwargs):
+            url = urlparse(request.url)
+            request = request.copy()
+            request.headers['Host'] = url.netloc
+            request.url = urlunparse(url._replace(scheme='http',
+                                                  netloc=address))
+            return super().send(request, *args, **kwargs)
+
+    class StandInAdapter(sessions.LimitedAdapter, ReroutedAdapter):
+        pass
+
+    sessions.LimitedAdapter = StandInAdapter
+
+
+def uuid(index, prefix='00000000'):
+    """Returns the UUID of the series with the index."""
+    return '{}-0000-0000-0000-{:012}'.format(prefix, index)
+
+
+def uuid_index(value):
+    """Returns the index of a series UUID."""
+    return int(value[-12:])
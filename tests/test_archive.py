@@ -0,0 +1,117 @@
+from cu2 import exceptions
+import tests.cu2test as cu2test
+import io
+import os
+import zipfile
+
+
+class TestArchive(cu2test.Cu2Test):
+    def setUp(self):
+        super().setUp()
+        global archive
+        from cu2 import archive
+        self.filename = os.path.join(self.directory.name, 'chapter.zip')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_archive_page_order(self):
+        NAMES = ['img000000.jpg', 'img000001.png', 'img000002.jpg']
+
+        with archive.ChapterArchive(self.filename, 3) as a:
+            a.add(2, '.jpg', io.BytesIO(b'2'))
+            a.add(1, '.png', io.BytesIO(b'1'))
+            self.assertFalse(os.path.isfile(self.filename))
+            a.add(0, '.jpg', io.BytesIO(b'0'))
+        self.assertEqual(sorted(os.listdir(self.directory.name)),
+                         ['chapter.zip', 'config.json'])
+        with zipfile.ZipFile(self.filename) as z:
+            self.assertEqual(z.namelist(), NAMES)
+            for i, name in enumerate(NAMES):
+                self.assertEqual(z.read(name), str(i).encode())
+
+    def test_archive_same_filename(self):
+        first = archive.ChapterArchive(self.filename, 1)
+        second = archive.ChapterArchive(self.filename, 1)
+        self.assertNotEqual(first.partial_filename, second.partial_filename)
+        first.add(0, '.jpg', io.BytesIO(b'first'))
+        second.add(0, '.jpg', io.BytesIO(b'second'))
+        second.close()
+        first.close()
+        filename = os.path.join(self.directory.name, 'chapter-2.zip')
+        self.assertEqual(second.filename, self.filename)
+        self.assertEqual(first.filename, filename)
+        self.assertEqual(sorted(os.listdir(self.directory.name)),
+                         ['chapter-2.zip', 'chapter.zip', 'config.json'])
+        with zipfile.ZipFile(self.filename) as z:
+            self.assertEqual(z.read('img000000.jpg'), b'second')
+        with zipfile.ZipFile(filename) as z:
+            self.assertEqual(z.read('img000000.jpg'), b'first')
+
+    def test_archive_skip(self):
+        NAMES = ['img000000.jpg', 'img000001.jpg']
+
+        with archive.ChapterArchive(self.filename, 3) as a:
+            a.add(2, '.jpg', io.BytesIO(b'2'))
+            a.skip(1)
+            a.add(0, '.jpg', io.BytesIO(b'0'))
+        with zipfile.ZipFile(self.filename) as z:
+            self.assertEqual(z.namelist(), NAMES)
+            self.assertEqual(z.read(NAMES[1]), b'2')
+
+    def test_archive_missing_page(self):
+        with self.assertRaises(exceptions.ScrapingError):
+            with archive.ChapterArchive(self.filename, 2) as a:
+                a.add(1, '.jpg', io.BytesIO(b'1'))
+        self.assertEqual(os.listdir(self.directory.name), ['config.json'])
+
+    def test_archive_abort(self):
+        with self.assertRaises(ValueError):
+            with archive.ChapterArchive(self.filename, 2) as a:
+                a.add(0, '.jpg', io.BytesIO(b'0'))
+                raise ValueError
+        a.add(1, '.jpg', io.BytesIO(b'1'))
+        self.assertEqual(os.listdir(self.directory.name), ['config.json'])
+
+    def test_archive_journal_resume(self):
+        NAMES = ['img000000.jpg', 'img000001.png', 'img000002.jpg']
+        journal = archive.journal_path('https://example.com/chapter/1')
+
+        with self.assertRaises(exceptions.ScrapingError):
+            with archive.ChapterArchive(self.filename, 3, journal) as a:
+                a.add(0, '.jpg', io.BytesIO(b'0'))
+                a.add(2, '.jpg', io.BytesIO(b'2'))
+        self.assertTrue(os.path.isfile(journal))
+        self.assertFalse(os.path.isfile(self.filename))
+
+        with archive.ChapterArchive(self.filename, 3, journal) as a:
+            self.assertEqual(a.resumed, frozenset([0, 2]))
+            a.add(1, '.png', io.BytesIO(b'1'))
+        self.assertFalse(os.path.isfile(journal))
+        with zipfile.ZipFile(self.filename) as z:
+            self.assertEqual(z.namelist(), NAMES)
+            for i, name in enumerate(NAMES):
+                self.assertEqual(z.read(name), str(i).encode())
+
+    def test_archive_journal_length_mismatch(self):
+        journal = archive.journal_path('https://example.com/chapter/1')
+
+        with self.assertRaises(exceptions.ScrapingError):
+            with archive.ChapterArchive(self.filename, 3, journal) as a:
+                a.add(0, '.jpg', io.BytesIO(b'0'))
+        with archive.ChapterArchive(self.filename, 1, journal) as a:
+            self.assertEqual(a.resumed, frozenset())
+            a.add(0, '.jpg', io.BytesIO(b'new'))
+        self.assertFalse(os.path.isfile(journal))
+        with zipfile.ZipFile(self.filename) as z:
+            self.assertEqual(z.read('img000000.jpg'), b'new')
+
+    def test_archive_journal_expiry(self):
+        journal = archive.journal_path('https://example.com/chapter/1')
+
+        with self.assertRaises(exceptions.ScrapingError):
+            with archive.ChapterArchive(self.filename, 2, journal) as a:
+                a.add(0, '.jpg', io.BytesIO(b'0'))
+        os.utime(journal, (0, 0))
+        archive.expire_journals()
+        self.assertFalse(os.path.isfile(journal))
@@ -0,0 +1,50 @@
+from unittest import mock
+import tests.cu2test as cu2test
+
+
+class TestChapterRecord(cu2test.Cu2CLITest):
+    def setUp(self):
+        super().setUp()
+        series = mock.MagicMock(alias='test-series', directory=None,
+                                url='https://dynasty-scans.com/series/test')
+        series.name = 'Test Series'
+        self.series = self.db.Series(series)
+        self.db.session.add(self.series)
+        for number, host in (('2', 'dynasty-scans.com'),
+                             ('10', 'dynasty-scans.com'),
+                             ('1', 'example.com')):
+            chapter = mock.MagicMock(api_id=None, chapter=number,
+                                     groups=['Test'], title=None,
+                                     url='https://{}/chapters/test_ch{}'
+                                         .format(host, number))
+            self.db.session.add(self.db.Chapter(chapter, self.series))
+        self.db.session.commit()
+
+    def test_find_new(self):
+        chapters = self.db.Chapter.find_new()
+        self.assertEqual([x.chapter for x in chapters], ['2', '10'])
+        for chapter in chapters:
+            self.assertIsInstance(chapter, self.db.ChapterRecord)
+            self.assertEqual(chapter.alias, 'test-series')
+            self.assertEqual(chapter.groups, ['Test'])
+            self.assertEqual(chapter.name, 'Test Series')
+
+    def test_mark_downloaded(self):
+        chapter = self.db.Chapter.find_new()[0]
+        chapter.mark_downloaded()
+        self.assertEqual([x.chapter for x in self.db.Chapter.find_new()],
+                         ['10'])
+
+    def test_to_object(self):
+        from cu2.scrapers.dynastyscans import DynastyScansChapter
+
+        chapter = self.db.Chapter.find_new()[0].to_object()
+        self.assertIsInstance(chapter, DynastyScansChapter)
+        self.assertEqual(chapter.alias, 'test-series')
+        self.assertEqual(chapter.chapter, '2')
+        self.assertEqual(chapter.groups, ['Test'])
+
+    def test_to_object_unsupported(self):
+        chapter = (self.db.session.query(self.db.Chapter)
+                   .filter_by(chapter='1').one())
+        self.assertIsNone(chapter.to_object())
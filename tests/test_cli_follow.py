@@ -0,0 +1,46 @@
+from tests import standin
+import tests.cu2test as cu2test
+
+
+class TestCLIFollow(cu2test.Cu2CLITest):
+    def setUp(self):
+        super().setUp()
+        self.library = standin.Library(3, chapters=2, pages=1)
+        self.server = self.start_standin(self.library)
+
+    def test_follow(self):
+        result = self.invoke('follow', *self.library.urls())
+        self.assertEqual(result.exit_code, 0)
+        follows = self.db.session.query(self.db.Series).all()
+        self.assertEqual(sorted(x.url for x in follows),
+                         sorted(self.library.urls()))
+        for follow in follows:
+            self.assertIn('Adding follow for {}'.format(follow.name),
+                          result.output)
+            self.assertTrue(follow.following)
+            self.assertEqual([x.downloaded for x in follow.chapters], [0, 0])
+
+    def test_follow_ignore(self):
+        url = self.library.urls()[0]
+        result = self.invoke('follow', '--ignore', url)
+        self.assertEqual(result.exit_code, 0)
+        follow = self.db.session.query(self.db.Series).one()
+        self.assertEqual(follow.url, url)
+        self.assertEqual([x.downloaded for x in follow.chapters], [-1, -1])
+
+    def test_follow_invalid_url(self):
+        result = self.invoke('follow', 'https://example.com/series/1')
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Scraping error', result.output)
+        self.assertEqual(self.db.session.query(self.db.Series).count(), 0)
+
+    def test_follow_ignore_download(self):
+        self.assertEqual(self.invoke('follow', self.library.urls()[0])
+                         .exit_code, 0)
+        self.db.QueuedDownload.enqueue_new()
+        result = self.invoke('follow', '--ignore', '--download',
+                             self.library.urls()[1])
+        self.assertEqual(result.exit_code, 0)
+        self.assertNotIn('Downloading', result.output)
+        self.assertEqual(self.db.session.query(self.db.QueuedDownload)
+                         .filter_by(state='queued').count(), 2)
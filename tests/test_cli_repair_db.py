@@ -1,4 +1,5 @@
 from cu2 import sanity
+from sqlalchemy import inspect
 import tests.cu2test as cu2test
 import os
 
@@ -19,3 +20,5 @@ class TestCLIRepairDB(cu2test.Cu2CLITest):
         sanity_tester = sanity.DatabaseSanity(self.db.Base, self.db.engine)
         sanity_tester.test()
         self.assertTrue(sanity_tester.is_sane)
+        indexes = inspect(self.db.engine).get_indexes('series')
+        self.assertIn(['next_check_at'], [x['column_names'] for x in indexes])
@@ -0,0 +1,77 @@
+from cu2 import exceptions
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import tests.cu2test as cu2test
+import threading
+
+
+class SeriesHandler(BaseHTTPRequestHandler):
+    """Serves a series page with validators, answering 304 to requests that
+    send the current ETag.
+    """
+    etag = '"v1"'
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = b'{"name": "Test Series"}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.send_header('Last-Modified', 'Mon, 01 Jan 2024 00:00:00 GMT')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConditionalGet(cu2test.Cu2CLITest):
+    def setUp(self):
+        super().setUp()
+        from cu2.scrapers.base import BaseSeries
+
+        class TestSeries(BaseSeries):
+            name = 'Test Series'
+
+            def __init__(self, url, **kwargs):
+                super().__init__(url, **kwargs)
+                self.json = self.conditional_get(url).json()
+                self.chapters = self.get_chapters()
+
+            def get_chapters(self):
+                return []
+
+        self.TestSeries = TestSeries
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SeriesHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/series/test'.format(
+            self.server.server_port
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_changed(self):
+        series = self.TestSeries(self.url, etag='"v0"')
+        self.assertEqual(series.json, {'name': 'Test Series'})
+        self.assertEqual(series.etag, '"v1"')
+        self.assertEqual(series.last_modified,
+                         'Mon, 01 Jan 2024 00:00:00 GMT')
+
+    def test_not_modified(self):
+        with self.assertRaises(exceptions.NotModified):
+            self.TestSeries(self.url, etag='"v1"')
+
+    def test_update_stores_validators(self):
+        series = self.TestSeries(self.url)
+        self.db.session.add(self.db.Series(series))
+        self.db.session.commit()
+        series.update()
+        s = self.db.session.query(self.db.Series).one()
+        self.assertEqual(s.etag, '"v1"')
+        self.assertEqual(s.last_modified, 'Mon, 01 Jan 2024 00:00:00 GMT')
+        self.assertIsNotNone(s.last_updated)
@@ -0,0 +1,82 @@
+from unittest import mock
+import os
+import sqlite3
+import threading
+import tests.cu2test as cu2test
+
+
+class TestDatabase(cu2test.Cu2CLITest):
+    def setUp(self):
+        super().setUp()
+        global config, scrapers, utility
+        from cu2 import config, scrapers, utility
+
+    def chapters(self, count):
+        series = mock.MagicMock(alias='test-series', directory=None,
+                                url='https://dynasty-scans.com/series/test')
+        series.name = 'Test Series'
+        series = self.db.Series(series)
+        self.db.session.add(series)
+        self.db.session.commit()
+        chapters = [mock.MagicMock(alias='test-series', api_id=None,
+                                   chapter=str(number), groups=[],
+                                   title=None,
+                                   url='https://dynasty-scans.com/chapters/'
+                                       'test_ch{}'.format(number))
+                    for number in range(1, count + 1)]
+        self.db.Chapter.save_all(series, chapters)
+        return chapters
+
+    def test_backup_database(self):
+        self.chapters(3)
+        self.db.backup_database()
+        backup = os.path.join(config.cu2_dir, 'cu2.db.bak')
+        connection = sqlite3.connect(backup)
+        try:
+            count = connection.execute('SELECT count(*) FROM chapters')
+            self.assertEqual(count.fetchone()[0], 3)
+        finally:
+            connection.close()
+
+    def test_download_chapters(self):
+        config.get().chapter_threads = 3
+        chapters = self.chapters(5)
+        threads = set()
+
+        def fetch():
+            threads.add(threading.get_ident())
+            return True
+
+        for chapter in chapters:
+            chapter.fetch = fetch
+            chapter.mark_downloaded = mock.MagicMock(
+                side_effect=lambda c=chapter:
+                scrapers.base.BaseChapter.mark_downloaded(c)
+            )
+        self.assertEqual(utility.download_chapters(chapters), {})
+        self.assertNotIn(threading.get_ident(), threads)
+        downloaded = [x.downloaded for x in
+                      self.db.session.query(self.db.Chapter)]
+        self.assertEqual(downloaded, [1] * 5)
+
+    def test_pragmas(self):
+        with self.db.engine.connect() as connection:
+            def pragma(name):
+                return (connection.exec_driver_sql('PRAGMA {}'.format(name))
+                        .scalar())
+            self.assertEqual(pragma('journal_mode'), 'wal')
+            self.assertEqual(pragma('synchronous'), 1)
+            self.assertEqual(pragma('cache_size'), -16384)
+
+    def test_sessions(self):
+        sessions = []
+
+        def worker():
+            sessions.append(self.db.session())
+            self.db.Session.remove()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertIsNot(sessions[0], self.db.session())
+        self.assertIs(self.db.session(), self.db.session())
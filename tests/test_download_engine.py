@@ -0,0 +1,88 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import tests.cu2test as cu2test
+import threading
+import time
+import unittest
+import zipfile
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Serves the path of each request as the page, or 404 for pages whose
+    name starts with 'missing'. Pages whose name starts with 'slow' are
+    answered after half a second.
+    """
+
+    def do_GET(self):
+        if self.path.startswith('/slow'):
+            time.sleep(0.5)
+        if self.path.startswith('/missing'):
+            self.send_error(404)
+            return
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloadEngine(cu2test.Cu2Test):
+    def setUp(self):
+        super().setUp()
+        global config, dynastyscans
+        from cu2 import config
+        from cu2.scrapers import dynastyscans
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def download(self, engine, paths):
+        config.get().download_engine = engine
+        chapter = dynastyscans.DynastyScansChapter(
+            name='Test', alias='test', chapter='1', groups=['Test'],
+            url='https://dynasty-scans.com/chapters/test'
+        )
+        chapter.page_missing_status = 404
+        chapter.quiet = True
+        filename = chapter.filename
+        url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        chapter.download_pages([url + path for path in paths])
+        with zipfile.ZipFile(filename) as z:
+            return [(name, z.read(name)) for name in z.namelist()]
+
+    def check_engine(self, engine):
+        PATHS = ['/{}.png'.format(i) for i in range(20)]
+        PATHS.insert(5, '/missing.png')
+        PAGES = [('img{:0>6}.png'.format(i), '/{}.png'.format(i).encode())
+                 for i in range(20)]
+
+        self.assertEqual(self.download(engine, PATHS), PAGES)
+
+    def test_download_engine_threads(self):
+        self.check_engine('threads')
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+    def test_download_engine_asyncio(self):
+        self.check_engine('asyncio')
+
+    def test_download_engine_threads_concurrent_requests(self):
+        PATHS = ['/slow{}.png'.format(i) for i in range(8)]
+
+        start = time.time()
+        pages = self.download('threads', PATHS)
+        self.assertEqual([data for name, data in pages],
+                         [path.encode() for path in PATHS])
+        # Opening the eight requests one after another takes four seconds.
+        self.assertLess(time.time() - start, 3)
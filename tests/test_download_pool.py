@@ -0,0 +1,59 @@
+from unittest import mock
+import tests.cu2test as cu2test
+import threading
+
+
+class TestDownloadPool(cu2test.Cu2Test):
+    def setUp(self):
+        super().setUp()
+        global base, utility
+        from cu2 import utility
+        from cu2.scrapers import base
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_interleave_by_host(self):
+        URLS = ['https://mangadex.org/chapter/1',
+                'https://mangadex.org/chapter/2',
+                'https://mangadex.org/chapter/3',
+                'https://dynasty-scans.com/chapters/a',
+                'https://bato.to/title/1-a/2-ch_1']
+        ORDER = ['https://mangadex.org/chapter/1',
+                 'https://dynasty-scans.com/chapters/a',
+                 'https://bato.to/title/1-a/2-ch_1',
+                 'https://mangadex.org/chapter/2',
+                 'https://mangadex.org/chapter/3']
+
+        chapters = [mock.MagicMock(url=url) for url in URLS]
+        result = utility.interleave_by_host(chapters)
+        self.assertEqual([chapter.url for chapter in result], ORDER)
+
+    def test_page_pool_round_robin(self):
+        pool = base.PagePool(1)
+        blocker = threading.Event()
+        started = threading.Event()
+        order = []
+
+        def block():
+            started.set()
+            blocker.wait()
+
+        # Occupy the only worker so that the queue order can be observed.
+        first = pool.submit(block, host='slow.example')
+        started.wait(timeout=5)
+        futures = [pool.submit(order.append, 'slow', host='slow.example')
+                   for _ in range(3)]
+        futures += [pool.submit(order.append, 'fast', host='fast.example')
+                    for _ in range(2)]
+        blocker.set()
+        first.result(timeout=5)
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(order, ['slow', 'fast', 'slow', 'fast', 'slow'])
+
+    def test_page_pool_exception(self):
+        pool = base.PagePool(2)
+        future = pool.submit(int, 'not a number', host='example.com')
+        with self.assertRaises(ValueError):
+            future.result(timeout=5)
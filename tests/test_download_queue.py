@@ -0,0 +1,88 @@
+from cu2 import config
+from unittest import mock
+import tests.cu2test as cu2test
+
+
+class TestDownloadQueue(cu2test.Cu2CLITest):
+    def setUp(self):
+        super().setUp()
+        series = mock.MagicMock(alias='test-series', directory=None,
+                                url='https://dynasty-scans.com/series/test')
+        series.name = 'Test Series'
+        self.series = self.db.Series(series)
+        self.series.following = True
+        self.db.session.add(self.series)
+        for number in ('2', '10', '1'):
+            chapter = mock.MagicMock(api_id=None, chapter=number,
+                                     groups=['Test'], title=None,
+                                     url='https://dynasty-scans.com/chapters/'
+                                         'test_ch{}'.format(number))
+            self.db.session.add(self.db.Chapter(chapter, self.series))
+        self.db.session.commit()
+
+    def test_claim(self):
+        self.assertEqual(self.db.QueuedDownload.enqueue_new(), 3)
+        self.assertEqual(self.db.QueuedDownload.enqueue_new(), 0)
+        entries = self.db.QueuedDownload.claim()
+        self.assertEqual([x.chapter.chapter for x in entries],
+                         ['1', '2', '10'])
+        self.assertTrue(all(x.state == 'running' for x in entries))
+        self.assertEqual(self.db.QueuedDownload.claim(), [])
+
+        self.db.QueuedDownload.recover()
+        self.assertEqual(len(self.db.QueuedDownload.claim()), 3)
+
+    def test_claim_downloaded(self):
+        self.db.QueuedDownload.enqueue_new()
+        chapter = (self.db.session.query(self.db.Chapter)
+                   .filter_by(chapter='2').one())
+        chapter.downloaded = 1
+        self.db.session.commit()
+        entries = self.db.QueuedDownload.claim()
+        self.assertEqual([x.chapter.chapter for x in entries], ['1', '10'])
+        self.assertEqual(self.db.session.query(self.db.QueuedDownload)
+                         .count(), 2)
+
+    def test_claim_no_aliases(self):
+        self.db.QueuedDownload.enqueue_new()
+        self.assertEqual(self.db.QueuedDownload.claim([]), [])
+        self.assertEqual(len(self.db.QueuedDownload.claim()), 3)
+
+    def test_claim_other_alias(self):
+        self.db.QueuedDownload.enqueue_new()
+        self.assertEqual(self.db.QueuedDownload.claim(['other']), [])
+
+    def test_claim_unfollowed(self):
+        self.db.QueuedDownload.enqueue_new()
+        self.series.following = False
+        self.db.session.commit()
+        self.assertEqual(self.db.QueuedDownload.claim(), [])
+        self.assertEqual(self.db.session.query(self.db.QueuedDownload)
+                         .filter_by(state='queued').count(), 3)
+
+    def test_download_queue_empty(self):
+        from cu2 import utility
+
+        with mock.patch.object(utility, 'download_chapters') as download, \
+                mock.patch.object(utility.output, 'chapter') as chapter:
+            utility.download_queue()
+        download.assert_not_called()
+        chapter.assert_not_called()
+
+    def test_fail(self):
+        config.get().queue_attempts = 2
+        self.db.QueuedDownload.enqueue_new()
+        entry = self.db.QueuedDownload.claim()[0]
+        entry.fail('scraping error')
+        self.assertEqual(entry.state, 'queued')
+        entry.fail('scraping error')
+        self.assertEqual(entry.state, 'failed')
+        self.assertEqual(entry.last_error, 'scraping error')
+        self.db.session.commit()
+        self.db.QueuedDownload.recover()
+        self.assertEqual(len(self.db.QueuedDownload.claim()), 2)
+
+        self.db.QueuedDownload.recover()
+        self.db.QueuedDownload.enqueue_new(retry_failed=True)
+        self.assertEqual(len(self.db.QueuedDownload.claim()), 3)
+        self.assertEqual(entry.attempts, 0)
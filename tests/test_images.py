@@ -0,0 +1,82 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import tests.cu2test as cu2test
+import threading
+import unittest
+import zipfile
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class WebPHandler(BaseHTTPRequestHandler):
+    """Serves a small WebP image for every request, or an invalid one for
+    pages whose name starts with 'broken'.
+    """
+
+    def do_GET(self):
+        if self.path.startswith('/broken'):
+            body = b'RIFF'
+        else:
+            image = io.BytesIO()
+            Image.new('RGB', (4, 4), 'red').save(image, 'WEBP')
+            body = image.getvalue()
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/webp')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestImages(cu2test.Cu2Test):
+    def setUp(self):
+        super().setUp()
+        global config, dynastyscans
+        from cu2 import config
+        from cu2.scrapers import dynastyscans
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), WebPHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def download(self, convert, paths):
+        config.get().convert_webp = convert
+        config.get().image_workers = 2
+        chapter = dynastyscans.DynastyScansChapter(
+            name='Test', alias='test', chapter='1', groups=['Test'],
+            url='https://dynasty-scans.com/chapters/test'
+        )
+        chapter.quiet = True
+        filename = chapter.filename
+        url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        chapter.download_pages([url + path for path in paths])
+        with zipfile.ZipFile(filename) as z:
+            return [(name, z.read(name)) for name in z.namelist()]
+
+    def test_convert_webp(self):
+        pages = self.download(True, ['/1', '/2', '/3'])
+        self.assertEqual([name for name, data in pages],
+                         ['img000000.png', 'img000001.png', 'img000002.png'])
+        for name, data in pages:
+            with Image.open(io.BytesIO(data)) as image:
+                self.assertEqual(image.format, 'PNG')
+                self.assertEqual(image.size, (4, 4))
+
+    def test_convert_webp_broken(self):
+        pages = self.download(True, ['/1', '/broken'])
+        self.assertEqual([name for name, data in pages],
+                         ['img000000.png', 'img000001.webp'])
+
+    def test_keep_webp(self):
+        pages = self.download(False, ['/1', '/2'])
+        self.assertEqual([name for name, data in pages],
+                         ['img000000.webp', 'img000001.webp'])
@@ -0,0 +1,58 @@
+from cu2 import exceptions
+from tests import standin
+from unittest import mock
+import tests.cu2test as cu2test
+
+
+class TestMangadexFeed(cu2test.Cu2CLITest):
+    def setUp(self):
+        super().setUp()
+        global mangadex_v5, utility
+        from cu2 import utility
+        from cu2.scrapers import mangadex_v5
+        self.library = standin.Library(1, chapters=1200)
+        self.server = self.start_standin(self.library)
+
+    def test_feed(self):
+        series = mangadex_v5.MangadexV5Series(self.library.urls()[0])
+        self.assertEqual(len(series.chapters), 1200)
+        self.assertEqual(series.chapters[-1].chapter, '1200')
+        self.assertEqual(series.chapters[0].groups, ['Group 0000'])
+        # The series, and three pages of the feed without group requests.
+        self.assertEqual(self.server.requests, 4)
+
+    def test_feed_error(self):
+        series = mangadex_v5.MangadexV5Series(self.library.urls()[0])
+        with mock.patch.object(mangadex_v5, '_decode_json',
+                               return_value=None), \
+                self.assertRaises(exceptions.ScrapingError):
+            series.fetch_updates()
+
+    def test_update(self):
+        url = self.library.urls()[0]
+        follow = self.db.Series(mangadex_v5.MangadexV5Series(url))
+        self.db.session.add(follow)
+        self.db.session.commit()
+        mangadex_v5.MangadexV5Series(url).update()
+        self.assertEqual(len(follow.chapters), 1200)
+        self.assertEqual(follow.watermark, 'https://mangadex.org/chapter/'
+                         '00000000-0000-0000-0000-000000001200')
+        self.library.release()
+        self.server.reset()
+        mangadex_v5.MangadexV5Series(url).update()
+        self.assertEqual(len(follow.chapters), 1201)
+        # The series and the first page of the feed.
+        self.assertEqual(self.server.requests, 2)
+
+    def test_update_fetched(self):
+        url = self.library.urls()[0]
+        self.db.session.add(self.db.Series(mangadex_v5.MangadexV5Series(url)))
+        self.db.session.commit()
+        series = utility.series_updates(url)
+        self.assertEqual(len(series.updates), 1200)
+        self.server.reset()
+        series.update()
+        # The chapters were fetched before the update saved them.
+        self.assertEqual(self.server.requests, 0)
+        follow = self.db.session.query(self.db.Series).one()
+        self.assertEqual(len(follow.chapters), 1200)
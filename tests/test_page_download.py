@@ -0,0 +1,129 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import tests.cu2test as cu2test
+import threading
+import unittest
+import zipfile
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+PAGE = bytes(range(256)) * 400
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Serves PAGE, cutting the connection off in the middle of the first
+    response. Range requests are honoured if the server supports them.
+    """
+    supports_ranges = True
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('Range'))
+        start = 0
+        if self.supports_ranges and self.headers.get('Range'):
+            start = int(self.headers['Range'][6:-1])
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'
+                             .format(start, len(PAGE) - 1, len(PAGE)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(PAGE) - start))
+        if self.supports_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if len(self.server.requests) == 1:
+            self.wfile.write(PAGE[:len(PAGE) // 3])
+            self.close_connection = True
+        else:
+            self.wfile.write(PAGE[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+class NoRangePageHandler(PageHandler):
+    supports_ranges = False
+
+
+class TestPageDownload(cu2test.Cu2Test):
+    def setUp(self):
+        super().setUp()
+        global aio, config, dynastyscans
+        from cu2 import aio, config
+        from cu2.scrapers import dynastyscans
+
+    def tearDown(self):
+        aio.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def chapter(self, handler):
+        self.server = HTTPServer(('127.0.0.1', 0), handler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:{}/page.png'.format(self.server.server_port)
+        chapter = dynastyscans.DynastyScansChapter(
+            name='Test', alias='test', chapter='1', groups=['Test'],
+            url='https://dynasty-scans.com/chapters/test'
+        )
+        return chapter, url
+
+    def download_chapter(self, engine, handler):
+        """Downloads a chapter of a single page with the download engine
+        and returns the page in the chapter archive.
+        """
+        config.get().download_engine = engine
+        chapter, url = self.chapter(handler)
+        chapter.quiet = True
+        filename = chapter.filename
+        chapter.download_pages([url])
+        with zipfile.ZipFile(filename) as z:
+            return z.read(z.namelist()[0])
+
+    def download_page(self, handler):
+        chapter, url = self.chapter(handler)
+        r = chapter.req_session.get(url, stream=True)
+        index, ext, f = chapter.page_download_task(0, r, page_url=url)
+        f.seek(0)
+        return ext, f.read()
+
+    def test_page_download_range_resume(self):
+        ext, data = self.download_page(PageHandler)
+        self.assertEqual(ext, '.png')
+        self.assertEqual(data, PAGE)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertIsNone(self.server.requests[0])
+        self.assertRegex(self.server.requests[1], r'^bytes=[1-9][0-9]*-$')
+
+    def test_page_download_restart(self):
+        ext, data = self.download_page(NoRangePageHandler)
+        self.assertEqual(data, PAGE)
+        self.assertEqual(self.server.requests, [None, None])
+
+    def check_engine_resume(self, engine):
+        self.assertEqual(self.download_chapter(engine, PageHandler), PAGE)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertIsNone(self.server.requests[0])
+        self.assertRegex(self.server.requests[1], r'^bytes=[1-9][0-9]*-$')
+
+    def check_engine_restart(self, engine):
+        self.assertEqual(self.download_chapter(engine, NoRangePageHandler),
+                         PAGE)
+        self.assertEqual(self.server.requests, [None, None])
+
+    def test_page_download_threads_resume(self):
+        self.check_engine_resume('threads')
+
+    def test_page_download_threads_restart(self):
+        self.check_engine_restart('threads')
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+    def test_page_download_asyncio_resume(self):
+        self.check_engine_resume('asyncio')
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+    def test_page_download_asyncio_restart(self):
+        self.check_engine_restart('asyncio')
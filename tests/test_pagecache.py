@@ -0,0 +1,99 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import tests.cu2test as cu2test
+import io
+import os
+import threading
+import time
+import zipfile
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests += 1
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPageCache(cu2test.Cu2Test):
+    def setUp(self):
+        super().setUp()
+        global config, pagecache
+        from cu2 import config, pagecache
+        config.get().page_cache = True
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pagecache_corrupted(self):
+        pagecache.store('https://example.com/1.png', '.png',
+                        io.BytesIO(b'page'))
+        ext, f = pagecache.load('https://example.com/1.png')
+        path = f.name
+        f.close()
+        with open(path, 'wb') as f:
+            f.write(b'broken')
+
+        self.assertIsNone(pagecache.load('https://example.com/1.png'))
+        self.assertFalse(os.path.exists(path))
+
+    def test_pagecache_evict(self):
+        config.get().page_cache_size = 1
+        for i in range(3):
+            page = io.BytesIO(bytes([i]) * 400 * 1024)
+            pagecache.store('https://example.com/{}.png'.format(i), '.png',
+                            page)
+            ext, f = pagecache.load('https://example.com/{}.png'.format(i))
+            f.close()
+            os.utime(f.name, (time.time() + i, time.time() + i))
+
+        pagecache.evict()
+        self.assertIsNone(pagecache.load('https://example.com/0.png'))
+        for i in (1, 2):
+            ext, f = pagecache.load('https://example.com/{}.png'.format(i))
+            self.assertEqual(f.read(), bytes([i]) * 400 * 1024)
+            f.close()
+
+    def test_pagecache_roundtrip(self):
+        pagecache.store('https://example.com/1.png', '.png',
+                        io.BytesIO(b'page'))
+        pagecache.store('https://example.com/2.png', '.png',
+                        io.BytesIO(b'page'))
+
+        ext, f = pagecache.load('https://example.com/2.png')
+        self.assertEqual(ext, '.png')
+        self.assertEqual(f.read(), b'page')
+        f.close()
+        self.assertIsNone(pagecache.load('https://example.com/3.png'))
+
+    def test_pagecache_download(self):
+        from cu2.scrapers import dynastyscans
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+        server.requests = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:{}'.format(server.server_port)
+        pages = ['{}/{}.png'.format(url, i) for i in range(5)]
+        archives = []
+        try:
+            for i in range(2):
+                chapter = dynastyscans.DynastyScansChapter(
+                    name='Test', alias='test', chapter='1', groups=['Test'],
+                    url='https://dynasty-scans.com/chapters/test'
+                )
+                chapter.quiet = True
+                filename = chapter.filename
+                chapter.download_pages(pages)
+                with zipfile.ZipFile(filename) as z:
+                    archives.append([z.read(name) for name in z.namelist()])
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(server.requests, 5)
+        self.assertEqual(archives[0], archives[1])
@@ -0,0 +1,85 @@
+from tests import standin
+import tests.cu2test as cu2test
+
+
+def fail(text, parser):
+    raise ValueError(text)
+
+
+class TestParsing(cu2test.Cu2Test):
+    def setUp(self):
+        super().setUp()
+        global base, config, exceptions, mangasee, parsing
+        from cu2 import config, exceptions, parsing
+        from cu2.scrapers import base, mangasee
+        self.library = standin.Library(2, chapters=5)
+        self.server = self.start_standin(self.library)
+        self.url = self.library.urls()[1]
+
+    def tearDown(self):
+        parsing.close()
+        super().tearDown()
+
+    def chapters(self, series):
+        return [(x.chapter, x.url, x.title, x.name, x.alias)
+                for x in series.chapters]
+
+    def test_chapter_variables(self):
+        series = mangasee.MangaseeSeries(self.url)
+        chapter = series.chapters[0]
+        variables = mangasee._mangasee_variables(chapter._page_soup())
+        self.assertEqual(variables['vm.CurChapter']['Page'],
+                         str(self.library.pages))
+        self.assertEqual(variables['vm.IndexName'], 'Series-1')
+        self.assertTrue(chapter.available())
+
+    def test_html_parser(self):
+        self.assertIn(base.html_parser(), ('html.parser', 'lxml'))
+        config.get().html_parser = 'html.parser'
+        self.assertEqual(base.html_parser(), 'html.parser')
+
+    def test_make_soup(self):
+        soup = base.make_soup('<html><head><title>Title</title></head>'
+                              '<body><p>Text</p><script>vm.A = 1;</script>'
+                              '</body></html>',
+                              parse_only=['title', 'script'])
+        self.assertEqual(soup.find('title').text, 'Title')
+        self.assertIsNone(soup.find('p'))
+        self.assertEqual(len(soup.find_all('script')), 1)
+
+    def test_processes(self):
+        inline = mangasee.MangaseeSeries(self.url)
+        self.assertIsNone(parsing._pool)
+        config.get().parse_processes = True
+        config.get().parse_workers = 1
+        series = mangasee.MangaseeSeries(self.url)
+        self.assertIsNotNone(parsing._pool)
+        self.assertEqual(series.name, 'Mangasee Series 1')
+        self.assertEqual(self.chapters(series), self.chapters(inline))
+        self.assertEqual(len(series.chapters), 5)
+
+    def test_processes_context(self):
+        # Forking the threads of the process could deadlock the children.
+        self.assertNotEqual(parsing.mp_context().get_start_method(), 'fork')
+
+    def test_processes_error(self):
+        config.get().parse_processes = True
+        config.get().parse_workers = 1
+        with self.assertRaises(ValueError):
+            parsing.run(fail, 'page', 'html.parser')
+        with self.assertRaises(exceptions.ScrapingError):
+            parsing.run(base.parse_page, mangasee.MangaseeSeries,
+                        '<html></html>', 'html.parser')
+
+    def test_script_variables(self):
+        script = ('\n  vm.IndexName = "Series-1";\n'
+                  'vm.Chapters = [{"Chapter":"100010","Page":"12"}];\n'
+                  'vm.Raw = function() { return 1; };\n'
+                  'other = 1;\n')
+        variables = base.script_variables(script)
+        self.assertEqual(variables['vm.IndexName'], 'Series-1')
+        self.assertEqual(variables['vm.Chapters'],
+                         [{'Chapter': '100010', 'Page': '12'}])
+        self.assertEqual(variables['vm.Raw'], 'function() { return 1; }')
+        self.assertNotIn('other', variables)
+        self.assertIs(base.script_variables(script), variables)
@@ -0,0 +1,88 @@
+from cu2 import predict
+from unittest import mock
+import datetime
+import tests.cu2test as cu2test
+
+DAY = datetime.timedelta(days=1)
+HOUR = datetime.timedelta(hours=1)
+# A Monday.
+START = datetime.datetime(2024, 1, 1, 12)
+
+
+def weekly(weeks, chapters=1):
+    """Returns the release dates of a series releasing on Mondays with a few
+    hours of jitter.
+    """
+    return [START + week * 7 * DAY + (week % 3) * HOUR + chapter * HOUR / 60
+            for week in range(weeks) for chapter in range(chapters)]
+
+
+class TestPredict(cu2test.Cu2Test):
+    def test_batches(self):
+        predictor = predict.PatternPredictor()
+        self.assertEqual(predictor.batches(weekly(4, chapters=5)),
+                         weekly(4))
+
+    def test_evaluate(self):
+        release_dates = weekly(20, chapters=2)
+        always, delays = predict.evaluate(predict.AlwaysPredictor(),
+                                          release_dates, HOUR)
+        self.assertEqual(len(delays), len(release_dates) - 4)
+        self.assertTrue(all(x <= HOUR for x in delays))
+        checks, delays = predict.evaluate(predict.PatternPredictor(),
+                                          release_dates, HOUR)
+        self.assertLess(checks, always / 10)
+        self.assertLess(max(delays), DAY)
+
+    def test_get(self):
+        self.assertIsInstance(predict.get('pattern'),
+                              predict.PatternPredictor)
+        self.assertIsInstance(predict.get('unknown'),
+                              predict.IntervalPredictor)
+
+    def test_pattern(self):
+        predictor = predict.PatternPredictor()
+        release_dates = weekly(10)
+        now = release_dates[-1] + HOUR
+        next_check = predictor.predict(release_dates, now)
+        self.assertEqual(next_check.weekday(), 6)
+        self.assertLess(next_check - release_dates[-1], 7 * DAY)
+        self.assertGreater(next_check - release_dates[-1], 5 * DAY)
+        # Overdue releases are checked with growing gaps.
+        now = release_dates[-1] + 8 * DAY
+        self.assertGreater(predictor.predict(release_dates, now), now + HOUR)
+        now = release_dates[-1] + 10 * DAY
+        self.assertGreater(predictor.predict(release_dates, now), now + DAY)
+        self.assertIsNone(predictor.predict(weekly(1, chapters=5), now))
+
+    def test_weighted_median(self):
+        self.assertEqual(predict.weighted_median([(1, 1), (2, 1), (9, 1)]),
+                         2)
+        self.assertEqual(predict.weighted_median([(1, 0.1), (2, 0.1),
+                                                  (9, 1)]), 9)
+
+
+class TestCLIEvaluatePredictors(cu2test.Cu2CLITest):
+    def test_evaluate_predictors(self):
+        series = mock.MagicMock(alias='test-series', directory=None,
+                                url='https://dynasty-scans.com/series/test')
+        series.name = 'Test Series'
+        series = self.db.Series(series)
+        self.db.session.add(series)
+        for number, release_date in enumerate(weekly(12)):
+            chapter = mock.MagicMock(api_id=None, chapter=str(number),
+                                     groups=[], title=None,
+                                     url='https://dynasty-scans.com/'
+                                         'chapters/test_ch{}'.format(number))
+            chapter = self.db.Chapter(chapter, series)
+            chapter.added_on = release_date
+            self.db.session.add(chapter)
+        self.db.session.commit()
+
+        result = self.invoke('evaluate-predictors', '--predictor', 'pattern',
+                             '--predictor', 'always')
+        self.assertEqual(result.exit_code, 0)
+        lines = result.output.splitlines()
+        self.assertEqual([x.split()[0] for x in lines],
+                         ['predictor', 'always', 'pattern'])
+        self.assertEqual(lines[1].split()[2], '0.0%')
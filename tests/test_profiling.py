@@ -0,0 +1,63 @@
+from bs4 import BeautifulSoup
+from unittest import mock
+import json
+import os
+import tests.cu2test as cu2test
+
+
+class TestProfiling(cu2test.Cu2CLITest):
+    def setUp(self):
+        super().setUp()
+        global profiling
+        from cu2 import profiling
+        self.output = os.path.join(self.directory.name, 'profile.json')
+        profiling.enable(output=self.output)
+
+    def tearDown(self):
+        profiling.disable()
+        super().tearDown()
+
+    def test_database(self):
+        series = mock.MagicMock(alias='test-series', directory=None,
+                                url='https://dynasty-scans.com/series/test')
+        series.name = 'Test Series'
+        with profiling.series('test-series'):
+            self.db.session.add(self.db.Series(series))
+            self.db.session.commit()
+        phases = profiling.data()['phases']
+        self.assertEqual(phases['db commit']['count'], 1)
+        self.assertGreaterEqual(phases['db query']['count'], 1)
+        self.assertIn('db commit', profiling.data()['series']['test-series'])
+
+    def test_disabled(self):
+        profiling.disable()
+        with profiling.phase('http', host='example.com'):
+            pass
+        BeautifulSoup('<p></p>', 'html.parser')
+        self.assertEqual(profiling.data()['phases'], {})
+
+    def test_parse(self):
+        BeautifulSoup('<p></p>', 'html.parser')
+        self.assertEqual(profiling.data()['phases']['parse']['count'], 1)
+
+    def test_phase(self):
+        with profiling.series('test-series'):
+            with profiling.phase('http', host='example.com'):
+                pass
+            profiling.call_in_series('other-series', profiling.record,
+                                     'page write', 0.5, 0.25)
+        data = profiling.data()
+        self.assertEqual(data['phases']['http']['count'], 1)
+        self.assertEqual(data['phases']['page write'],
+                         {'count': 1, 'wall': 0.5, 'cpu': 0.25})
+        self.assertEqual(list(data['hosts']['example.com']), ['http'])
+        self.assertEqual(list(data['series']['test-series']), ['http'])
+        self.assertEqual(list(data['series']['other-series']),
+                         ['page write'])
+
+    def test_report(self):
+        with profiling.phase('archive'):
+            pass
+        profiling.report()
+        with open(self.output) as f:
+            self.assertEqual(json.load(f)['phases']['archive']['count'], 1)
@@ -0,0 +1,49 @@
+from tests import standin
+from unittest import mock
+import datetime
+import tests.cu2test as cu2test
+
+
+class TestRecentUpdates(cu2test.Cu2CLITest):
+    def setUp(self):
+        super().setUp()
+        global exceptions, utility
+        from cu2 import exceptions, utility
+        self.library = standin.Library(6, chapters=2, pages=1)
+        self.server = self.start_standin(self.library)
+        self.follows = []
+        for url in self.library.urls():
+            follow = self.db.Series(utility.series_by_url(url))
+            follow.last_updated = datetime.datetime.now()
+            self.db.session.add(follow)
+            self.follows.append(follow)
+        self.db.session.commit()
+
+    def sites(self, follows):
+        return [self.library.site(self.follows.index(x)) for x in follows]
+
+    def test_changed(self):
+        self.library.release()
+        self.server.reset()
+        self.assertEqual(utility.changed_series(self.follows), self.follows)
+        # A single request for the Mangadex and Dynasty series each.
+        self.assertEqual(self.server.requests, 2)
+
+    def test_never_updated(self):
+        self.follows[0].last_updated = None
+        changed = utility.changed_series(self.follows)
+        self.assertEqual(changed, [self.follows[0], self.follows[1],
+                                   self.follows[4]])
+
+    def test_probe_error(self):
+        from cu2.scrapers.mangadex_v5 import MangadexV5Series
+        with mock.patch.object(MangadexV5Series, 'recent_updates',
+                               side_effect=exceptions.ScrapingError):
+            changed = utility.changed_series(self.follows)
+        self.assertEqual(self.sites(changed), ['mangadex', 'mangasee',
+                                               'mangadex', 'mangasee'])
+
+    def test_unchanged(self):
+        changed = utility.changed_series(self.follows)
+        # Mangasee has no listing of recent updates.
+        self.assertEqual(self.sites(changed), ['mangasee', 'mangasee'])
@@ -0,0 +1,82 @@
+from unittest import mock
+import tests.cu2test as cu2test
+
+
+class TestSaveChapters(cu2test.Cu2CLITest):
+    def setUp(self):
+        super().setUp()
+        series = mock.MagicMock(alias='test-series', directory=None,
+                                url='https://dynasty-scans.com/series/test')
+        series.name = 'Test Series'
+        self.series = self.db.Series(series)
+        self.db.session.add(self.series)
+        self.db.session.commit()
+
+    def chapter(self, number, groups=['Test']):
+        return mock.MagicMock(api_id=None, chapter=number, groups=groups,
+                              title=None,
+                              url='https://dynasty-scans.com/chapters/'
+                                  'test_ch{}'.format(number))
+
+    def test_save_all(self):
+        chapters = [self.chapter('1'), self.chapter('2', ['Test', 'Other']),
+                    self.chapter('2')]
+        self.assertEqual(self.db.Chapter.save_all(self.series, chapters), 2)
+        self.assertEqual(sorted(x.name for x in
+                                self.db.session.query(self.db.Group)),
+                         ['Other', 'Test'])
+        self.assertEqual([x.chapter for x in self.db.Chapter.find_new()],
+                         ['1', '2'])
+        self.assertEqual(self.db.Chapter.find_new()[1].groups,
+                         ['Test', 'Other'])
+
+        chapters.append(self.chapter('3', ['New']))
+        self.assertEqual(self.db.Chapter.save_all(self.series, chapters), 1)
+        self.assertEqual(self.db.Chapter.save_all(self.series, chapters), 0)
+        self.assertEqual(self.db.session.query(self.db.Chapter).count(), 3)
+        self.assertEqual(self.db.session.query(self.db.Group).count(), 3)
+
+    def test_save_all_ignore(self):
+        self.db.Chapter.save_all(self.series, [self.chapter('1')],
+                                 ignore=True)
+        chapter = self.db.session.query(self.db.Chapter).one()
+        self.assertEqual(chapter.downloaded, -1)
+
+    def test_save_all_other_series(self):
+        series = mock.MagicMock(alias='other-series', directory=None,
+                                url='https://dynasty-scans.com/series/other')
+        series.name = 'Other Series'
+        other = self.db.Series(series)
+        self.db.session.add(other)
+        self.db.Chapter.save_all(other, [self.chapter('1')])
+        self.assertEqual(self.db.Chapter.save_all(self.series,
+                                                  [self.chapter('1'),
+                                                   self.chapter('2')]), 1)
+        chapter = (self.db.session.query(self.db.Chapter)
+                   .filter_by(chapter='1').one())
+        self.assertEqual(chapter.series, other)
+
+    def test_group_resolve(self):
+        groups = self.db.Group.resolve(['Test', 'Other', 'Test'])
+        self.assertEqual(sorted(groups), ['Other', 'Test'])
+        self.assertIs(self.db.Group.resolve(['Test'])['Test'],
+                      groups['Test'])
+        self.db.session.commit()
+        self.assertEqual(self.db.session.query(self.db.Group).count(), 2)
+
+    def test_group_resolve_rollback(self):
+        self.db.Group.resolve(['Test'])
+        self.db.session.rollback()
+        self.assertEqual(self.db.session.query(self.db.Group).count(), 0)
+        group = self.db.Group.resolve(['Test'])['Test']
+        self.db.session.commit()
+        self.assertEqual(self.db.session.query(self.db.Group).one(), group)
+
+    def test_single_save_resolves_groups(self):
+        self.db.Chapter.save_all(self.series, [self.chapter('1')])
+        chapter = self.db.Chapter(self.chapter('2', ['Test', 'Other']),
+                                  self.series)
+        self.db.session.add(chapter)
+        self.db.session.commit()
+        self.assertEqual([x.name for x in chapter.groups], ['Test', 'Other'])
+        self.assertEqual(self.db.session.query(self.db.Group).count(), 2)
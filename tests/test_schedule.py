@@ -0,0 +1,106 @@
+from cu2 import config
+from unittest import mock
+import datetime
+import tests.cu2test as cu2test
+
+
+class TestSchedule(cu2test.Cu2CLITest):
+    def series(self, number, next_check_at=None, last_updated=None):
+        series = mock.MagicMock(alias='test-series-{}'.format(number),
+                                directory=None,
+                                url='https://dynasty-scans.com/series/'
+                                    'test_{}'.format(number))
+        series.name = 'Test Series {}'.format(number)
+        series = self.db.Series(series)
+        series.next_check_at = next_check_at
+        series.last_updated = last_updated
+        self.db.session.add(series)
+        self.db.session.commit()
+        return series
+
+    def test_due(self):
+        now = datetime.datetime.now()
+        hour = datetime.timedelta(hours=1)
+        past = self.series(1, next_check_at=now - hour)
+        self.series(2, next_check_at=now + hour)
+        never = self.series(3)
+        checked = self.series(4, next_check_at=now - hour, last_updated=now)
+        self.assertEqual(set(self.db.Series.due()), {past, never, checked})
+        self.assertEqual(set(self.db.Series.due(hour)), {past, never})
+        checked.following = False
+        self.assertEqual(set(self.db.Series.due()), {past, never})
+
+    def test_schedule(self):
+        series = self.series(1)
+        chapters = [mock.MagicMock(api_id=None, chapter=str(number),
+                                   groups=[], title=None,
+                                   url='https://dynasty-scans.com/chapters/'
+                                       'test_ch{}'.format(number))
+                    for number in range(1, 4)]
+        self.db.Chapter.save_all(series, chapters)
+        series.schedule()
+        self.assertIsNotNone(series.next_check_at)
+
+        now = datetime.datetime.now()
+        for days, chapter in zip((30, 20, 5), series.chapters):
+            chapter.added_on = now - datetime.timedelta(days=days)
+        series.schedule()
+        expected = series.last_added + series.release_interval
+        self.assertLess(abs(series.next_check_at - expected),
+                        datetime.timedelta(seconds=1))
+        self.assertFalse(series.needs_update)
+
+
+class TestUpdateSchedule(cu2test.Cu2CLITest):
+    def setUp(self):
+        super().setUp()
+        from tests import standin
+        self.library = standin.Library(3, chapters=3, pages=1)
+        self.server = self.start_standin(self.library)
+        config.get().release_predictor = 'pattern'
+        config.get().write()
+        self.assertEqual(self.invoke('follow', *self.library.urls())
+                         .exit_code, 0)
+        self.assertEqual(self.invoke('update').exit_code, 0)
+
+    def overdue(self, url):
+        """Gives the series weekly releases, the last of which is overdue,
+        and returns the time at which the series is checked again.
+        """
+        series = (self.db.session.query(self.db.Series)
+                  .filter_by(url=url).one())
+        now = datetime.datetime.now()
+        for weeks, chapter in zip((5, 4, 3), series.chapters):
+            chapter.added_on = now - datetime.timedelta(weeks=weeks)
+        series.next_check_at = now - datetime.timedelta(days=1)
+        self.db.session.commit()
+        return now
+
+    def next_check_at(self, url):
+        return (self.db.session.query(self.db.Series.next_check_at)
+                .filter_by(url=url).scalar())
+
+    def test_not_modified(self):
+        url = self.library.urls()[1]
+        now = self.overdue(url)
+        self.server.reset()
+        result = self.invoke('update', '--no-probe')
+        self.assertEqual(result.exit_code, 0)
+        self.assertGreater(self.next_check_at(url), now)
+
+    def test_probe_skipped(self):
+        url = self.library.urls()[2]
+        now = self.overdue(url)
+        result = self.invoke('update')
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('skipped', result.output)
+        self.assertGreater(self.next_check_at(url), now)
+
+    def test_update_schedules_once(self):
+        from cu2.scrapers import dynastyscans
+
+        url = self.library.urls()[2]
+        with mock.patch.object(self.db.Series, 'schedule',
+                               autospec=True) as schedule:
+            dynastyscans.DynastyScansSeries(url).update()
+        self.assertEqual(schedule.call_count, 1)
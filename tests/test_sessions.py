@@ -0,0 +1,100 @@
+from cu2 import config
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import tests.cu2test as cu2test
+import threading
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """Answers the first request with 429 and the rest with 200."""
+
+    def do_GET(self):
+        self.server.requests += 1
+        if self.server.requests == 1:
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSessions(cu2test.Cu2Test):
+    def setUp(self):
+        super().setUp()
+        global sessions
+        from cu2 import sessions
+        sessions.close()
+
+    def tearDown(self):
+        sessions.close()
+        self.directory.cleanup()
+
+    def test_pool_size(self):
+        config.get().connection_pool_size = 4
+
+        session = sessions.get('https://mangadex.org/title/1')
+        adapter = session.get_adapter('https://mangadex.org/title/1')
+        self.assertEqual(adapter._pool_connections, 4)
+        self.assertEqual(adapter._pool_maxsize, 4)
+
+    def test_shared_by_host(self):
+        first = sessions.get('https://mangadex.org/title/1')
+        second = sessions.get('https://mangadex.org/chapter/2')
+        other = sessions.get('https://dynasty-scans.com/series/a')
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+    def test_shared_by_scrapers(self):
+        from cu2.scrapers.dynastyscans import DynastyScansChapter
+
+        URL = 'https://dynasty-scans.com/chapters/a'
+        first = DynastyScansChapter(name='a', url=URL, groups=['Test'])
+        second = DynastyScansChapter(name='a', url=URL, groups=['Test'])
+        self.assertIs(first.req_session, second.req_session)
+        self.assertIs(first.req_session, sessions.get(URL))
+
+    def test_limiter_aimd(self):
+        limiter = sessions.HostLimiter(concurrency=4)
+        for i in range(4):
+            self.assertEqual(limiter.try_acquire(), 0)
+        self.assertGreater(limiter.try_acquire(), 0)
+
+        limiter.release(429, retry_after=0)
+        self.assertEqual(limiter.window, 2)
+        limiter.release(200)
+        limiter.release(200)
+        limiter.release(200)
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertGreater(limiter.window, 3)
+        self.assertLessEqual(limiter.window, 4)
+
+    def test_limiter_pause(self):
+        limiter = sessions.HostLimiter()
+        limiter.try_acquire()
+        limiter.release(503, retry_after=30)
+        self.assertGreater(limiter.try_acquire(), 29)
+
+    def test_limiter_rate(self):
+        limiter = sessions.HostLimiter(rate=10, burst=2)
+        self.assertEqual(limiter.try_acquire(), 0)
+        self.assertEqual(limiter.try_acquire(), 0)
+        self.assertGreater(limiter.try_acquire(), 0)
+
+    def test_throttled_request(self):
+        server = HTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+        server.requests = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:{}/'.format(server.server_port)
+        try:
+            r = sessions.get(url).get(url)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(server.requests, 2)
+        limiter = sessions.limiter('127.0.0.1:{}'.format(server.server_port))
+        self.assertEqual(limiter.failures, 0)
+        self.assertEqual(limiter.in_flight, 0)